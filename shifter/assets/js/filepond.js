@@ -1,6 +1,5 @@
 import * as FilePond from "filepond";
 import FilePondPluginFileValidateSize from "filepond-plugin-file-validate-size";
-import JSZip from "jszip";
 import "filepond/dist/filepond.min.css";
 
 FilePond.registerPlugin(FilePondPluginFileValidateSize);
@@ -82,41 +81,58 @@ function showErrorBox(message) {
   alerts.setError(message);
 }
 
-function combineFiles(pond) {
-  let files = pond.getFiles();
+function appendExpiryFields(formData, expiryDatetimeElementName) {
+  // Check if expiry is enabled
+  let enableExpiryCheckbox = document.querySelector(
+    'input[name="enable_expiry"]',
+  );
 
-  // If there are no files, do nothing
-  if (files.length === 0) {
-    return Promise.reject("Select at least one file to upload");
+  // If checkbox is a visible checkbox, check if it's checked
+  // If it's hidden (type="hidden"), the value will be "on" by default
+  let enableExpiry = true;
+  if (enableExpiryCheckbox) {
+    if (enableExpiryCheckbox.type === "checkbox") {
+      enableExpiry = enableExpiryCheckbox.checked;
+    } else if (enableExpiryCheckbox.type === "hidden") {
+      // Hidden input means expiry is required (setting is disabled)
+      enableExpiry = true;
+    }
   }
 
-  // If there is more than one file, zip them into one file
-  if (files.length > 1) {
-    console.debug("Combining files");
+  if (enableExpiry) {
+    // Only add expiry_datetime if checkbox is checked or hidden (required)
+    let expiryFormField = document.querySelector(
+      'input[name="' + expiryDatetimeElementName + '"]',
+    );
+    if (expiryFormField && expiryFormField.value) {
+      let expiryDateTime = new Date(expiryFormField.value);
+      formData.append("expiry_datetime", expiryDateTime.toISOString());
+    }
+  }
+  // If not enabled, don't send expiry_datetime (will be NULL in DB)
 
-    const zip = new JSZip();
-    const promises = [];
-    files.forEach((file) => {
-      const promise = new Promise((resolve, reject) => {
-        zip.file(file.filename, file.file, { binary: true });
-        resolve();
-      });
-      promises.push(promise);
-    });
+  // Add enable_expiry field
+  formData.append("enable_expiry", enableExpiry ? "on" : "");
+}
 
-    return Promise.all(promises).then(async () => {
-      await pond.removeFiles();
-      let blob = await zip.generateAsync({ type: "blob" });
-      let zipFileNameFormElement = document.getElementById("zip-file-name");
-      let zipFileName = zipFileNameFormElement.value;
-      await pond.addFile(
-        new File([blob], zipFileName + ".zip", { type: "application/zip" }),
-      );
-    });
+function formatErrors(errors) {
+  let errorMsg = "";
+  for (const [key, value] of Object.entries(errors)) {
+    errorMsg += value + "<br>";
   }
+  return errorMsg;
+}
 
-  // If there is only one file, do nothing
-  return Promise.resolve();
+async function startBundle(bundleUrl, csrfToken) {
+  const response = await fetch(bundleUrl, {
+    method: "POST",
+    headers: { "X-CSRFToken": csrfToken },
+  });
+  if (!response.ok) {
+    throw new Error("Could not start upload");
+  }
+  const rObj = await response.json();
+  return rObj.bundle_hex;
 }
 
 function handleFilesChanged(pond) {
@@ -133,8 +149,18 @@ export function setupFilepond(
   expiryDatetimeElementName,
   max_file_size,
   upload_timeout,
+  chunk_size,
+  upload_url,
+  bundle_url,
 ) {
   const inputElement = document.getElementsByName(filepondElementName)[0];
+  const csrfToken = document.querySelector(
+    'input[name="csrfmiddlewaretoken"]',
+  ).value;
+  // Set when the chunked upload is started, used once all chunks are sent
+  let redirectUrl = null;
+  // Set when several files are uploaded together as a bundle
+  let bundleHex = null;
 
   const pond = FilePond.create(inputElement, {
     name: filepondElementName,
@@ -143,72 +169,58 @@ export function setupFilepond(
     allowProcess: false,
     allowRevert: false,
     credits: false,
+    // Upload in chunks so large uploads are made up of short requests, and
+    // failed chunks are retried rather than restarting the whole upload.
+    chunkUploads: true,
+    chunkForce: true,
+    chunkSize: chunk_size,
+    chunkRetryDelays: [500, 1000, 3000, 5000],
+    maxParallelUploads: 3,
     server: {
       process: {
-        url: "./",
+        url: upload_url,
         method: "POST",
         withCredentials: false,
         headers: {
-          "X-CSRFToken": document.querySelector(
-            'input[name="csrfmiddlewaretoken"]',
-          ).value,
+          "X-CSRFToken": csrfToken,
         },
         timeout: upload_timeout * 1000,
         ondata: (formData) => {
-          // Check if expiry is enabled
-          let enableExpiryCheckbox = document.querySelector(
-            'input[name="enable_expiry"]',
-          );
-
-          // If checkbox is a visible checkbox, check if it's checked
-          // If it's hidden (type="hidden"), the value will be "on" by default
-          let enableExpiry = true;
-          if (enableExpiryCheckbox) {
-            if (enableExpiryCheckbox.type === "checkbox") {
-              enableExpiry = enableExpiryCheckbox.checked;
-            } else if (enableExpiryCheckbox.type === "hidden") {
-              // Hidden input means expiry is required (setting is disabled)
-              enableExpiry = true;
-            }
-          }
-
-          if (enableExpiry) {
-            // Only add expiry_datetime if checkbox is checked or hidden (required)
-            let expiryFormField = document.querySelector(
-              'input[name="' + expiryDatetimeElementName + '"]',
-            );
-            if (expiryFormField && expiryFormField.value) {
-              let expiryDateTime = new Date(expiryFormField.value);
-              formData.append("expiry_datetime", expiryDateTime.toISOString());
-            }
-          }
-          // If not enabled, don't send expiry_datetime (will be NULL in DB)
+          appendExpiryFields(formData, expiryDatetimeElementName);
 
           // Add CSRF token
-          formData.append(
-            "csrfmiddlewaretoken",
-            document.querySelector('input[name="csrfmiddlewaretoken"]').value,
-          );
+          formData.append("csrfmiddlewaretoken", csrfToken);
 
-          // Add enable_expiry field
-          formData.append("enable_expiry", enableExpiry ? "on" : "");
+          // Files uploaded together are stored as a bundle, which is zipped
+          // by the server when it is downloaded
+          if (bundleHex) {
+            formData.append("bundle_hex", bundleHex);
+          }
 
           return formData;
         },
-        onload: (response) => {
-          const redirectUrl = JSON.parse(response).redirect_url;
-          window.location.href = redirectUrl;
+        onload: (xhr, method) => {
+          // When resuming, FilePond asks how much has already been received
+          if (method === "HEAD") {
+            return xhr.getResponseHeader("Upload-Offset");
+          }
+          const rObj = JSON.parse(xhr.response);
+          if (rObj.redirect_url) {
+            redirectUrl = rObj.redirect_url;
+          }
+          // FilePond uses the returned ID to send the chunks
+          return rObj.upload_id;
         },
         onerror: (response) => {
           console.error(response);
           const rObj = JSON.parse(response);
-          let errorMsg = "";
-          for (const [key, value] of Object.entries(rObj.errors)) {
-            errorMsg += value + "<br>";
-          }
+          const errorMsg = formatErrors(rObj.errors);
           if (rObj.errors?.expiry_datetime) {
             lastErrorSource = "expiry";
-          } else if (rObj.errors?.file_content) {
+          } else if (
+            rObj.errors?.file_content ||
+            rObj.errors?.upload_length
+          ) {
             lastErrorSource = "file";
           } else {
             lastErrorSource = "server";
@@ -216,6 +228,14 @@ export function setupFilepond(
           showErrorBox(errorMsg);
         },
       },
+      patch: {
+        url: upload_url + "/",
+        withCredentials: false,
+        headers: {
+          "X-CSRFToken": csrfToken,
+        },
+        timeout: upload_timeout * 1000,
+      },
       fetch: null,
       revert: null,
     },
@@ -267,18 +287,44 @@ export function setupFilepond(
     });
   }
 
-  uploadButton.addEventListener("click", () => {
-    combineFiles(pond)
-      .then(() => {
-        console.debug("Uploading file");
-        showInfoBox("Stay on this page until upload is finished.");
-        uploadButton.disabled = true;
-        pond.processFiles();
-      })
-      .catch((error) => {
-        console.error(error);
-        showErrorBox("Error during upload.");
-      });
+  async function completeBundle() {
+    const formData = new FormData();
+    appendExpiryFields(formData, expiryDatetimeElementName);
+    formData.append("name", document.getElementById("zip-file-name").value);
+    const response = await fetch(bundle_url + "/" + bundleHex, {
+      method: "POST",
+      headers: { "X-CSRFToken": csrfToken },
+      body: formData,
+    });
+    const rObj = await response.json();
+    if (!response.ok) {
+      lastErrorSource = rObj.errors?.expiry_datetime ? "expiry" : "server";
+      showErrorBox(formatErrors(rObj.errors));
+      uploadButton.disabled = false;
+      return;
+    }
+    window.location.href = rObj.redirect_url;
+  }
+
+  uploadButton.addEventListener("click", async () => {
+    if (pond.getFiles().length === 0) {
+      showErrorBox("Select at least one file to upload");
+      return;
+    }
+    uploadButton.disabled = true;
+    try {
+      if (pond.getFiles().length > 1 && !bundleHex) {
+        bundleHex = await startBundle(bundle_url, csrfToken);
+      }
+    } catch (error) {
+      console.error(error);
+      showErrorBox("Error during upload.");
+      uploadButton.disabled = false;
+      return;
+    }
+    console.debug("Uploading files");
+    showInfoBox("Stay on this page until upload is finished.");
+    pond.processFiles();
   });
 
   pond.on("addfile", (error) => {
@@ -303,6 +349,29 @@ export function setupFilepond(
     updateUploadButtonState();
   });
 
+  pond.on("processfile", (error) => {
+    if (error) {
+      lastErrorSource = "server";
+      showErrorBox("Upload failed. Press upload to try again.");
+      uploadButton.disabled = false;
+      return;
+    }
+    if (redirectUrl && !bundleHex) {
+      window.location.href = redirectUrl;
+    }
+  });
+
+  pond.on("processfiles", () => {
+    // Called once every file has been uploaded
+    if (bundleHex) {
+      completeBundle().catch((error) => {
+        console.error(error);
+        showErrorBox("Error during upload.");
+        uploadButton.disabled = false;
+      });
+    }
+  });
+
   pond.on("removefile", () => {
     if (pond.getFiles().length === 0) {
       hasValidationError = false;
@@ -329,14 +398,31 @@ function autoInitFilepond() {
     return;
   }
 
-  const { fileField, expiryField, maxSize, uploadTimeout } = host.dataset;
-  if (!fileField || !expiryField || !maxSize) {
+  const {
+    fileField,
+    expiryField,
+    maxSize,
+    uploadTimeout,
+    chunkSize,
+    uploadUrl,
+    bundleUrl,
+  } = host.dataset;
+  if (!fileField || !expiryField || !maxSize || !uploadUrl || !bundleUrl) {
     console.warn("Filepond init skipped: missing data attributes.");
     return;
   }
 
   const timeout = uploadTimeout ? Number(uploadTimeout) : 300;
-  setupFilepond(fileField, expiryField, maxSize, timeout);
+  const chunk = chunkSize ? Number(chunkSize) : 10 * 1024 * 1024;
+  setupFilepond(
+    fileField,
+    expiryField,
+    maxSize,
+    timeout,
+    chunk,
+    uploadUrl,
+    bundleUrl,
+  );
 }
 
 if (document.readyState === "loading") {
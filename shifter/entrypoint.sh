@@ -30,6 +30,15 @@ then
     python manage.py flush --no-input  
 fi
 
+# Metrics from every process are collected in this folder. Clear out the
+# metrics of processes from before the restart.
+if [ "$METRICS_ENABLED" = "1" ]
+then
+    export PROMETHEUS_MULTIPROC_DIR="${PROMETHEUS_MULTIPROC_DIR:-/tmp/shifter-metrics}"
+    rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+    mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+fi
+
 python manage.py migrate --no-input
 
 python manage.py createsettings
@@ -56,4 +65,18 @@ else
     fi
     python manage.py collectstatic --no-input --clear > /dev/null
 fi
+
+if [ "$BACKGROUND_FILE_PROCESSING" = "1" ]
+then
+    echo "Starting file processing worker."
+    # Restarted if it stops, so uploads aren't left waiting for a checksum
+    (
+        while true
+        do
+            python manage.py processfiles
+            echo "File processing worker stopped. Restarting in 5 seconds."
+            sleep 5
+        done
+    ) &
+fi
 exec "$@"
\ No newline at end of file
@@ -0,0 +1,100 @@
+"""
+Gunicorn configuration for Shifter.
+
+Gunicorn loads this file automatically when started from this directory.
+Each setting can be overridden with the environment variables below, or on
+the command line.
+"""
+
+import os
+
+from shifter_files.metricfiles import merge_process_files
+
+WORKER_CLASSES = {
+    "sync": "sync",
+    "gthread": "gthread",
+    "uvicorn": "uvicorn_worker.UvicornWorker",
+}
+
+
+def env_int(name, default):
+    value = os.environ.get(name)
+    if not value:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"{name} must be a whole number.") from None
+
+
+def cpu_count():
+    # Only count the CPUs this process may run on, such as when the container
+    # is limited to some of the host's CPUs.
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+server_interface = (os.environ.get("SERVER_INTERFACE") or "wsgi").lower()
+if server_interface == "asgi":
+    wsgi_app = "shifter.asgi:application"
+    default_worker_class = "uvicorn"
+elif server_interface == "wsgi":
+    wsgi_app = "shifter.wsgi:application"
+    default_worker_class = "gthread"
+else:
+    raise ValueError(
+        f"Invalid SERVER_INTERFACE value: {server_interface}. "
+        + "Must be either wsgi or asgi."
+    )
+
+worker_type = (
+    os.environ.get("GUNICORN_WORKER_CLASS") or default_worker_class
+).lower()
+if worker_type not in WORKER_CLASSES:
+    raise ValueError(
+        f"Invalid GUNICORN_WORKER_CLASS value: {worker_type}. "
+        + "Must be one of sync, gthread or uvicorn."
+    )
+if (worker_type == "uvicorn") != (server_interface == "asgi"):
+    raise ValueError(
+        "GUNICORN_WORKER_CLASS must be uvicorn when SERVER_INTERFACE is "
+        + "asgi, and sync or gthread when it is wsgi."
+    )
+worker_class = WORKER_CLASSES[worker_type]
+
+# A sync worker is busy for the whole of an upload or download, so more of
+# them are needed to keep serving pages while files are transferred. Threads
+# and the event loop let a worker handle several transfers at once, so one
+# or two per CPU keeps the machine busy.
+if worker_type == "sync":
+    default_workers = cpu_count() * 2 + 1
+elif worker_type == "gthread":
+    default_workers = cpu_count() + 1
+else:
+    default_workers = cpu_count()
+workers = env_int("GUNICORN_WORKERS", default_workers)
+threads = env_int("GUNICORN_THREADS", 8 if worker_type == "gthread" else 1)
+
+bind = os.environ.get("GUNICORN_BIND") or "0.0.0.0:8000"
+timeout = env_int("GUNICORN_TIMEOUT", 600)
+keepalive = env_int("GUNICORN_KEEPALIVE", 5)
+
+# Restart workers now and then so memory doesn't build up, staggered so they
+# don't all restart together.
+max_requests = env_int("GUNICORN_MAX_REQUESTS", 1000)
+max_requests_jitter = env_int(
+    "GUNICORN_MAX_REQUESTS_JITTER", max_requests // 10
+)
+
+# Workers touch a heartbeat file in this directory. On a container's
+# overlay filesystem that can block for long enough to time workers out.
+if os.path.isdir("/dev/shm"):
+    worker_tmp_dir = "/dev/shm"
+
+
+def child_exit(server, worker):
+    # Workers which are killed, such as when they time out, can't merge
+    # their own metrics files
+    merge_process_files(worker.pid)
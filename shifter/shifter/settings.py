@@ -35,6 +35,11 @@ DEBUG = int(os.environ.get("DEBUG", default="0"))
 # Admin interface control - defaults to DEBUG value if not explicitly set
 ADMIN_ENABLED = bool(int(os.environ.get("ADMIN_ENABLED", str(int(DEBUG)))))
 
+# Prometheus metrics, served at /metrics. If METRICS_TOKEN is set, scrapes
+# must send it as a bearer token.
+METRICS_ENABLED = bool(int(os.environ.get("METRICS_ENABLED", "0")))
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
 # Also set by the SHIFTER_URL environment variable.
 ALLOWED_HOSTS = []
 if os.environ.get("DJANGO_ALLOWED_HOSTS"):
@@ -90,6 +95,10 @@ MIDDLEWARE = [
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
+# Conditionally count the queries made by each view if metrics are enabled
+if METRICS_ENABLED:
+    MIDDLEWARE.insert(0, "shifter_files.middleware.count_queries")
+
 ROOT_URLCONF = "shifter.urls"
 
 TEMPLATES = [
@@ -159,6 +168,37 @@ STORAGES = {
     },
 }
 
+# Where uploaded files are stored.
+#   filesystem: in MEDIA_ROOT.
+#   s3: in an S3 compatible bucket, so several servers can share them.
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "filesystem").lower()
+if STORAGE_BACKEND == "s3":
+    if not os.environ.get("S3_BUCKET_NAME"):
+        raise ValueError("S3_BUCKET_NAME environment variable not set.")
+    STORAGES["default"] = {
+        "BACKEND": "shifter_files.storages.S3Storage",
+        "OPTIONS": {
+            "bucket_name": os.environ.get("S3_BUCKET_NAME"),
+            # Only needed for services other than AWS
+            "endpoint_url": os.environ.get("S3_ENDPOINT_URL") or None,
+            "region_name": os.environ.get("S3_REGION_NAME") or None,
+            # If not set, credentials are found the usual way for boto3,
+            # such as from an IAM role.
+            "access_key": os.environ.get("S3_ACCESS_KEY_ID") or None,
+            "secret_key": os.environ.get("S3_SECRET_ACCESS_KEY") or None,
+            # How long download links to the bucket work for
+            "querystring_expire": int(
+                os.environ.get("S3_PRESIGNED_URL_EXPIRY", "300")
+            ),  # seconds
+            "file_overwrite": False,
+        },
+    }
+elif STORAGE_BACKEND != "filesystem":
+    raise ValueError(
+        "Invalid storage backend specified in environment. "
+        + "Must be either filesystem or s3."
+    )
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -277,6 +317,15 @@ SITE_SETTINGS = {
         "min_value": 0,
         "max_value": 2147483647,
     },
+    "default_storage_quota": {
+        "default": 0,
+        "label": "Default Storage Quota (MB)",
+        "field_type": forms.IntegerField,
+        "min_value": 0,
+        "max_value": 2147483647,
+        "tooltip": "The total size of files each user can store, unless set \
+            for the user on the Manage Users page. 0 means no limit.",
+    },
     "allow_optional_expiry": {
         "default": "False",  # Must be string since DB stores as CharField
         "label": "Allow Optional File Expiry",
@@ -287,6 +336,29 @@ SITE_SETTINGS = {
     },
 }
 
+# How long site settings are cached for. Changes are seen immediately by the
+# process that makes them, and by others after at most this many seconds
+# unless CACHES is configured with a shared backend.
+SITE_SETTINGS_CACHE_TIMEOUT = int(
+    os.environ.get("SITE_SETTINGS_CACHE_TIMEOUT", "60")
+)  # seconds
+
+# How long the file specific part of a download landing page is cached for,
+# so popular links aren't rendered again for every visitor. Pages are never
+# cached past the file's expiry, and edits are seen by other processes after
+# at most this many seconds unless CACHES is configured with a shared
+# backend. 0 disables the cache.
+LANDING_PAGE_CACHE_TIMEOUT = int(
+    os.environ.get("LANDING_PAGE_CACHE_TIMEOUT", "60")
+)  # seconds
+
+# Download counts are kept in memory and written to the database at most
+# this many seconds after a download, rather than on every download. 0 writes
+# each download straight away.
+DOWNLOAD_STATS_FLUSH_INTERVAL = int(
+    os.environ.get("DOWNLOAD_STATS_FLUSH_INTERVAL", "10")
+)  # seconds
+
 DEFAULT_EXPIRY_OFFSET = timedelta(weeks=2)
 
 
@@ -307,6 +379,77 @@ DJANGO_VITE_MANIFEST_PATH = BASE_DIR / "static" / "manifest.json"
 UPLOAD_TIMEOUT = int(os.environ.get("UPLOAD_TIMEOUT", "300"))  # seconds
 GUNICORN_TIMEOUT = int(os.environ.get("GUNICORN_TIMEOUT", "600"))  # seconds
 
+# Size of each request when uploading files in chunks from the browser
+UPLOAD_CHUNK_SIZE = int(
+    os.environ.get("UPLOAD_CHUNK_SIZE", str(10 * 1024 * 1024))
+)  # bytes
+if STORAGE_BACKEND == "s3" and UPLOAD_CHUNK_SIZE < 5 * 1024 * 1024:
+    # Each chunk is sent to the bucket as a part of the file
+    raise ValueError(
+        "UPLOAD_CHUNK_SIZE must be at least 5MB (5242880) when "
+        + "STORAGE_BACKEND is s3."
+    )
+
+# Download backend - how the bytes of downloaded files are sent. Access
+# checks are always done by Django.
+#   django: streamed by Django itself.
+#   x-accel-redirect: handed off to nginx using X-Accel-Redirect.
+#   x-sendfile: handed off to Apache/lighttpd using X-Sendfile.
+#   redirect: redirected to a short lived link to the file in the S3 bucket.
+DOWNLOAD_BACKEND = (
+    os.environ.get("DOWNLOAD_BACKEND")
+    or ("redirect" if STORAGE_BACKEND == "s3" else "django")
+).lower()
+if DOWNLOAD_BACKEND not in [
+    "django",
+    "x-accel-redirect",
+    "x-sendfile",
+    "redirect",
+]:
+    raise ValueError(
+        "Invalid download backend specified in environment. "
+        + "Must be either django, x-accel-redirect, x-sendfile or redirect."
+    )
+if STORAGE_BACKEND == "s3" and DOWNLOAD_BACKEND not in ["django", "redirect"]:
+    raise ValueError(
+        "DOWNLOAD_BACKEND must be either django or redirect when "
+        + "STORAGE_BACKEND is s3."
+    )
+if STORAGE_BACKEND != "s3" and DOWNLOAD_BACKEND == "redirect":
+    raise ValueError(
+        "DOWNLOAD_BACKEND can only be redirect when STORAGE_BACKEND is s3."
+    )
+# The internal nginx location that serves MEDIA_ROOT, for x-accel-redirect
+X_ACCEL_REDIRECT_PREFIX = os.environ.get(
+    "X_ACCEL_REDIRECT_PREFIX", "/protected-media/"
+)
+
+# Algorithm used to calculate the checksum of uploaded files. The algorithm
+# is stored with each checksum, so changing it doesn't affect older files.
+FILE_HASH_ALGORITHM = os.environ.get("FILE_HASH_ALGORITHM", "md5").lower()
+if FILE_HASH_ALGORITHM not in [
+    "md5",
+    "sha1",
+    "sha256",
+    "sha512",
+    "blake2b",
+    "blake2s",
+]:
+    raise ValueError(
+        "Invalid file hash algorithm specified in environment. "
+        + "Must be either md5, sha1, sha256, sha512, blake2b or blake2s."
+    )
+
+# Store identical uploads once, shared by every upload of the same content.
+# The file is only removed from storage once all of them are deleted.
+DEDUPLICATE_UPLOADS = bool(int(os.environ.get("DEDUPLICATE_UPLOADS", "0")))
+
+# Calculate checksums and deduplicate uploads in the processfiles worker once
+# the upload has finished, rather than while the uploader waits.
+BACKGROUND_FILE_PROCESSING = bool(
+    int(os.environ.get("BACKGROUND_FILE_PROCESSING", "0"))
+)
+
 # Environment information
 SHIFTER_VERSION = os.environ.get("APP_VERSION", "Unknown")
 PYTHON_VERSION = os.environ.get("PYTHON_VERSION", "Unknown")
@@ -100,11 +100,17 @@ class UserEditForm(forms.ModelForm):
 
     class Meta:
         model = get_user_model()
-        fields: ClassVar[list[str]] = ["email", "is_staff", "is_active"]
+        fields: ClassVar[list[str]] = [
+            "email",
+            "is_staff",
+            "is_active",
+            "storage_quota",
+        ]
         labels: ClassVar[dict[str, str]] = {
             "email": "Email",
             "is_staff": "Administrator",
             "is_active": "Active",
+            "storage_quota": "Storage Quota (MB)",
         }
 
     def __init__(self, *args, editing_self=False, **kwargs):
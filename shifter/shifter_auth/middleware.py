@@ -1,11 +1,29 @@
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
 from django.shortcuts import redirect
 from django.urls import reverse
 
+from .models import SETUP_COMPLETED_CACHE_KEY, SETUP_COMPLETED_CACHE_TIMEOUT
+
 
 def is_first_time_setup_required():
+    # Once a user exists, setup stays completed until users are deleted, so
+    # the result is cached rather than queried on every request. The cache
+    # is per process by default, so the flag expires for other processes to
+    # see users being deleted.
+    if cache.get(SETUP_COMPLETED_CACHE_KEY):
+        return False
+
     User = get_user_model()
-    return User.objects.count() == 0
+    setup_required = not User.objects.exists()
+
+    # Users created inside a transaction may be rolled back
+    if not setup_required and not connection.in_atomic_block:
+        cache.set(
+            SETUP_COMPLETED_CACHE_KEY, True, SETUP_COMPLETED_CACHE_TIMEOUT
+        )
+    return setup_required
 
 
 def ensure_password_changed(get_response):
@@ -42,8 +60,9 @@ def ensure_first_time_setup_completed(get_response):
     FIRST_TIME_SETUP_URL = "shifter_auth:first-time-setup"
 
     def middleware(request):
-        if is_first_time_setup_required() and request.path != reverse(
-            FIRST_TIME_SETUP_URL
+        if (
+            request.path != reverse(FIRST_TIME_SETUP_URL)
+            and is_first_time_setup_required()
         ):
             return redirect(FIRST_TIME_SETUP_URL)
 
@@ -0,0 +1,46 @@
+# Generated by Django 6.1 on 2026-10-18 18:24
+
+from django.db import migrations, models
+from django.db.models import Sum
+from django.db.models.functions import Coalesce
+
+
+def set_storage_used(apps, schema_editor):
+    """Add up the size of each user's existing files. From then on it is
+    kept up to date as files are uploaded and deleted."""
+    User = apps.get_model('shifter_auth', 'User')
+
+    users = User.objects.annotate(
+        total_file_size=Coalesce(Sum('fileupload__file_size'), 0)
+    ).filter(total_file_size__gt=0)
+    for user in users.iterator():
+        User.objects.filter(pk=user.pk).update(
+            storage_used=user.total_file_size
+        )
+
+
+def reverse_set_storage_used(apps, schema_editor):
+    """Reverse migration - no action needed."""
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shifter_auth', '0001_initial'),
+        ('shifter_files', '0013_fileupload_download_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='storage_quota',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='storage_used',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(set_storage_used, reverse_set_storage_used),
+    ]
@@ -1,7 +1,19 @@
 from typing import ClassVar
 
 from django.contrib.auth.models import AbstractUser, BaseUserManager
-from django.db import models
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models import F, Sum
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_migrate
+from django.dispatch.dispatcher import receiver
+
+from shifter_site_settings.models import SiteSetting
+
+SETUP_COMPLETED_CACHE_KEY = "shifter_first_time_setup_completed"
+# Deleting users only clears the flag in the process that deletes them, so
+# other processes check the user table again after at most this long.
+SETUP_COMPLETED_CACHE_TIMEOUT = 60  # seconds
 
 
 class UserManager(BaseUserManager):
@@ -42,8 +54,60 @@ class User(AbstractUser):
     username = None
     email = models.EmailField("email address", unique=True)
     change_password_on_login = models.BooleanField(default=False)
+    # In MB. Uses the default_storage_quota site setting when not set, and
+    # 0 means no limit.
+    storage_quota = models.PositiveIntegerField(null=True, blank=True)
+    # Total size of the user's files in bytes. Kept up to date as files are
+    # uploaded and deleted, so doesn't need adding up on each upload.
+    storage_used = models.BigIntegerField(default=0)
 
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS: ClassVar[list[str]] = []
 
     objects = UserManager()
+
+    def get_storage_quota(self):
+        """Return the user's storage quota in bytes, or None if they can
+        store any amount."""
+        quota = self.storage_quota
+        if quota is None:
+            quota = int(SiteSetting.get_setting("default_storage_quota"))
+        if quota == 0:
+            return None
+        return quota * 1024 * 1024
+
+    @classmethod
+    def add_storage_used(cls, usage):
+        """Add to the storage used by users, given as a mapping of user
+        primary key to a number of bytes, which is negative for files that
+        have been deleted."""
+        with transaction.atomic():
+            for pk, num_bytes in usage.items():
+                if pk is not None and num_bytes:
+                    cls.objects.filter(pk=pk).update(
+                        storage_used=F("storage_used") + num_bytes
+                    )
+
+    @classmethod
+    def recalculate_storage_used(cls):
+        """Set each user's storage used from the size of their files, in
+        case it has drifted. Returns the number of users corrected."""
+        num_corrected = 0
+        users = cls.objects.annotate(
+            actual_storage_used=Coalesce(Sum("fileupload__file_size"), 0)
+        ).exclude(storage_used=F("actual_storage_used"))
+        for user in users:
+            # Skipped if a file was uploaded or deleted since the total was
+            # added up, as the total is then out of date.
+            num_corrected += cls.objects.filter(
+                pk=user.pk, storage_used=user.storage_used
+            ).update(storage_used=user.actual_storage_used)
+        return num_corrected
+
+
+@receiver(post_delete, sender=User)
+@receiver(post_migrate)
+def reset_setup_completed(sender, **kwargs):
+    """Recheck whether first time setup is required after users are deleted
+    or the database is flushed."""
+    cache.delete(SETUP_COMPLETED_CACHE_KEY)
@@ -1,6 +1,22 @@
+import tempfile
+import time
+from shutil import rmtree
+from unittest import mock
+
+from django.conf import settings
 from django.contrib.auth import get_user, get_user_model
+from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, RequestFactory, TestCase, override_settings
+from django.core.management import call_command
+from django.db import connection
+from django.test import (
+    Client,
+    RequestFactory,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
 
@@ -8,6 +24,10 @@ from shifter_auth.middleware import (
     ensure_first_time_setup_completed,
     is_first_time_setup_required,
 )
+from shifter_auth.models import (
+    SETUP_COMPLETED_CACHE_KEY,
+    SETUP_COMPLETED_CACHE_TIMEOUT,
+)
 from shifter_files.models import FileUpload
 
 TEST_USER_EMAIL = "iama@test.com"
@@ -362,6 +382,19 @@ class UserListViewTest(TestCase):
         self.assertContains(response, TEST_USER_EMAIL)
         self.assertContains(response, TEST_STAFF_USER_EMAIL)
 
+    def test_list_displays_storage_used(self):
+        self.regular_user.storage_used = 5 * 1000 * 1000
+        self.regular_user.storage_quota = 100
+        self.regular_user.save()
+        client = Client()
+        client.login(email=TEST_STAFF_USER_EMAIL, password=TEST_USER_PASSWORD)
+        response = client.get(reverse("shifter_auth:user-list"))
+        self.assertContains(response, "5MB of 104MB")
+        # No quota, so only the storage used is shown
+        self.assertContains(
+            response, '<td class="py-3 hidden lg:table-cell">0B</td>'
+        )
+
     def test_search_users(self):
         client = Client()
         client.login(email=TEST_STAFF_USER_EMAIL, password=TEST_USER_PASSWORD)
@@ -542,6 +575,30 @@ class UserDetailViewTest(TestCase):
         self.regular_user.refresh_from_db()
         self.assertEqual(self.regular_user.email, "newemail@test.com")
 
+    def test_edit_storage_quota(self):
+        client = Client()
+        client.login(email=TEST_STAFF_USER_EMAIL, password=TEST_USER_PASSWORD)
+        url = reverse(
+            "shifter_auth:user-detail", kwargs={"pk": self.regular_user.pk}
+        )
+        data = {"email": TEST_USER_EMAIL, "is_active": True}
+        client.post(url, {**data, "storage_quota": "50"})
+        self.regular_user.refresh_from_db()
+        self.assertEqual(self.regular_user.storage_quota, 50)
+
+        response = client.get(url)
+        self.assertContains(response, "Using 0B of 52MB.")
+
+        # Blank goes back to the site default
+        client.post(url, {**data, "storage_quota": ""})
+        self.regular_user.refresh_from_db()
+        self.assertIsNone(self.regular_user.storage_quota)
+
+        response = client.post(url, {**data, "storage_quota": "-1"})
+        self.assertEqual(response.status_code, 200)
+        self.regular_user.refresh_from_db()
+        self.assertIsNone(self.regular_user.storage_quota)
+
     def test_cannot_remove_own_staff_status(self):
         client = Client()
         client.login(email=TEST_STAFF_USER_EMAIL, password=TEST_USER_PASSWORD)
@@ -855,3 +912,99 @@ class UserResetPasswordViewTest(TestCase):
             )
         )
         self.assertEqual(response.status_code, 405)
+
+
+@override_settings(
+    MEDIA_ROOT=tempfile.mkdtemp(), DOWNLOAD_STATS_FLUSH_INTERVAL=0
+)
+class FirstTimeSetupQueryCountTest(TransactionTestCase):
+    """Checks the number of user table queries made by the first time setup
+    middleware on a public download request."""
+
+    def setUp(self):
+        cache.delete(SETUP_COMPLETED_CACHE_KEY)
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            TEST_USER_EMAIL, TEST_USER_PASSWORD
+        )
+        self.file_upload = FileUpload.objects.create(
+            owner=self.user,
+            file_content=SimpleUploadedFile(
+                TEST_FILE_NAME, TEST_FILE_CONTENT
+            ),
+            upload_datetime=timezone.now(),
+            expiry_datetime=timezone.now() + timezone.timedelta(days=1),
+            filename=TEST_FILE_NAME,
+        )
+        self.url = reverse(
+            "shifter_files:file-download", args=[self.file_upload.file_hex]
+        )
+
+    def tearDown(self):
+        rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+
+    def count_user_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+            response.close()
+        self.assertEqual(response.status_code, 200)
+        return sum(
+            get_user_model()._meta.db_table in query["sql"]
+            for query in queries.captured_queries
+        )
+
+    def test_user_table_queried_until_setup_completed(self):
+        # The first request checks the user table, later ones don't.
+        self.assertEqual(self.count_user_queries(), 1)
+        for _ in range(5):
+            self.assertEqual(self.count_user_queries(), 0)
+
+    def test_fewer_queries_than_counting_users(self):
+        def count_users():
+            # The check made before completion was cached
+            return get_user_model().objects.count() == 0
+
+        with mock.patch(
+            "shifter_auth.middleware.is_first_time_setup_required",
+            count_users,
+        ):
+            before = [self.count_user_queries() for _ in range(6)]
+        after = [self.count_user_queries() for _ in range(6)]
+
+        # One query per request before, and only on the first one after
+        self.assertEqual(before, [1, 1, 1, 1, 1, 1])
+        self.assertEqual(after, [1, 0, 0, 0, 0, 0])
+
+    def test_setup_rechecked_after_users_deleted(self):
+        self.count_user_queries()
+        self.assertFalse(is_first_time_setup_required())
+
+        get_user_model().objects.all().delete()
+        self.assertTrue(is_first_time_setup_required())
+        response = self.client.get(self.url)
+        self.assertRedirects(
+            response,
+            reverse("shifter_auth:first-time-setup"),
+            fetch_redirect_response=False,
+        )
+
+    def test_setup_rechecked_when_flag_expires(self):
+        self.count_user_queries()
+        # Users deleted by another process leave the flag set in this one
+        get_user_model().objects.all().delete()
+        cache.set(
+            SETUP_COMPLETED_CACHE_KEY, True, SETUP_COMPLETED_CACHE_TIMEOUT
+        )
+        self.assertFalse(is_first_time_setup_required())
+
+        expired = time.time() + SETUP_COMPLETED_CACHE_TIMEOUT + 1
+        with mock.patch(
+            "django.core.cache.backends.locmem.time.time",
+            return_value=expired,
+        ):
+            self.assertTrue(is_first_time_setup_required())
+
+    def test_setup_rechecked_after_flush(self):
+        self.count_user_queries()
+        call_command("flush", interactive=False, verbosity=0)
+        self.assertTrue(is_first_time_setup_required())
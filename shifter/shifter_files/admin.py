@@ -1,8 +1,21 @@
 from django.contrib import admin
 
-from .models import FileUpload
+from .models import BundleFile, FileUpload
 
 
 @admin.register(FileUpload)
 class FileUploadAdmin(admin.ModelAdmin):
-    list_display = ("filename", "owner", "upload_datetime", "expiry_datetime")
+    list_display = (
+        "filename",
+        "owner",
+        "upload_datetime",
+        "expiry_datetime",
+        "verify_status",
+    )
+    list_filter = ("verify_status",)
+
+
+@admin.register(BundleFile)
+class BundleFileAdmin(admin.ModelAdmin):
+    list_display = ("filename", "bundle", "owner", "verify_status")
+    list_filter = ("verify_status",)
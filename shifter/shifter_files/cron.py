@@ -1,5 +1,7 @@
-from .models import FileUpload
+from .models import BundleFile, ChunkedUpload, FileUpload
 
 
 def delete_expired_files():
     FileUpload.delete_expired_files()
+    ChunkedUpload.delete_stale_uploads()
+    BundleFile.delete_stale_files()
@@ -0,0 +1,384 @@
+import hashlib
+import mimetypes
+import re
+import uuid
+from urllib.parse import quote
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
+    HttpResponseRedirect,
+    StreamingHttpResponse,
+)
+from django.utils.cache import (
+    add_never_cache_headers,
+    get_conditional_response,
+)
+from django.utils.http import (
+    content_disposition_header,
+    http_date,
+    parse_http_date_safe,
+)
+
+RANGE_RE = re.compile(r"^\s*(\d*)\s*-\s*(\d*)\s*$")
+
+# Requests for more ranges than this are served the whole file, so a single
+# request can't make us seek around the file an unbounded number of times.
+MAX_RANGES = 16
+
+BLOCK_SIZE = 64 * 1024
+
+
+def parse_range_header(header, size):
+    """Parse the value of a Range header for a file of the given size.
+
+    Returns a sorted list of (start, end) tuples, with end inclusive and
+    overlapping or adjacent ranges merged. Returns None if the header should
+    be ignored and the whole file served, or an empty list if none of the
+    ranges can be satisfied.
+    """
+    units, _, ranges_str = header.partition("=")
+    if units.strip().lower() != "bytes" or not ranges_str.strip():
+        return None
+
+    ranges = []
+    for range_str in ranges_str.split(","):
+        if not range_str.strip():
+            continue
+        match = RANGE_RE.match(range_str)
+        if not match:
+            return None
+        first, last = match.groups()
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+            if last and end < start:
+                return None
+        elif last:
+            # Suffix range - the last N bytes of the file
+            if int(last) == 0:
+                continue
+            start = max(size - int(last), 0)
+            end = size - 1
+        else:
+            return None
+
+        if start >= size:
+            continue
+        ranges.append((start, min(end, size - 1)))
+
+    ranges.sort()
+    merged = []
+    for start, end in ranges:
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+
+    if len(merged) > MAX_RANGES:
+        return None
+    return merged
+
+
+def file_etag(file_upload):
+    """Strong ETag for a file's content. Stored files are never modified, so
+    the hash, or failing that the hex, identifies the content."""
+    return f'"{file_upload.file_hash or file_upload.file_hex}"'
+
+
+def if_range_matches(request, etag, last_modified):
+    if_range = request.headers.get("If-Range")
+    if if_range is None:
+        return True
+    if if_range.startswith('"'):
+        return if_range == etag
+    return (
+        last_modified is not None
+        and parse_http_date_safe(if_range) == last_modified
+    )
+
+
+def read_range(file_field, start, end):
+    """Yield the bytes of the file from start to end inclusive."""
+    with file_field.storage.open(file_field.name, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            data = f.read(min(BLOCK_SIZE, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+
+
+async def iterate_in_thread(iterator, thread_sensitive=False):
+    """Async iterator over a blocking iterator, running each step in a thread
+    so reading the file doesn't block the event loop. Steps which use the
+    database need to be thread sensitive."""
+    next_chunk = sync_to_async(next, thread_sensitive=thread_sensitive)
+    try:
+        while (chunk := await next_chunk(iterator, None)) is not None:
+            yield chunk
+    finally:
+        if hasattr(iterator, "close"):
+            iterator.close()
+
+
+def stream_content(request, iterator, thread_sensitive=False):
+    """Streaming content suited to the server the request came through.
+
+    Under ASGI, Django reads a synchronous iterator into memory before
+    sending any of it, so the content is streamed with an async iterator
+    instead."""
+    if isinstance(request, ASGIRequest):
+        return iterate_in_thread(iterator, thread_sensitive)
+    return iterator
+
+
+def multipart_ranges(file_field, ranges, size, content_type, boundary):
+    """Yield the parts of a multipart/byteranges response body."""
+    for start, end in ranges:
+        yield multipart_part_header(start, end, size, content_type, boundary)
+        yield from read_range(file_field, start, end)
+        yield b"\r\n"
+    yield f"--{boundary}--\r\n".encode()
+
+
+def multipart_part_header(start, end, size, content_type, boundary):
+    return (
+        f"--{boundary}\r\n"
+        f"Content-Type: {content_type}\r\n"
+        f"Content-Range: bytes {start}-{end}/{size}\r\n"
+        "\r\n"
+    ).encode()
+
+
+def serve_file(request, file_upload):
+    """Build the response for downloading a FileUpload.
+
+    Supports conditional requests using the file's ETag and upload time, and
+    single or multiple byte ranges so downloads can be resumed.
+    """
+    etag = file_etag(file_upload)
+    last_modified = int(file_upload.upload_datetime.timestamp())
+
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified
+    )
+    if response is None:
+        if file_upload.is_bundle:
+            response = zip_response(
+                request,
+                file_upload.get_zip_stream(),
+                file_upload.filename,
+                etag,
+                last_modified,
+            )
+        elif settings.DOWNLOAD_BACKEND == "x-accel-redirect":
+            response = x_accel_redirect_response(file_upload)
+        elif settings.DOWNLOAD_BACKEND == "x-sendfile":
+            response = x_sendfile_response(file_upload)
+        elif settings.DOWNLOAD_BACKEND == "redirect":
+            response = redirect_response(file_upload)
+        else:
+            response = file_response(
+                request, file_upload, etag, last_modified
+            )
+
+    response["Accept-Ranges"] = "bytes"
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    return response
+
+
+def guess_content_type(file_upload):
+    return (
+        mimetypes.guess_type(file_upload.filename)[0]
+        or "application/octet-stream"
+    )
+
+
+def proxy_response(file_upload, header, value):
+    """Empty response telling the front proxy which file to send. The proxy
+    handles ranges itself, so only the file's headers are set here."""
+    response = HttpResponse(content_type=guess_content_type(file_upload))
+    response["Content-Disposition"] = content_disposition_header(
+        True, file_upload.filename
+    )
+    response[header] = value
+    return response
+
+
+def x_accel_redirect_response(file_upload):
+    location = settings.X_ACCEL_REDIRECT_PREFIX.rstrip("/") + "/"
+    return proxy_response(
+        file_upload,
+        "X-Accel-Redirect",
+        location + quote(file_upload.file_content.name),
+    )
+
+
+def x_sendfile_response(file_upload):
+    return proxy_response(
+        file_upload, "X-Sendfile", file_upload.file_content.path
+    )
+
+
+def redirect_response(file_upload):
+    """Redirect to a short lived signed link to the file in the bucket, which
+    sends the file and handles ranges itself."""
+    file_field = file_upload.file_content
+    url = file_field.storage.url(
+        file_field.name,
+        parameters={
+            "ResponseContentDisposition": content_disposition_header(
+                True, file_upload.filename
+            ),
+            "ResponseContentType": guess_content_type(file_upload),
+        },
+    )
+    response = HttpResponseRedirect(url)
+    # The link stops working, so mustn't be reused from a cache
+    add_never_cache_headers(response)
+    return response
+
+
+def zip_response(request, zip_stream, filename, etag, last_modified=None):
+    """Response streaming a zip as it is built. The size of the zip is known
+    before it is built, so a single byte range can be sent to resume a
+    download. Requests for multiple ranges are sent the whole zip."""
+    size = zip_stream.size
+    range_header = request.headers.get("Range")
+    ranges = None
+    if range_header and if_range_matches(request, etag, last_modified):
+        ranges = parse_range_header(range_header, size)
+        if ranges is not None and len(ranges) > 1:
+            ranges = None
+
+    if ranges is None:
+        # CRC32s worked out while streaming are saved to the database
+        response = StreamingHttpResponse(
+            stream_content(request, zip_stream.stream(), True),
+            content_type="application/zip",
+        )
+        response["Content-Length"] = size
+    elif not ranges:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+        return response
+    else:
+        start, end = ranges[0]
+        response = StreamingHttpResponse(
+            stream_content(request, zip_stream.stream(start, end), True),
+            status=206,
+            content_type="application/zip",
+        )
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+        response["Content-Length"] = end - start + 1
+
+    response["Content-Disposition"] = content_disposition_header(
+        True, filename
+    )
+    return response
+
+
+def collection_etag(files):
+    """Strong ETag for a collection's zip. The zip only changes when files
+    are added, removed or expire, and each file's hex identifies its
+    content."""
+    file_hexes = ",".join(f.file_hex for f in files)
+    return f'"{hashlib.md5(file_hexes.encode()).hexdigest()}"'
+
+
+def serve_collection(request, collection):
+    """Build the response for downloading a FileCollection as a zip of its
+    files which haven't expired."""
+    files = list(collection.get_files())
+    if not files:
+        raise Http404("No files found")
+
+    etag = collection_etag(files)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = zip_response(
+            request, collection.zip_stream(files), collection.filename, etag
+        )
+
+    response["Accept-Ranges"] = "bytes"
+    response["ETag"] = etag
+    return response
+
+
+def file_response(request, file_upload, etag, last_modified):
+    file_field = file_upload.file_content
+    size = file_upload.file_size
+    if size is None:
+        size = file_field.size
+    range_header = request.headers.get("Range")
+    ranges = None
+    if range_header and if_range_matches(request, etag, last_modified):
+        ranges = parse_range_header(range_header, size)
+
+    content_type = guess_content_type(file_upload)
+    if ranges is None:
+        if not isinstance(request, ASGIRequest):
+            return FileResponse(
+                file_field,
+                as_attachment=True,
+                filename=file_upload.filename,
+            )
+        response = StreamingHttpResponse(
+            stream_content(request, read_range(file_field, 0, size - 1)),
+            content_type=content_type,
+        )
+        response["Content-Length"] = size
+        response["Content-Disposition"] = content_disposition_header(
+            True, file_upload.filename
+        )
+        return response
+
+    if not ranges:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+        return response
+
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        response = StreamingHttpResponse(
+            stream_content(request, read_range(file_field, start, end)),
+            status=206,
+            content_type=content_type,
+        )
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+        response["Content-Length"] = end - start + 1
+    else:
+        boundary = uuid.uuid4().hex
+        response = StreamingHttpResponse(
+            stream_content(
+                request,
+                multipart_ranges(
+                    file_field, ranges, size, content_type, boundary
+                ),
+            ),
+            status=206,
+            content_type=f"multipart/byteranges; boundary={boundary}",
+        )
+        response["Content-Length"] = sum(
+            len(
+                multipart_part_header(
+                    start, end, size, content_type, boundary
+                )
+            )
+            + (end - start + 1)
+            + 2
+            for start, end in ranges
+        ) + len(f"--{boundary}--\r\n")
+
+    response["Content-Disposition"] = content_disposition_header(
+        True, file_upload.filename
+    )
+    return response
@@ -0,0 +1,102 @@
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+from .models import FileUpload
+
+logger = logging.getLogger(__name__)
+
+
+class DownloadStatsBuffer:
+    """Download stats held in memory and written to the database in batches,
+    so serving a file doesn't need a write of its own.
+
+    Stats are written DOWNLOAD_STATS_FLUSH_INTERVAL seconds after the first
+    download since the last write, and when the process exits. If the
+    interval is 0 each download is written straight away.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.timer = None
+
+    def record(self, file_upload, response):
+        """Record the download of a file, given the response serving it."""
+        if response.status_code == 200:
+            downloaded = True
+        elif response.status_code == 302:
+            # Redirected to the file in the bucket. Requests to resume a
+            # download are redirected too, so are also counted.
+            downloaded = True
+        elif response.status_code == 206:
+            # Only count resumed downloads once, when the start of the file
+            # is requested.
+            downloaded = response.get("Content-Range", "").startswith(
+                "bytes 0-"
+            )
+        else:
+            return
+
+        if "Content-Length" in response:
+            num_bytes = int(response["Content-Length"])
+        else:
+            # The proxy or bucket sends the file, so the bytes sent aren't
+            # known here.
+            num_bytes = file_upload.file_size or 0
+
+        now = timezone.now()
+        with self.lock:
+            downloads, total_bytes, _ = self.pending.get(
+                file_upload.pk, (0, 0, None)
+            )
+            self.pending[file_upload.pk] = (
+                downloads + downloaded,
+                total_bytes + num_bytes,
+                now,
+            )
+            interval = settings.DOWNLOAD_STATS_FLUSH_INTERVAL
+            if interval > 0 and self.timer is None:
+                self.timer = threading.Timer(interval, self.flush_in_thread)
+                self.timer.daemon = True
+                self.timer.start()
+
+        if settings.DOWNLOAD_STATS_FLUSH_INTERVAL <= 0:
+            self.flush()
+
+    def flush(self):
+        """Write the pending stats to the database, returning the number of
+        files updated."""
+        with self.lock:
+            pending = self.pending
+            self.pending = {}
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+        if pending:
+            FileUpload.add_download_stats(pending)
+        return len(pending)
+
+    def flush_in_thread(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Unable to save download stats")
+        finally:
+            # Database connections are per thread, and this thread is done.
+            connections.close_all()
+
+
+download_stats = DownloadStatsBuffer()
+
+
+@atexit.register
+def flush_download_stats():
+    try:
+        download_stats.flush()
+    except Exception:
+        logger.exception("Unable to save download stats")
@@ -9,10 +9,47 @@ from django.utils import timezone
 
 from shifter_site_settings.models import SiteSetting
 
-from .models import FileUpload
+from .models import FileCollection, FileUpload, storage_left
+from .templatetags.pretty_file_size import pretty_file_size
+from .uploadhandlers import OverQuotaUploadedFile
 from .widgets import ShifterDateTimeInput
 
 
+def get_max_file_size():
+    """Return the max_file_size site setting as a number of bytes, along with
+    the setting as entered."""
+    max_file_size_str = SiteSetting.get_setting("max_file_size")
+    if max_file_size_str[-2:] == "MB":
+        max_file_size = int(max_file_size_str[:-2]) * 1024 * 1024
+    elif max_file_size_str[-2:] == "KB":
+        max_file_size = int(max_file_size_str[:-2]) * 1024
+    return max_file_size, max_file_size_str
+
+
+def validate_file_size(size):
+    max_file_size, max_file_size_str = get_max_file_size()
+    if size > max_file_size:
+        raise ValidationError(
+            f"You can't upload a file larger than {max_file_size_str}",
+            code="file-size-too-large",
+        )
+
+
+def validate_storage_quota(user, size):
+    space_left = storage_left(user)
+    if space_left is not None and size > space_left:
+        raise storage_quota_error(user)
+
+
+def storage_quota_error(user):
+    return ValidationError(
+        "You don't have enough storage left to upload this file. You "
+        f"have used {pretty_file_size(user.storage_used)} of your "
+        f"{pretty_file_size(user.get_storage_quota())} quota.",
+        code="storage-quota-exceeded",
+    )
+
+
 class FileUploadForm(forms.ModelForm):
     enable_expiry = forms.BooleanField(
         required=False, initial=False, label="Set file expiry"
@@ -33,8 +70,9 @@ class FileUploadForm(forms.ModelForm):
             )
         }
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, user, **kwargs):
         super().__init__(*args, **kwargs)
+        self.user = user
 
         # Check if optional expiry is allowed
         allow_optional = SiteSetting.get_setting("allow_optional_expiry")
@@ -135,18 +173,64 @@ class FileUploadForm(forms.ModelForm):
 
     def clean_file_content(self):
         file_content = self.cleaned_data["file_content"]
-        max_file_size_str = SiteSetting.get_setting("max_file_size")
-        if max_file_size_str[-2:] == "MB":
-            max_file_size = int(max_file_size_str[:-2]) * 1024 * 1024
-        elif max_file_size_str[-2:] == "KB":
-            max_file_size = int(max_file_size_str[:-2]) * 1024
+        validate_file_size(file_content.size)
+        if isinstance(file_content, OverQuotaUploadedFile):
+            # Already found to be over the quota while it was received
+            raise storage_quota_error(self.user)
+        validate_storage_quota(self.user, file_content.size)
+        return file_content
+
+
+class ChunkedUploadForm(FileUploadForm):
+    """Validates the start of a chunked upload. The file content is sent
+    separately, so only its total length is checked here."""
+
+    upload_length = forms.IntegerField(
+        min_value=1,
+        error_messages={"min_value": "The submitted file is empty."},
+    )
+    # Set when the file is one of several being uploaded as a bundle
+    bundle_hex = forms.RegexField(r"^[0-9a-f]{32}$", required=False)
+
+    class Meta(FileUploadForm.Meta):
+        fields: ClassVar[list[str]] = [
+            "enable_expiry",
+            "expiry_datetime",
+        ]
 
-        if file_content.size > max_file_size:
+    def clean_upload_length(self):
+        upload_length = self.cleaned_data["upload_length"]
+        validate_file_size(upload_length)
+        validate_storage_quota(self.user, upload_length)
+        return upload_length
+
+
+class BundleForm(FileUploadForm):
+    """Validates the completion of a bundle, once each of its files has been
+    uploaded using the chunked upload API."""
+
+    name = forms.CharField(max_length=250, initial="combined")
+
+    class Meta(FileUploadForm.Meta):
+        fields: ClassVar[list[str]] = [
+            "enable_expiry",
+            "expiry_datetime",
+        ]
+
+    def __init__(self, *args, bundle_files, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.bundle_files = bundle_files
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if not self.bundle_files:
             raise ValidationError(
-                f"You can't upload a file larger than {max_file_size_str}",
-                code="file-size-too-large",
+                "Select at least one file to upload", code="no-files"
             )
-        return file_content
+        total_size = sum(f.file_size for f in self.bundle_files)
+        validate_file_size(total_size)
+        validate_storage_quota(self.user, total_size)
+        return cleaned_data
 
 
 class FileExpiryEditForm(forms.ModelForm):
@@ -265,6 +349,27 @@ class FileExpiryEditForm(forms.ModelForm):
         return expiry_datetime
 
 
+class FileCollectionForm(forms.ModelForm):
+    """Select some of a user's files to share together as one zip."""
+
+    class Meta:
+        model = FileCollection
+        fields: ClassVar[list[str]] = ["name", "files"]
+        widgets: ClassVar[dict] = {
+            "name": forms.TextInput(attrs={"class": "input-primary"}),
+            "files": forms.CheckboxSelectMultiple(),
+        }
+
+    def __init__(self, *args, user, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields["name"].initial = "collection"
+        self.fields["files"].queryset = (
+            FileUpload.get_non_expired_files()
+            .filter(owner=user, is_bundle=False)
+            .order_by("upload_datetime")
+        )
+
+
 class FileSearchForm(forms.Form):
     search = forms.CharField(
         required=False,
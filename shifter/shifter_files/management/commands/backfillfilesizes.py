@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from shifter_files.models import FileUpload
+
+
+class Command(BaseCommand):
+    help = "Stores the size of any files which don't have one recorded"
+
+    def handle(self, *args, **kwargs):
+        num_updated, num_missing = FileUpload.backfill_file_sizes()
+        if num_updated > 0:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Successfully stored the size of {num_updated} file(s)"
+                )
+            )
+        else:
+            self.stdout.write(
+                self.style.SUCCESS("No file sizes to be stored")
+            )
+        if num_missing > 0:
+            self.stdout.write(
+                self.style.WARNING(
+                    f"Skipped {num_missing} file(s) missing from storage"
+                )
+            )
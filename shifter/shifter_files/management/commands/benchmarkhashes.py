@@ -0,0 +1,83 @@
+import io
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shifter_files.models import HASH_ALGORITHM_CHOICES, FileUpload
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures the throughput of each file hash algorithm with a range of "
+        "read sizes, to help choose FILE_HASH_ALGORITHM"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--size",
+            type=int,
+            default=256,
+            help="Amount of data to hash in each run, in MB (default 256)",
+        )
+        parser.add_argument(
+            "--file",
+            help=(
+                "Hash this file instead of data held in memory, to include "
+                "the cost of reading it"
+            ),
+        )
+        parser.add_argument(
+            "--read-sizes",
+            type=int,
+            nargs="+",
+            default=[8, 64, 1024, 4096],
+            help="Read sizes to try, in KB (default 8 64 1024 4096)",
+        )
+        parser.add_argument(
+            "--algorithms",
+            nargs="+",
+            choices=[algorithm for algorithm, _ in HASH_ALGORITHM_CHOICES],
+            default=[algorithm for algorithm, _ in HASH_ALGORITHM_CHOICES],
+            help="Algorithms to try (default all)",
+        )
+
+    def handle(self, *args, **options):
+        if options["size"] < 1:
+            raise CommandError("--size must be at least 1")
+        if min(options["read_sizes"]) < 1:
+            raise CommandError("--read-sizes must be at least 1")
+
+        if options["file"]:
+            try:
+                size = os.path.getsize(options["file"])
+            except OSError as e:
+                raise CommandError(f"Unable to read {options['file']}") from e
+            data = None
+        else:
+            # Only the hashing itself is measured
+            size = options["size"] * 1024 * 1024
+            data = io.BytesIO(os.urandom(size))
+
+        self.stdout.write(f"{'Algorithm':<10} {'Read size':>10} {'MB/s':>10}")
+        for algorithm in options["algorithms"]:
+            for read_size_kb in options["read_sizes"]:
+                read_size = read_size_kb * 1024
+                hasher = FileUpload.new_file_hasher(algorithm)
+                start = time.perf_counter()
+                if data is None:
+                    with open(options["file"], "rb") as f:
+                        self.hash_file(hasher, f, read_size)
+                else:
+                    data.seek(0)
+                    self.hash_file(hasher, data, read_size)
+                elapsed = time.perf_counter() - start
+                throughput = size / (1024 * 1024) / elapsed
+                self.stdout.write(
+                    f"{algorithm:<10} {read_size_kb:>8}KB {throughput:>10.0f}"
+                )
+
+    def hash_file(self, hasher, f, read_size):
+        while chunk := f.read(read_size):
+            hasher.update(chunk)
+        return hasher.hexdigest()
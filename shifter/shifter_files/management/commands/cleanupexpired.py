@@ -1,4 +1,4 @@
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 
 from shifter_files.models import FileUpload
 
@@ -6,8 +6,34 @@ from shifter_files.models import FileUpload
 class Command(BaseCommand):
     help = "Deletes all expired files"
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of expired files to delete in each batch",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=4,
+            help="Number of threads deleting files from storage",
+        )
+
     def handle(self, *args, **kwargs):
-        num_files_deleted = FileUpload.delete_expired_files()
+        if kwargs["batch_size"] < 1:
+            raise CommandError("--batch-size must be at least 1")
+        if kwargs["workers"] < 1:
+            raise CommandError("--workers must be at least 1")
+
+        # Progress is reported at verbosity 2 and above
+        num_files_deleted = FileUpload.delete_expired_files(
+            batch_size=kwargs["batch_size"],
+            workers=kwargs["workers"],
+            progress=self.report_progress
+            if kwargs["verbosity"] > 1
+            else None,
+        )
         if num_files_deleted > 0:
             self.stdout.write(
                 self.style.SUCCESS(
@@ -19,3 +45,6 @@ class Command(BaseCommand):
             self.stdout.write(
                 self.style.SUCCESS("No expired files to be deleted")
             )
+
+    def report_progress(self, num_files_deleted):
+        self.stdout.write(f"Deleted {num_files_deleted} expired file(s)...")
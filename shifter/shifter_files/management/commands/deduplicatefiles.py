@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from shifter_files.models import FileUpload
+from shifter_files.templatetags.pretty_file_size import pretty_file_size
+
+
+class Command(BaseCommand):
+    help = (
+        "Stores files with identical content once, for files uploaded before "
+        "DEDUPLICATE_UPLOADS was enabled"
+    )
+
+    def handle(self, *args, **kwargs):
+        if not settings.DEDUPLICATE_UPLOADS:
+            raise CommandError("DEDUPLICATE_UPLOADS is not enabled")
+
+        num_shared, bytes_freed = FileUpload.deduplicate_files()
+        if num_shared > 0:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Successfully deduplicated {num_shared} file(s), "
+                    f"freeing {pretty_file_size(bytes_freed)}"
+                )
+            )
+        else:
+            self.stdout.write(self.style.SUCCESS("No duplicate files found"))
@@ -0,0 +1,61 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shifter_files.models import FileProcessingJob
+
+
+class Command(BaseCommand):
+    help = (
+        "Calculates the checksums of uploaded files and deduplicates them, "
+        "when BACKGROUND_FILE_PROCESSING is enabled"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Process the files waiting then exit, rather than waiting "
+            "for more",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=5,
+            help="Seconds to wait before checking for new files (default 5)",
+        )
+        parser.add_argument(
+            "--retry-failed",
+            action="store_true",
+            help="Try again to process files which failed every attempt",
+        )
+
+    def handle(self, *args, **kwargs):
+        if kwargs["poll_interval"] <= 0:
+            raise CommandError("--poll-interval must be greater than 0")
+
+        if kwargs["retry_failed"]:
+            num_retried = FileProcessingJob.retry_failed()
+            self.stdout.write(f"Queued {num_retried} failed file(s) again")
+        else:
+            num_failed = FileProcessingJob.failed_jobs().count()
+            if num_failed:
+                self.stderr.write(
+                    self.style.WARNING(
+                        f"{num_failed} file(s) couldn't be processed and "
+                        "won't be tried again. Run processfiles "
+                        "--retry-failed once the cause is fixed."
+                    )
+                )
+
+        while True:
+            num_processed = FileProcessingJob.process_pending()
+            if kwargs["once"]:
+                self.stdout.write(
+                    self.style.SUCCESS(f"Processed {num_processed} file(s)")
+                )
+                return
+            if num_processed == 0:
+                time.sleep(kwargs["poll_interval"])
+            elif kwargs["verbosity"] > 1:
+                self.stdout.write(f"Processed {num_processed} file(s)")
@@ -0,0 +1,22 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        "Adds up the size of each user's files, correcting the storage used "
+        "counted towards their quota if it is wrong"
+    )
+
+    def handle(self, *args, **kwargs):
+        num_corrected = get_user_model().recalculate_storage_used()
+        if num_corrected > 0:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Corrected the storage used by {num_corrected} user(s)"
+                )
+            )
+        else:
+            self.stdout.write(
+                self.style.SUCCESS("Storage used is correct for all users")
+            )
@@ -0,0 +1,77 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shifter_files.reconcile import reconcile_storage
+from shifter_files.templatetags.pretty_file_size import pretty_file_size
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes stored files which no upload uses, and the uploads of files "
+        "which are missing from storage"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report what would be deleted without deleting anything",
+        )
+        parser.add_argument(
+            "--min-age",
+            type=int,
+            default=24,
+            help=(
+                "Hours since a file was last changed before it can be deleted"
+                ", so uploads still being saved are left alone"
+            ),
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of rows to read, and files to delete, at a time",
+        )
+
+    def handle(self, *args, **kwargs):
+        if kwargs["batch_size"] < 1:
+            raise CommandError("--batch-size must be at least 1")
+        if kwargs["min_age"] < 0:
+            raise CommandError("--min-age can't be negative")
+
+        dry_run = kwargs["dry_run"]
+        # Each file found is listed at verbosity 2 and above
+        num_orphaned, bytes_orphaned, num_missing = reconcile_storage(
+            remove=not dry_run,
+            min_age=timedelta(hours=kwargs["min_age"]),
+            batch_size=kwargs["batch_size"],
+            report=self.report if kwargs["verbosity"] > 1 else None,
+        )
+        if num_orphaned == 0 and num_missing == 0:
+            self.stdout.write(
+                self.style.SUCCESS("Storage matches the database")
+            )
+            return
+
+        orphaned = (
+            f"{num_orphaned} orphaned file(s) "
+            f"({pretty_file_size(bytes_orphaned)})"
+        )
+        if dry_run:
+            self.stdout.write(
+                self.style.WARNING(
+                    f"Found {orphaned} and {num_missing} missing file(s). "
+                    "Run without --dry-run to delete them"
+                )
+            )
+        else:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Deleted {orphaned} and the uploads of {num_missing} "
+                    "missing file(s)"
+                )
+            )
+
+    def report(self, kind, name):
+        self.stdout.write(f"{kind.capitalize()}: {name}")
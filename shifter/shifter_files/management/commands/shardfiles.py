@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from shifter_files.models import FileUpload
+
+
+class Command(BaseCommand):
+    help = (
+        "Moves files uploaded before sharded storage names were used to "
+        "their sharded names. Can be run while Shifter is in use"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of files to select in each batch",
+        )
+
+    def handle(self, *args, **kwargs):
+        if kwargs["batch_size"] < 1:
+            raise CommandError("--batch-size must be at least 1")
+
+        # Progress is reported at verbosity 2 and above
+        num_moved = FileUpload.shard_files(
+            batch_size=kwargs["batch_size"],
+            progress=self.report_progress if kwargs["verbosity"] > 1 else None,
+        )
+        if num_moved > 0:
+            self.stdout.write(
+                self.style.SUCCESS(f"Successfully moved {num_moved} file(s)")
+            )
+        else:
+            self.stdout.write(
+                self.style.SUCCESS("All files already have sharded names")
+            )
+
+    def report_progress(self, num_moved):
+        self.stdout.write(f"Moved {num_moved} file(s)...")
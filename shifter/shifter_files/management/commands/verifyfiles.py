@@ -0,0 +1,82 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shifter_files.models import FileUpload
+
+
+class Command(BaseCommand):
+    help = (
+        "Hashes stored files again, including the files in each bundle, to "
+        "check they haven't changed since they were uploaded, recording the "
+        "result on each upload or bundle file"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=2,
+            help="Number of files to hash at once (default 2)",
+        )
+        parser.add_argument(
+            "--max-rate",
+            type=float,
+            help=(
+                "Most data to read per second across all workers, in MB, to "
+                "leave disk bandwidth for downloads (default no limit)"
+            ),
+        )
+        parser.add_argument(
+            "--min-interval",
+            type=float,
+            default=12,
+            help=(
+                "Skip files verified within this many hours, so a stopped run "
+                "carries on where it left off (default 12)"
+            ),
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=100,
+            help="Number of files to select in each batch",
+        )
+
+    def handle(self, *args, **kwargs):
+        if kwargs["workers"] < 1:
+            raise CommandError("--workers must be at least 1")
+        if kwargs["max_rate"] is not None and kwargs["max_rate"] <= 0:
+            raise CommandError("--max-rate must be greater than 0")
+        if kwargs["min_interval"] < 0:
+            raise CommandError("--min-interval can't be negative")
+        if kwargs["batch_size"] < 1:
+            raise CommandError("--batch-size must be at least 1")
+
+        max_rate = None
+        if kwargs["max_rate"] is not None:
+            max_rate = kwargs["max_rate"] * 1024 * 1024
+        # Progress is reported at verbosity 2 and above
+        counts = FileUpload.verify_files(
+            workers=kwargs["workers"],
+            max_rate=max_rate,
+            min_interval=timedelta(hours=kwargs["min_interval"]),
+            batch_size=kwargs["batch_size"],
+            progress=self.report_progress if kwargs["verbosity"] > 1 else None,
+        )
+        if counts.total() == 0:
+            self.stdout.write(self.style.SUCCESS("No files need verifying"))
+            return
+
+        summary = (
+            f"Verified {counts.total()} file(s): {counts['ok']} OK, "
+            f"{counts['mismatch']} not matching their hash, "
+            f"{counts['missing']} missing"
+        )
+        if counts["mismatch"] or counts["missing"]:
+            self.stdout.write(self.style.WARNING(summary))
+        else:
+            self.stdout.write(self.style.SUCCESS(summary))
+
+    def report_progress(self, num_verified):
+        self.stdout.write(f"Verified {num_verified} file(s)...")
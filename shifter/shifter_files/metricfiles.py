@@ -0,0 +1,81 @@
+"""
+Upkeep of the files in PROMETHEUS_MULTIPROC_DIR.
+
+Every process writes its metrics to files named after its pid, which are
+added up when scraped. Once a process exits its files are merged into one
+archive file per metric type and removed, so the folder doesn't keep
+growing as gunicorn restarts workers and cron and other commands run.
+Nothing here imports Django, as it is also used by the gunicorn master.
+"""
+
+import fcntl
+import glob
+import os
+from contextlib import contextmanager, suppress
+
+from prometheus_client import multiprocess
+from prometheus_client.mmap_dict import MmapedDict, mmap_key
+
+LOCK_NAME = "merge.lock"
+# Gauges are left alone, as each process's values are kept separately
+MERGED_TYPES = ("counter", "histogram", "summary")
+
+
+def metrics_dir():
+    return os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+
+
+@contextmanager
+def locked(path, shared=False):
+    """Hold the folder's lock. Scrapes share it, so they never see a merge
+    half done and count a process twice or not at all."""
+    with open(os.path.join(path, LOCK_NAME), "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        yield
+
+
+def merge_process_files(pid, path=None):
+    """Add the metrics of a process which has exited to the archive files,
+    and remove its own files."""
+    path = path or metrics_dir()
+    if not path:
+        return
+    multiprocess.mark_process_dead(pid, path)
+    with locked(path):
+        for typ in MERGED_TYPES:
+            process_files = glob.glob(os.path.join(path, f"{typ}_{pid}.db"))
+            if not process_files:
+                continue
+            archive = os.path.join(path, f"{typ}_archive.db")
+            write_archive(archive, process_files)
+            for f in process_files:
+                os.remove(f)
+
+
+def write_archive(archive, process_files):
+    files = process_files
+    if os.path.exists(archive):
+        files = [*process_files, archive]
+    # Histogram buckets are stored as they are in each process's file
+    metrics = multiprocess.MultiProcessCollector.merge(files, accumulate=False)
+
+    # Written alongside and moved into place, so the archive is never left
+    # half written if this process is killed
+    temp_archive = f"{archive}.tmp"
+    with suppress(FileNotFoundError):
+        os.remove(temp_archive)
+    values = MmapedDict(temp_archive)
+    try:
+        for metric in metrics:
+            for sample in metric.samples:
+                key = mmap_key(
+                    metric.name,
+                    sample.name,
+                    list(sample.labels),
+                    list(sample.labels.values()),
+                    metric.documentation,
+                )
+                values.write_value(key, sample.value, 0)
+    finally:
+        values.close()
+    os.replace(temp_archive, archive)
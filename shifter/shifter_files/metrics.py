@@ -0,0 +1,250 @@
+"""
+Prometheus metrics for uploads, downloads and expired file cleanup, served
+in the text exposition format by the metrics view.
+
+Each gunicorn worker is a separate process with metrics of its own. When the
+PROMETHEUS_MULTIPROC_DIR environment variable is set, every process writes
+its metrics to files in that directory and they are added up when scraped,
+so the totals are the same whichever worker answers. This includes the cron
+job which deletes expired files. Each process's files are merged into the
+totals of finished processes when it exits.
+"""
+
+import atexit
+import math
+import os
+import time
+
+from django.core.cache import cache
+from django.db import connections
+from django.http import FileResponse
+from prometheus_client import (
+    REGISTRY,
+    CollectorRegistry,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client.core import GaugeMetricFamily
+
+from .metricfiles import locked, merge_process_files, metrics_dir
+
+FILE_COUNTS_CACHE_KEY = "shifter_files_metrics_file_counts"
+FILE_COUNTS_CACHE_TIMEOUT = 60  # seconds
+
+# Above this many rows, the number of files is estimated from the table
+# statistics on postgres rather than counted.
+ESTIMATE_FILE_COUNT_ABOVE = 100000
+
+MB = 1024 * 1024
+
+UPLOAD_DURATION = Histogram(
+    "shifter_upload_duration_seconds",
+    "Time taken to receive and save an upload, by upload method.",
+    ["method"],
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600, math.inf),
+)
+UPLOAD_SIZE = Histogram(
+    "shifter_upload_size_bytes",
+    "Size of uploaded files.",
+    buckets=tuple(MB * 4**i for i in range(-3, 8)) + (math.inf,),
+)
+DOWNLOAD_TTFB = Histogram(
+    "shifter_download_time_to_first_byte_seconds",
+    "Time from a download request arriving to the first bytes of the file "
+    "being ready to send.",
+)
+DOWNLOAD_THROUGHPUT = Histogram(
+    "shifter_download_throughput_bytes_per_second",
+    "Average rate each download was sent at.",
+    buckets=tuple(MB * 4**i for i in range(-3, 6)) + (math.inf,),
+)
+CLEANUP_DURATION = Histogram(
+    "shifter_delete_expired_files_duration_seconds",
+    "Time taken by each run of delete_expired_files.",
+    buckets=(0.1, 0.5, 1, 5, 15, 60, 300, 900, math.inf),
+)
+CLEANUP_FILES_DELETED = Histogram(
+    "shifter_delete_expired_files_deleted_files",
+    "Number of expired files deleted by each run of delete_expired_files.",
+    buckets=(0, 1, 10, 100, 1000, 10000, 100000, math.inf),
+)
+DB_QUERIES = Histogram(
+    "shifter_db_queries_per_request",
+    "Number of database queries made for each request, by view.",
+    ["view"],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200, 500, math.inf),
+)
+
+
+def count_files():
+    """Return the number of active and expired files.
+
+    Expired files are counted using the index on expiry_datetime, and are
+    few as they are deleted every few minutes. The total is estimated from
+    the table statistics on postgres once the table is large. The counts
+    are cached, so frequent scrapes don't query the database each time.
+    """
+    counts = cache.get(FILE_COUNTS_CACHE_KEY)
+    if counts is None:
+        # Imported here as the models record metrics of their own
+        from .models import FileUpload
+
+        num_expired = FileUpload.get_expired_files().count()
+        num_files = estimate_row_count(FileUpload)
+        if num_files is None or num_files <= ESTIMATE_FILE_COUNT_ABOVE:
+            num_files = FileUpload.objects.count()
+        counts = (max(num_files - num_expired, 0), num_expired)
+        cache.set(FILE_COUNTS_CACHE_KEY, counts, FILE_COUNTS_CACHE_TIMEOUT)
+    return counts
+
+
+def estimate_row_count(model):
+    """Return the planner's estimate of the number of rows in a model's
+    table, or None if the database doesn't keep one."""
+    connection = connections[model.objects.db]
+    if connection.vendor != "postgresql":
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT reltuples FROM pg_class WHERE oid = %s::regclass",
+            [model._meta.db_table],
+        )
+        row = cursor.fetchone()
+    # Tables which have never been analyzed have no estimate
+    if row is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+class FileCountCollector:
+    """Gauges of the number of stored files, worked out when scraped."""
+
+    def collect(self):
+        num_active, num_expired = count_files()
+        yield GaugeMetricFamily(
+            "shifter_active_files",
+            "Number of files which haven't expired.",
+            value=num_active,
+        )
+        yield GaugeMetricFamily(
+            "shifter_expired_files",
+            "Number of expired files waiting to be deleted.",
+            value=num_expired,
+        )
+
+
+file_count_registry = CollectorRegistry()
+file_count_registry.register(FileCountCollector())
+
+
+def generate_metrics():
+    """Return the current metrics in the text exposition format."""
+    path = metrics_dir()
+    if not path:
+        metrics = generate_latest(REGISTRY)
+    else:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry, path)
+        with locked(path, shared=True):
+            metrics = generate_latest(registry)
+    return metrics + generate_latest(file_count_registry)
+
+
+def merge_own_files():
+    # The pid is looked up at exit, in case this process was forked from the
+    # one which imported this module
+    merge_process_files(os.getpid())
+
+
+if metrics_dir():
+    atexit.register(merge_own_files)
+
+
+def observe_upload(method, duration, size):
+    UPLOAD_DURATION.labels(method).observe(duration)
+    UPLOAD_SIZE.observe(size)
+
+
+def observe_download(response, started):
+    """Record the time to first byte and throughput of a download.
+
+    started is the time.perf_counter() value when the request arrived. The
+    response's content is wrapped to time it as it is sent. Responses sent
+    by a proxy or the bucket, and responses without the file, are skipped.
+    """
+    if not response.streaming or response.status_code not in (200, 206):
+        return
+
+    if isinstance(response, FileResponse) and response.file_to_stream:
+        # The server sends the file itself, using sendfile where it can, so
+        # the content isn't seen here. It is ready to send once returned.
+        DOWNLOAD_TTFB.observe(time.perf_counter() - started)
+        num_bytes = int(response.get("Content-Length", 0))
+        response.streaming_content = TimedFile(
+            response.file_to_stream, num_bytes, started
+        )
+    elif response.is_async:
+        response.streaming_content = timed_async_content(
+            response.streaming_content, started
+        )
+    else:
+        response.streaming_content = timed_content(
+            response.streaming_content, started
+        )
+
+
+def observe_throughput(num_bytes, started):
+    elapsed = time.perf_counter() - started
+    if num_bytes and elapsed > 0:
+        DOWNLOAD_THROUGHPUT.observe(num_bytes / elapsed)
+
+
+class TimedFile:
+    """Wraps the file sent by a FileResponse to record the download's
+    throughput when it is closed.
+
+    The response closes the file once it has been sent, including when the
+    server sends it with wsgi.file_wrapper. Everything else is passed on to
+    the file, so the server can still use its fileno for sendfile.
+    """
+
+    def __init__(self, file, num_bytes, started):
+        self.file = file
+        self.num_bytes = num_bytes
+        self.started = started
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+    def close(self):
+        self.file.close()
+        observe_throughput(self.num_bytes, self.started)
+
+
+def timed_content(content, started):
+    num_bytes = 0
+    first = True
+    try:
+        for chunk in content:
+            if first:
+                DOWNLOAD_TTFB.observe(time.perf_counter() - started)
+                first = False
+            num_bytes += len(chunk)
+            yield chunk
+    finally:
+        observe_throughput(num_bytes, started)
+
+
+async def timed_async_content(content, started):
+    num_bytes = 0
+    first = True
+    try:
+        async for chunk in content:
+            if first:
+                DOWNLOAD_TTFB.observe(time.perf_counter() - started)
+                first = False
+            num_bytes += len(chunk)
+            yield chunk
+    finally:
+        observe_throughput(num_bytes, started)
@@ -0,0 +1,27 @@
+from django.db import connection
+
+from .metrics import DB_QUERIES
+
+
+def count_queries(get_response):
+    """Record the number of database queries made for each request, by the
+    view which handled it. Only installed when METRICS_ENABLED is set."""
+
+    def middleware(request):
+        num_queries = 0
+
+        def count(execute, sql, params, many, context):
+            nonlocal num_queries
+            num_queries += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count):
+            response = get_response(request)
+
+        if request.resolver_match is not None:
+            DB_QUERIES.labels(request.resolver_match.view_name).observe(
+                num_queries
+            )
+        return response
+
+    return middleware
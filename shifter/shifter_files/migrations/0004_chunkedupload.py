@@ -0,0 +1,31 @@
+# Generated by Django 6.1 on 2026-10-18 16:58
+
+import django.db.models.deletion
+import django.utils.timezone
+import shifter_files.models
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shifter_files', '0003_alter_fileupload_expiry_datetime'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChunkedUpload',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('upload_id', models.CharField(default=shifter_files.models.generate_hex_uuid, editable=False, max_length=32, unique=True)),
+                ('filename', models.CharField(blank=True, max_length=255)),
+                ('upload_length', models.BigIntegerField()),
+                ('offset', models.BigIntegerField(default=0)),
+                ('expiry_datetime', models.DateTimeField(blank=True, null=True)),
+                ('created_datetime', models.DateTimeField(default=django.utils.timezone.now)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
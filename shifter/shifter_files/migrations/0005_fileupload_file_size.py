@@ -0,0 +1,67 @@
+# Generated by Django 6.1 on 2026-10-18 17:15
+
+from django.db import migrations, models
+
+BATCH_SIZE = 500
+
+
+def backfill_file_sizes(apps, schema_editor):
+    """Store the size of existing files so it no longer has to be read from
+    storage whenever it is displayed."""
+    FileUpload = apps.get_model('shifter_files', 'FileUpload')
+
+    files_without_size = FileUpload.objects.filter(
+        file_size__isnull=True
+    ).order_by('pk')
+
+    batch = []
+    updated_count = 0
+    error_count = 0
+
+    for file_upload in files_without_size.iterator(chunk_size=BATCH_SIZE):
+        try:
+            file_upload.file_size = file_upload.file_content.size
+        except Exception as e:
+            # File missing from storage, leave the size unknown
+            print(
+                f"Error reading size of "
+                f"{file_upload.filename}: {e}"
+            )
+            error_count += 1
+            continue
+        batch.append(file_upload)
+        if len(batch) >= BATCH_SIZE:
+            FileUpload.objects.bulk_update(batch, ['file_size'])
+            updated_count += len(batch)
+            batch = []
+
+    if batch:
+        FileUpload.objects.bulk_update(batch, ['file_size'])
+        updated_count += len(batch)
+
+    if updated_count > 0 or error_count > 0:
+        print(
+            f"Backfilled {updated_count} file sizes. "
+            f"Skipped {error_count} files."
+        )
+
+
+def reverse_backfill(apps, schema_editor):
+    """Reverse migration - no action needed."""
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shifter_files', '0004_chunkedupload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fileupload',
+            name='file_size',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_file_sizes, reverse_backfill),
+    ]
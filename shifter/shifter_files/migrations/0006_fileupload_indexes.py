@@ -0,0 +1,27 @@
+# Generated by Django 6.1 on 2026-10-18 17:19
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shifter_files', '0005_fileupload_file_size'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='fileupload',
+            index=models.Index(fields=['owner', 'upload_datetime'], name='fileupload_owner_uploaded_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fileupload',
+            index=models.Index(fields=['owner', 'expiry_datetime'], name='fileupload_owner_expiry_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fileupload',
+            index=models.Index(condition=models.Q(('expiry_datetime__isnull', False)), fields=['expiry_datetime'], name='fileupload_expiry_idx'),
+        ),
+    ]
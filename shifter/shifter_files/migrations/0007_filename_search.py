@@ -0,0 +1,49 @@
+# Generated by Django 6.1 on 2026-10-18 17:30
+
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    """Create the database specific index used to search filenames."""
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        # Matches the UPPER(filename::text) LIKE expression Django uses for
+        # icontains, so those lookups can use the index
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS fileupload_filename_trgm_idx '
+            'ON shifter_files_fileupload '
+            'USING gin (UPPER(filename::text) gin_trgm_ops)'
+        )
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            'CREATE VIRTUAL TABLE IF NOT EXISTS shifter_files_fileupload_fts '
+            "USING fts5(filename, tokenize='trigram')"
+        )
+        schema_editor.execute(
+            'INSERT INTO shifter_files_fileupload_fts (rowid, filename) '
+            'SELECT id, filename FROM shifter_files_fileupload'
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            'DROP INDEX IF EXISTS fileupload_filename_trgm_idx'
+        )
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            'DROP TABLE IF EXISTS shifter_files_fileupload_fts'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shifter_files', '0006_fileupload_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
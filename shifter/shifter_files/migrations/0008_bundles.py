@@ -0,0 +1,41 @@
+# Generated by Django 6.1 on 2026-10-18 17:28
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shifter_files', '0007_filename_search'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chunkedupload',
+            name='bundle_hex',
+            field=models.CharField(blank=True, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='fileupload',
+            name='is_bundle',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='BundleFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bundle_hex', models.CharField(db_index=True, max_length=32)),
+                ('filename', models.CharField(max_length=255)),
+                ('file_content', models.FileField(upload_to='uploads/')),
+                ('file_hash', models.CharField(blank=True, max_length=32, null=True)),
+                ('file_size', models.BigIntegerField()),
+                ('created_datetime', models.DateTimeField(default=django.utils.timezone.now)),
+                ('bundle', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='bundle_files', to='shifter_files.fileupload')),
+                ('owner', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 6.1 on 2026-10-18 17:33
+
+import django.db.models.deletion
+import django.utils.timezone
+import shifter_files.models
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shifter_files', '0008_bundles'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bundlefile',
+            name='file_crc32',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='fileupload',
+            name='file_crc32',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='FileCollection',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('collection_hex', models.CharField(default=shifter_files.models.generate_hex_uuid, editable=False, max_length=32, unique=True)),
+                ('name', models.CharField(max_length=250)),
+                ('created_datetime', models.DateTimeField(default=django.utils.timezone.now)),
+                ('files', models.ManyToManyField(related_name='collections', to='shifter_files.fileupload')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
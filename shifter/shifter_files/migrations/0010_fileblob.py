@@ -0,0 +1,32 @@
+# Generated by Django 6.1 on 2026-10-18 17:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shifter_files', '0009_filecollection'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FileBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_hash', models.CharField(max_length=32)),
+                ('file_size', models.BigIntegerField()),
+                ('file_content', models.FileField(upload_to='uploads/')),
+                ('ref_count', models.PositiveIntegerField(default=1)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('file_hash', 'file_size'), name='fileblob_unique_content')],
+            },
+        ),
+        migrations.AddField(
+            model_name='fileupload',
+            name='blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='file_uploads', to='shifter_files.fileblob'),
+        ),
+    ]
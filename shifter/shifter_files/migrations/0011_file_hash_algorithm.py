@@ -0,0 +1,70 @@
+# Generated by Django 6.1 on 2026-10-18 17:45
+
+import shifter_files.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shifter_files', '0010_fileblob'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='fileblob',
+            name='fileblob_unique_content',
+        ),
+        # Files hashed before the algorithm was configurable used MD5
+        migrations.AddField(
+            model_name='bundlefile',
+            name='file_hash_algorithm',
+            field=models.CharField(choices=[('md5', 'MD5'), ('sha1', 'SHA-1'), ('sha256', 'SHA-256'), ('sha512', 'SHA-512'), ('blake2b', 'BLAKE2b'), ('blake2s', 'BLAKE2s')], default='md5', max_length=16),
+        ),
+        migrations.AlterField(
+            model_name='bundlefile',
+            name='file_hash_algorithm',
+            field=models.CharField(choices=[('md5', 'MD5'), ('sha1', 'SHA-1'), ('sha256', 'SHA-256'), ('sha512', 'SHA-512'), ('blake2b', 'BLAKE2b'), ('blake2s', 'BLAKE2s')], default=shifter_files.models.default_hash_algorithm, max_length=16),
+        ),
+        # Files hashed before the algorithm was configurable used MD5
+        migrations.AddField(
+            model_name='fileblob',
+            name='file_hash_algorithm',
+            field=models.CharField(choices=[('md5', 'MD5'), ('sha1', 'SHA-1'), ('sha256', 'SHA-256'), ('sha512', 'SHA-512'), ('blake2b', 'BLAKE2b'), ('blake2s', 'BLAKE2s')], default='md5', max_length=16),
+        ),
+        migrations.AlterField(
+            model_name='fileblob',
+            name='file_hash_algorithm',
+            field=models.CharField(choices=[('md5', 'MD5'), ('sha1', 'SHA-1'), ('sha256', 'SHA-256'), ('sha512', 'SHA-512'), ('blake2b', 'BLAKE2b'), ('blake2s', 'BLAKE2s')], default=shifter_files.models.default_hash_algorithm, max_length=16),
+        ),
+        # Files hashed before the algorithm was configurable used MD5
+        migrations.AddField(
+            model_name='fileupload',
+            name='file_hash_algorithm',
+            field=models.CharField(choices=[('md5', 'MD5'), ('sha1', 'SHA-1'), ('sha256', 'SHA-256'), ('sha512', 'SHA-512'), ('blake2b', 'BLAKE2b'), ('blake2s', 'BLAKE2s')], default='md5', max_length=16),
+        ),
+        migrations.AlterField(
+            model_name='fileupload',
+            name='file_hash_algorithm',
+            field=models.CharField(choices=[('md5', 'MD5'), ('sha1', 'SHA-1'), ('sha256', 'SHA-256'), ('sha512', 'SHA-512'), ('blake2b', 'BLAKE2b'), ('blake2s', 'BLAKE2s')], default=shifter_files.models.default_hash_algorithm, max_length=16),
+        ),
+        migrations.AlterField(
+            model_name='bundlefile',
+            name='file_hash',
+            field=models.CharField(blank=True, max_length=128, null=True),
+        ),
+        migrations.AlterField(
+            model_name='fileblob',
+            name='file_hash',
+            field=models.CharField(max_length=128),
+        ),
+        migrations.AlterField(
+            model_name='fileupload',
+            name='file_hash',
+            field=models.CharField(blank=True, max_length=128, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='fileblob',
+            constraint=models.UniqueConstraint(fields=('file_hash', 'file_hash_algorithm', 'file_size'), name='fileblob_unique_content'),
+        ),
+    ]
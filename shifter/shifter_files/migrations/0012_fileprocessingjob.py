@@ -0,0 +1,26 @@
+# Generated by Django 6.1 on 2026-10-18 17:50
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shifter_files', '0011_file_hash_algorithm'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FileProcessingJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_datetime', models.DateTimeField(default=django.utils.timezone.now)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('claimed_until', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True)),
+                ('file_upload', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='processing_job', to='shifter_files.fileupload')),
+            ],
+        ),
+    ]
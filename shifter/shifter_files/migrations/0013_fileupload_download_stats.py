@@ -0,0 +1,28 @@
+# Generated by Django 6.1 on 2026-10-18 18:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shifter_files', '0012_fileprocessingjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fileupload',
+            name='bytes_served',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='fileupload',
+            name='download_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='fileupload',
+            name='last_download_datetime',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.1 on 2026-10-18 18:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shifter_files', '0013_fileupload_download_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chunkedupload',
+            name='multipart_upload_id',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='chunkedupload',
+            name='num_parts',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 6.1 on 2026-10-18 18:50
+
+import shifter_files.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shifter_files', '0014_chunkedupload_multipart'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='bundlefile',
+            name='file_content',
+            field=models.FileField(upload_to=shifter_files.models.upload_path),
+        ),
+        migrations.AlterField(
+            model_name='fileblob',
+            name='file_content',
+            field=models.FileField(upload_to=shifter_files.models.upload_path),
+        ),
+        migrations.AlterField(
+            model_name='fileupload',
+            name='file_content',
+            field=models.FileField(upload_to=shifter_files.models.upload_path),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.1 on 2026-10-18 19:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shifter_files', '0015_sharded_storage_names'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fileupload',
+            name='last_verified_datetime',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='fileupload',
+            name='verify_status',
+            field=models.CharField(blank=True, choices=[('ok', 'OK'), ('mismatch', 'Hash mismatch'), ('missing', 'Missing')], max_length=16),
+        ),
+    ]
@@ -1,18 +1,250 @@
+import fcntl
 import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
 import uuid
+import zlib
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager, suppress
+from datetime import timedelta
+from typing import ClassVar
 
 from django.conf import settings
-from django.db import models
-from django.db.models.functions import Now
-from django.db.models.signals import pre_delete
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models import F, Q, Sum, Value
+from django.db.models.functions import Coalesce, Greatest, Now
+from django.db.models.signals import post_delete, post_save, pre_delete
 from django.dispatch.dispatcher import receiver
 from django.utils import timezone
 
+from .metrics import CLEANUP_DURATION, CLEANUP_FILES_DELETED
+from .search import get_search_backend
+from .verify import hash_file, hash_path
+from .zipstream import ZipMember, ZipStream, unique_names
+
+logger = logging.getLogger(__name__)
+
+# Reading in large chunks keeps the per-call overhead of hashing low. See the
+# benchmarkhashes command for throughput with other sizes.
+HASH_READ_SIZE = 1024 * 1024
+
+LANDING_PAGE_CACHE_KEY_PREFIX = "shifter_files_landing_page_"
+
+# Times deduplicate looks for a blob again when it changes while the files
+# are being compared, before keeping the upload's own copy.
+DEDUPLICATE_ATTEMPTS = 3
+
+# Stored names given by sharded_name. Files uploaded before then are stored
+# as uploads/<filename>_<hex>, until moved by the shardfiles command.
+SHARDED_NAME_REGEX = r"^uploads/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{32}$"
+
+# Set while rows are deleted whose files are removed from storage, and whose
+# owners' storage used is reduced, separately. This stops the receivers doing
+# it again for each row.
+_deleting_files_separately = threading.local()
+
+
+@contextmanager
+def files_deleted_separately():
+    _deleting_files_separately.active = True
+    try:
+        yield
+    finally:
+        _deleting_files_separately.active = False
+
 
 def generate_hex_uuid():
     return uuid.uuid4().hex
 
 
+def sharded_name(file_hex):
+    """Return the name a file is stored under, spread over two levels of
+    directories by the start of its hex so no one directory grows too big.
+    The uploaded filename is kept on the row rather than in the name."""
+    return f"uploads/{file_hex[:2]}/{file_hex[2:4]}/{file_hex}"
+
+
+def upload_path(instance, filename):
+    file_hex = getattr(instance, "file_hex", None) or generate_hex_uuid()
+    return sharded_name(file_hex)
+
+
+HASH_ALGORITHM_CHOICES = [
+    ("md5", "MD5"),
+    ("sha1", "SHA-1"),
+    ("sha256", "SHA-256"),
+    ("sha512", "SHA-512"),
+    ("blake2b", "BLAKE2b"),
+    ("blake2s", "BLAKE2s"),
+]
+
+
+VERIFY_STATUS_CHOICES = [
+    ("ok", "OK"),
+    ("mismatch", "Hash mismatch"),
+    ("missing", "Missing"),
+]
+
+
+def default_hash_algorithm():
+    return settings.FILE_HASH_ALGORITHM
+
+
+def hash_algorithm_field():
+    """The algorithm a file_hash was calculated with. Stored with the hash so
+    files hashed before FILE_HASH_ALGORITHM changed can still be checked."""
+    return models.CharField(
+        max_length=16,
+        choices=HASH_ALGORITHM_CHOICES,
+        default=default_hash_algorithm,
+    )
+
+
+def zip_member(obj, name, modified):
+    """Return a ZipMember for a FileUpload or BundleFile, caching the CRC32
+    on the row once it has been calculated."""
+    size = obj.file_size
+    if size is None:
+        size = obj.file_content.size
+
+    def save_crc32(crc32):
+        obj.file_crc32 = crc32
+        type(obj).objects.filter(pk=obj.pk).update(file_crc32=crc32)
+
+    return ZipMember(
+        name,
+        obj.file_content,
+        size,
+        modified,
+        crc32=obj.file_crc32,
+        save_crc32=save_crc32,
+    )
+
+
+def stored_files_match(storage, name, other_name, block_size=64 * 1024):
+    """Return whether two files in storage have identical content."""
+    with storage.open(name, "rb") as f, storage.open(other_name, "rb") as g:
+        while True:
+            data = f.read(block_size)
+            if data != g.read(block_size):
+                return False
+            if not data:
+                return True
+
+
+def copy_stored_file(storage, name, new_name):
+    """Copy a file in storage to new_name, replacing anything already there.
+    Local files are hard linked, so their content isn't copied."""
+    try:
+        path = storage.path(name)
+    except NotImplementedError:
+        storage.copy(name, new_name)
+        return
+    new_path = storage.path(new_name)
+    os.makedirs(os.path.dirname(new_path), exist_ok=True)
+    # Left behind by an interrupted move. Removed rather than written over,
+    # as it may be a link to the file being copied.
+    with suppress(FileNotFoundError):
+        os.remove(new_path)
+    try:
+        os.link(path, new_path)
+    except FileNotFoundError:
+        raise
+    except OSError:
+        # Not every filesystem supports hard links
+        shutil.copyfile(path, new_path)
+
+
+def move_stored_file(obj, new_name):
+    """Move the file of a FileUpload, FileBlob or BundleFile to new_name,
+    returning whether it was moved.
+
+    The file is copied first and the old name only deleted once the row has
+    been updated, so the file can be downloaded throughout. If the row was
+    changed or deleted in the meantime it is left alone and the copy
+    removed.
+    """
+    storage = obj.file_content.storage
+    name = obj.file_content.name
+    try:
+        copy_stored_file(storage, name, new_name)
+    except FileNotFoundError:
+        logger.warning("%s is missing from storage, so was not moved", name)
+        return False
+
+    model = type(obj)
+    with transaction.atomic():
+        moved = model.objects.filter(pk=obj.pk, file_content=name).update(
+            file_content=new_name
+        )
+        if moved and model is FileBlob:
+            # Every upload sharing the file names it too
+            FileUpload.objects.filter(blob=obj.pk).update(
+                file_content=new_name
+            )
+    storage.delete(name if moved else new_name)
+    return moved == 1
+
+
+class FileBlob(models.Model):
+    """A file stored once and shared by every FileUpload with the same
+    content, when DEDUPLICATE_UPLOADS is enabled.
+
+    ref_count is the number of FileUploads using the blob. The file is only
+    removed from storage once the last of them has been deleted.
+    """
+
+    file_hash = models.CharField(max_length=128)
+    file_hash_algorithm = hash_algorithm_field()
+    file_size = models.BigIntegerField()
+    file_content = models.FileField(upload_to=upload_path)
+    ref_count = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        constraints: ClassVar[list[models.BaseConstraint]] = [
+            models.UniqueConstraint(
+                fields=["file_hash", "file_hash_algorithm", "file_size"],
+                name="fileblob_unique_content",
+            ),
+        ]
+
+    def __str__(self):
+        return self.file_hash
+
+    @classmethod
+    def release(cls, blob_counts):
+        """Drop references to blobs, given as a mapping of blob pk to the
+        number of references dropped.
+
+        Blobs left without any references are deleted, and the names of their
+        files returned so they can be removed from storage.
+        """
+        names = []
+        unused_pks = []
+        with transaction.atomic():
+            blobs = (
+                cls.objects.select_for_update()
+                .filter(pk__in=blob_counts)
+                .order_by("pk")
+            )
+            for blob in blobs:
+                blob.ref_count -= min(blob_counts[blob.pk], blob.ref_count)
+                if blob.ref_count > 0:
+                    blob.save(update_fields=["ref_count"])
+                else:
+                    unused_pks.append(blob.pk)
+                    names.append(blob.file_content.name)
+            cls.objects.filter(pk__in=unused_pks).delete()
+        return names
+
+
 class FileUpload(models.Model):
     owner = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -23,15 +255,257 @@ class FileUpload(models.Model):
     filename = models.CharField(max_length=255)
     upload_datetime = models.DateTimeField()
     expiry_datetime = models.DateTimeField(null=True, blank=True)
-    file_content = models.FileField(upload_to="uploads/")
+    file_content = models.FileField(upload_to=upload_path)
     file_hex = models.CharField(
         default=generate_hex_uuid, editable=False, unique=True, max_length=32
     )
-    file_hash = models.CharField(max_length=32, null=True, blank=True)
+    file_hash = models.CharField(max_length=128, null=True, blank=True)
+    file_hash_algorithm = hash_algorithm_field()
+    file_size = models.BigIntegerField(null=True, blank=True)
+    # Needed to zip the file. Calculated the first time the file is zipped.
+    file_crc32 = models.BigIntegerField(null=True, blank=True)
+    # Set when the file is stored once and shared with other uploads of the
+    # same content. file_content then names the blob's file.
+    blob = models.ForeignKey(
+        FileBlob,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name="file_uploads",
+    )
+    # Bundles have no file_content of their own. They are made up of the
+    # BundleFiles uploaded together, which are zipped when downloaded.
+    is_bundle = models.BooleanField(default=False)
+    # Written in batches by downloadstats, so can lag behind by up to
+    # DOWNLOAD_STATS_FLUSH_INTERVAL.
+    download_count = models.PositiveIntegerField(default=0)
+    bytes_served = models.BigIntegerField(default=0)
+    last_download_datetime = models.DateTimeField(null=True, blank=True)
+    # Set by the verifyfiles command, which checks the stored file still
+    # matches file_hash.
+    last_verified_datetime = models.DateTimeField(null=True, blank=True)
+    verify_status = models.CharField(
+        max_length=16, choices=VERIFY_STATUS_CHOICES, blank=True
+    )
+
+    class Meta:
+        indexes: ClassVar[list[models.Index]] = [
+            # A user's file list, filtered by expiry and ordered by upload
+            models.Index(
+                fields=["owner", "upload_datetime"],
+                name="fileupload_owner_uploaded_idx",
+            ),
+            # Counting each user's active files
+            models.Index(
+                fields=["owner", "expiry_datetime"],
+                name="fileupload_owner_expiry_idx",
+            ),
+            # Finding expired files. Files without expiry never expire, so
+            # are left out of the index.
+            models.Index(
+                fields=["expiry_datetime"],
+                name="fileupload_expiry_idx",
+                condition=models.Q(expiry_datetime__isnull=False),
+            ),
+        ]
 
     def __str__(self):
         return self.filename
 
+    def save(self, *args, **kwargs):
+        # Store the size so pages showing it don't need to ask storage
+        if self.file_size is None and self.file_content:
+            self.file_size = self.file_content.size
+        super().save(*args, **kwargs)
+
+    def finish_upload(self):
+        """Deduplicate a new upload, or queue it for the processfiles worker
+        if BACKGROUND_FILE_PROCESSING is enabled."""
+        if settings.BACKGROUND_FILE_PROCESSING:
+            FileProcessingJob.objects.get_or_create(file_upload=self)
+        else:
+            self.deduplicate()
+
+    @property
+    def processing_pending(self):
+        return (
+            hasattr(self, "processing_job")
+            and not self.processing_job.has_failed()
+        )
+
+    @property
+    def processing_failed(self):
+        return (
+            hasattr(self, "processing_job")
+            and self.processing_job.has_failed()
+        )
+
+    @staticmethod
+    def landing_page_cache_key(file_hex):
+        return LANDING_PAGE_CACHE_KEY_PREFIX + file_hex
+
+    def clear_landing_page_cache(self):
+        cache.delete(self.landing_page_cache_key(self.file_hex))
+
+    def process_file(self):
+        """Read the stored file to fill in its hash and CRC32, if either is
+        missing, then deduplicate it."""
+        calculate_hash = not self.file_hash
+        if calculate_hash or self.file_crc32 is None:
+            hasher = self.new_file_hasher()
+            crc32 = 0
+            storage = self.file_content.storage
+            with storage.open(self.file_content.name, "rb") as f:
+                while chunk := f.read(HASH_READ_SIZE):
+                    if calculate_hash:
+                        hasher.update(chunk)
+                    crc32 = zlib.crc32(chunk, crc32)
+
+            self.file_crc32 = crc32
+            update_fields = ["file_crc32"]
+            if calculate_hash:
+                self.file_hash = hasher.hexdigest()
+                self.file_hash_algorithm = settings.FILE_HASH_ALGORITHM
+                update_fields += ["file_hash", "file_hash_algorithm"]
+            self.save(update_fields=update_fields)
+        self.deduplicate()
+
+    def deduplicate(self):
+        """Share the stored file with other uploads of the same content, if
+        DEDUPLICATE_UPLOADS is enabled.
+
+        The first upload of some content becomes the blob. Later uploads of
+        it point at the blob's file and their own copy is removed. Returns
+        True if an existing copy was used.
+        """
+        if (
+            not settings.DEDUPLICATE_UPLOADS
+            or self.blob_id is not None
+            or not self.file_hash
+            or self.file_size is None
+            or not self.file_content
+        ):
+            return False
+
+        storage = self.file_content.storage
+        stored_name = self.file_content.name
+        content = {
+            "file_hash": self.file_hash,
+            "file_hash_algorithm": self.file_hash_algorithm,
+            "file_size": self.file_size,
+        }
+        for _ in range(DEDUPLICATE_ATTEMPTS):
+            # Compared before the blob is locked, so other uploads of the
+            # content aren't held up while a large file is read
+            candidate = (
+                FileBlob.objects.filter(**content)
+                .values_list("pk", "file_content")
+                .first()
+            )
+            # Different content with the same hash keeps its own copy
+            if candidate is not None and not stored_files_match(
+                storage, candidate[1], stored_name
+            ):
+                return False
+
+            with transaction.atomic():
+                blob, created = (
+                    FileBlob.objects.select_for_update().get_or_create(
+                        **content, defaults={"file_content": stored_name}
+                    )
+                )
+                if not created:
+                    if candidate != (blob.pk, blob.file_content.name):
+                        # Replaced or moved since it was compared
+                        continue
+                    FileBlob.objects.filter(pk=blob.pk).update(
+                        ref_count=F("ref_count") + 1
+                    )
+                self.blob = blob
+                self.file_content = blob.file_content.name
+                FileUpload.objects.filter(pk=self.pk).update(
+                    blob=blob, file_content=blob.file_content.name
+                )
+            break
+        else:
+            return False
+
+        if not created:
+            storage.delete(stored_name)
+        return not created
+
+    @classmethod
+    def deduplicate_files(cls, batch_size=500):
+        """Deduplicate files uploaded before DEDUPLICATE_UPLOADS was enabled.
+
+        Returns the number of files which now share an existing copy, and the
+        number of bytes of storage freed.
+        """
+        files = cls.objects.filter(
+            blob__isnull=True,
+            is_bundle=False,
+            file_hash__isnull=False,
+            file_size__isnull=False,
+        ).order_by("pk")
+        num_shared = 0
+        bytes_freed = 0
+        for file_upload in files.iterator(chunk_size=batch_size):
+            if file_upload.deduplicate():
+                num_shared += 1
+                bytes_freed += file_upload.file_size
+        return num_shared, bytes_freed
+
+    @classmethod
+    def shard_files(cls, batch_size=500, progress=None):
+        """Move files stored before sharded names were used to their sharded
+        names, returning the number moved.
+
+        Files are moved one at a time, so this can run while Shifter is in
+        use. Files waiting for the processfiles worker are skipped, as it may
+        be deduplicating them, and are moved by a later run. Files it has
+        given up on are moved. Should not be run at the same time as the
+        deduplicatefiles command or processfiles --retry-failed.
+
+        If given, progress is called with the running total after each batch.
+        """
+        querysets = [
+            # Shared files are moved with their blob
+            FileBlob.objects.all(),
+            cls.objects.filter(blob__isnull=True).filter(
+                Q(processing_job=None)
+                | Q(processing_job__in=FileProcessingJob.failed_jobs())
+            ),
+            BundleFile.objects.all(),
+        ]
+        num_moved = 0
+        for queryset in querysets:
+            unsharded = queryset.exclude(file_content="").exclude(
+                file_content__regex=SHARDED_NAME_REGEX
+            )
+            last_pk = 0
+            while True:
+                batch = list(
+                    unsharded.filter(pk__gt=last_pk).order_by("pk")[
+                        :batch_size
+                    ]
+                )
+                if not batch:
+                    break
+                last_pk = batch[-1].pk
+
+                for obj in batch:
+                    # Blobs and BundleFiles have no hex of their own
+                    file_hex = getattr(obj, "file_hex", generate_hex_uuid())
+                    if move_stored_file(obj, sharded_name(file_hex)):
+                        num_moved += 1
+                if progress is not None:
+                    progress(num_moved)
+        return num_moved
+
+    def get_zip_stream(self):
+        """Return the zip of a bundle's files."""
+        return BundleFile.zip_stream(self.bundle_files.all())
+
     def is_expired(self):
         # Files without expiry never expire
         if self.expiry_datetime is None:
@@ -39,14 +513,20 @@ class FileUpload(models.Model):
         return self.expiry_datetime < timezone.now()
 
     @staticmethod
-    def calculate_file_hash(file_obj):
-        """Calculate MD5 hash of file content in chunks."""
-        hash_md5 = hashlib.md5()
+    def new_file_hasher(algorithm=None):
+        """Return a new hash object for calculating file hashes, using
+        FILE_HASH_ALGORITHM unless another algorithm is given."""
+        return hashlib.new(algorithm or settings.FILE_HASH_ALGORITHM)
+
+    @classmethod
+    def calculate_file_hash(cls, file_obj, algorithm=None):
+        """Calculate the hash of file content in chunks."""
+        hasher = cls.new_file_hasher(algorithm)
         file_obj.seek(0)  # Reset file pointer to start
-        for chunk in iter(lambda: file_obj.read(8192), b""):
-            hash_md5.update(chunk)
+        for chunk in iter(lambda: file_obj.read(HASH_READ_SIZE), b""):
+            hasher.update(chunk)
         file_obj.seek(0)  # Reset for subsequent operations
-        return hash_md5.hexdigest()
+        return hasher.hexdigest()
 
     @classmethod
     def get_expired_files(cls):
@@ -66,13 +546,853 @@ class FileUpload(models.Model):
         )
 
     @classmethod
-    def delete_expired_files(cls):
-        files = cls.get_expired_files()
+    def add_download_stats(cls, stats):
+        """Add to the download stats of several files at once.
+
+        stats maps file pks to (downloads, bytes served, last download time)
+        tuples. Files deleted since they were downloaded are skipped.
+        """
+        with transaction.atomic():
+            for pk, (downloads, num_bytes, last_download) in stats.items():
+                last_download = Value(last_download)
+                cls.objects.filter(pk=pk).update(
+                    download_count=F("download_count") + downloads,
+                    bytes_served=F("bytes_served") + num_bytes,
+                    # Batches from other processes may be written out of order
+                    last_download_datetime=Greatest(
+                        Coalesce("last_download_datetime", last_download),
+                        last_download,
+                    ),
+                )
+
+    @classmethod
+    def delete_expired_files(cls, batch_size=500, workers=4, progress=None):
+        """Delete expired files in batches, returning the number deleted.
+
+        Expired rows are walked in primary key order, a batch at a time. Each
+        batch of rows is deleted in its own short transaction, then their
+        files are removed from storage using a pool of worker threads, or a
+        single request for storages like S3 which can delete many files at
+        once. Rows are deleted first so a failed storage delete leaves an
+        orphaned file rather than a row pointing at a missing one.
+
+        If given, progress is called with the running total after each batch.
+        """
+        started = time.perf_counter()
+        storage = cls._meta.get_field("file_content").storage
+
+        def delete_stored_file(name):
+            try:
+                storage.delete(name)
+            except Exception:
+                logger.exception("Failed to delete %s from storage", name)
+
+        def delete_stored_files(names):
+            if hasattr(storage, "delete_many"):
+                # Object stores can delete many files in one request
+                try:
+                    storage.delete_many(names)
+                except Exception:
+                    logger.exception(
+                        "Failed to delete %d file(s) from storage", len(names)
+                    )
+            else:
+                # Drain the results so every delete finishes before the
+                # next batch is selected.
+                list(executor.map(delete_stored_file, names))
+
+        num_deleted = 0
+        last_pk = 0
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            while True:
+                pks = list(
+                    cls.get_expired_files()
+                    .filter(pk__gt=last_pk)
+                    .order_by("pk")
+                    .values_list("pk", flat=True)[:batch_size]
+                )
+                if not pks:
+                    break
+                last_pk = pks[-1]
+
+                with transaction.atomic():
+                    # Check the rows are still expired, in case the expiry
+                    # was changed since the batch was selected
+                    batch = (
+                        cls.get_expired_files()
+                        .filter(pk__in=pks)
+                        .select_for_update()
+                    )
+                    batch_pks, names = [], []
+                    blob_counts = Counter()
+                    storage_freed = Counter()
+                    for pk, name, blob_pk, owner_pk, size in batch.values_list(
+                        "pk", "file_content", "blob", "owner", "file_size"
+                    ):
+                        batch_pks.append(pk)
+                        storage_freed[owner_pk] -= size or 0
+                        if blob_pk is None:
+                            names.append(name)
+                        else:
+                            blob_counts[blob_pk] += 1
+                    names += BundleFile.objects.filter(
+                        bundle__in=batch_pks
+                    ).values_list("file_content", flat=True)
+                    with files_deleted_separately():
+                        batch.delete()
+                    get_user_model().add_storage_used(storage_freed)
+                    # Shared files are only deleted with their last upload
+                    names += FileBlob.release(blob_counts)
+
+                # Bundles have no file of their own
+                delete_stored_files(list(filter(None, names)))
+
+                num_deleted += len(batch_pks)
+                if progress is not None:
+                    progress(num_deleted)
+
+        CLEANUP_DURATION.observe(time.perf_counter() - started)
+        CLEANUP_FILES_DELETED.observe(num_deleted)
+        return num_deleted
+
+    @classmethod
+    def create_bundle(
+        cls, owner, bundle_hex, filename, expiry_datetime, bundle_files
+    ):
+        """Create a bundle from the given BundleFiles, uploaded with
+        bundle_hex. The bundle uses bundle_hex as its file_hex."""
+        with transaction.atomic():
+            bundle = cls.objects.create(
+                owner=owner,
+                filename=filename,
+                upload_datetime=timezone.now(),
+                expiry_datetime=expiry_datetime,
+                file_hex=bundle_hex,
+                file_size=BundleFile.zip_stream(bundle_files).size,
+                is_bundle=True,
+            )
+            BundleFile.objects.filter(
+                pk__in=[f.pk for f in bundle_files]
+            ).update(bundle=bundle)
+        return bundle
+
+    @classmethod
+    def backfill_file_sizes(cls, batch_size=500):
+        """Store the size of files uploaded before sizes were recorded.
+
+        Returns the number of files updated and the number skipped because
+        the file is missing from storage.
+        """
+        files = cls.objects.filter(file_size__isnull=True).order_by("pk")
+        batch = []
+        num_updated = 0
+        num_missing = 0
+
+        def save_batch():
+            # Files without a size haven't been counted in their owner's
+            # storage used yet.
+            storage_added = Counter()
+            for file_upload in batch:
+                storage_added[file_upload.owner_id] += file_upload.file_size
+            with transaction.atomic():
+                cls.objects.bulk_update(batch, ["file_size"])
+                get_user_model().add_storage_used(storage_added)
+
+        for file_upload in files.iterator(chunk_size=batch_size):
+            try:
+                file_upload.file_size = file_upload.file_content.size
+            except OSError:
+                num_missing += 1
+                continue
+            batch.append(file_upload)
+            if len(batch) >= batch_size:
+                save_batch()
+                num_updated += len(batch)
+                batch = []
+        if batch:
+            save_batch()
+            num_updated += len(batch)
+        return num_updated, num_missing
+
+    @classmethod
+    def verify_files(
+        cls,
+        workers=2,
+        max_rate=None,
+        min_interval=timedelta(hours=12),
+        batch_size=100,
+        progress=None,
+    ):
+        """Hash stored files again to check they still match file_hash,
+        recording the result and when it was checked on each upload, or
+        BundleFile for files in a bundle. Returns a Counter of the number of
+        files given each verify_status.
+
+        Files verified within min_interval are skipped, so a run which was
+        stopped part way through carries on where it left off. Local files
+        are hashed by a pool of worker processes, and files in other
+        storages, such as S3, by a pool of threads. Between them the workers
+        read at most max_rate bytes per second, if given.
+
+        If given, progress is called with the running total after each batch.
+        """
+        storage = cls._meta.get_field("file_content").storage
+        try:
+            storage.path("")
+        except NotImplementedError:
+            local = False
+            executor = ThreadPoolExecutor(max_workers=workers)
+        else:
+            local = True
+            executor = ProcessPoolExecutor(max_workers=workers)
+        # Each worker reads at an equal share of the rate
+        worker_rate = max_rate / workers if max_rate else None
+
+        def hash_stored_file(name, algorithm):
+            try:
+                with storage.open(name, "rb") as f:
+                    return hash_file(f, algorithm, HASH_READ_SIZE, worker_rate)
+            except FileNotFoundError:
+                return None
+
+        not_recently_verified = Q(last_verified_datetime__isnull=True) | Q(
+            last_verified_datetime__lt=timezone.now() - min_interval
+        )
+        # A bundle's own upload has no file, but each file in it is stored
+        # separately and checked as well.
+        querysets = [
+            cls.objects.filter(
+                not_recently_verified, is_bundle=False, file_hash__isnull=False
+            ),
+            BundleFile.objects.filter(
+                not_recently_verified, file_hash__isnull=False
+            ),
+        ]
+        counts = Counter()
+        with executor:
+            for files in querysets:
+                last_pk = 0
+                while True:
+                    batch = list(
+                        files.filter(pk__gt=last_pk)
+                        .order_by("pk")
+                        .values_list(
+                            "pk",
+                            "file_content",
+                            "file_hash",
+                            "file_hash_algorithm",
+                        )[:batch_size]
+                    )
+                    if not batch:
+                        break
+                    last_pk = batch[-1][0]
+
+                    # Uploads sharing a file only need it hashed once
+                    expected = {}
+                    for _, name, file_hash, algorithm in batch:
+                        expected[name] = (file_hash, algorithm)
+                    futures = {}
+                    for name, (_, algorithm) in expected.items():
+                        if local:
+                            futures[name] = executor.submit(
+                                hash_path,
+                                storage.path(name),
+                                algorithm,
+                                HASH_READ_SIZE,
+                                worker_rate,
+                            )
+                        else:
+                            futures[name] = executor.submit(
+                                hash_stored_file, name, algorithm
+                            )
+
+                    names_by_status = defaultdict(list)
+                    for name, future in futures.items():
+                        try:
+                            file_hash = future.result()
+                        except Exception:
+                            # Tried again by the next run
+                            logger.exception("Failed to verify %s", name)
+                            continue
+                        if file_hash is None:
+                            status = "missing"
+                        elif file_hash == expected[name][0]:
+                            status = "ok"
+                        else:
+                            status = "mismatch"
+                        if status != "ok":
+                            logger.error(
+                                "Stored file %s failed verification: %s",
+                                name,
+                                status,
+                            )
+                        names_by_status[status].append(name)
+
+                    # Uploads whose file was moved or deleted while it was
+                    # being hashed no longer have the name, so aren't updated.
+                    now = timezone.now()
+                    with transaction.atomic():
+                        for status, names in names_by_status.items():
+                            counts[status] += files.model.objects.filter(
+                                file_content__in=names
+                            ).update(
+                                last_verified_datetime=now,
+                                verify_status=status,
+                            )
+                    if progress is not None:
+                        progress(counts.total())
+        return counts
+
+
+@receiver(pre_delete, sender=FileUpload)
+def delete_files(sender, instance, **kwargs):
+    if getattr(_deleting_files_separately, "active", False):
+        return
+    if instance.blob_id is not None:
+        # Other uploads may still be using the file
+        storage = instance.file_content.storage
+        for name in FileBlob.release({instance.blob_id: 1}):
+            storage.delete(name)
+        return
+    instance.file_content.delete(False)
+
+
+@receiver(post_save, sender=FileUpload)
+def index_filename(sender, instance, created, update_fields, **kwargs):
+    if created or update_fields is None or "filename" in update_fields:
+        get_search_backend().index(instance)
+
+
+@receiver(post_delete, sender=FileUpload)
+def remove_filename_from_index(sender, instance, **kwargs):
+    get_search_backend().remove(instance)
+
+
+@receiver(post_save, sender=FileUpload)
+def add_storage_used(sender, instance, created, **kwargs):
+    if created and instance.file_size:
+        get_user_model().add_storage_used(
+            {instance.owner_id: instance.file_size}
+        )
+
+
+@receiver(post_delete, sender=FileUpload)
+def remove_storage_used(sender, instance, **kwargs):
+    if getattr(_deleting_files_separately, "active", False):
+        return
+    if instance.file_size:
+        get_user_model().add_storage_used(
+            {instance.owner_id: -instance.file_size}
+        )
+
+
+@receiver(post_save, sender=FileUpload)
+@receiver(post_delete, sender=FileUpload)
+def clear_landing_page_cache(sender, instance, **kwargs):
+    instance.clear_landing_page_cache()
+    # Clear again once committed, in case the old page was cached by another
+    # request before then.
+    transaction.on_commit(instance.clear_landing_page_cache)
+
+
+class BundleFile(models.Model):
+    """One of the files making up a bundle.
+
+    Each file is uploaded separately, tagged with the bundle hex, and is only
+    attached to its bundle FileUpload once all of them have been received.
+    """
+
+    STALE_AFTER = timedelta(days=1)
+
+    bundle = models.ForeignKey(
+        FileUpload,
+        null=True,
+        blank=True,
+        on_delete=models.CASCADE,
+        related_name="bundle_files",
+    )
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        null=True,
+        on_delete=models.SET_NULL,
+    )
+    bundle_hex = models.CharField(max_length=32, db_index=True)
+    filename = models.CharField(max_length=255)
+    file_content = models.FileField(upload_to=upload_path)
+    file_hash = models.CharField(max_length=128, null=True, blank=True)
+    file_hash_algorithm = hash_algorithm_field()
+    file_size = models.BigIntegerField()
+    file_crc32 = models.BigIntegerField(null=True, blank=True)
+    created_datetime = models.DateTimeField(default=timezone.now)
+    # Set by the verifyfiles command, as for FileUpload
+    last_verified_datetime = models.DateTimeField(null=True, blank=True)
+    verify_status = models.CharField(
+        max_length=16, choices=VERIFY_STATUS_CHOICES, blank=True
+    )
+
+    def __str__(self):
+        return self.filename
+
+    @staticmethod
+    def zip_stream(bundle_files):
+        """Return the zip of a bundle's files, in the order uploaded."""
+        bundle_files = sorted(bundle_files, key=lambda f: f.pk)
+        names = unique_names([f.filename for f in bundle_files])
+        return ZipStream(
+            [
+                zip_member(f, name, f.created_datetime)
+                for name, f in zip(names, bundle_files, strict=True)
+            ]
+        )
+
+    @classmethod
+    def delete_stale_files(cls):
+        """Delete files uploaded for a bundle which was never completed."""
+        files = cls.objects.filter(
+            bundle__isnull=True,
+            created_datetime__lte=timezone.now() - cls.STALE_AFTER,
+        )
         num_files = files.count()
         files.delete()
         return num_files
 
 
-@receiver(pre_delete, sender=FileUpload)
-def delete_files(sender, instance, **kwargs):
+@receiver(pre_delete, sender=BundleFile)
+def delete_bundle_file(sender, instance, **kwargs):
+    if getattr(_deleting_files_separately, "active", False):
+        return
     instance.file_content.delete(False)
+
+
+class FileCollection(models.Model):
+    """A set of a user's files shared with a single link, downloaded as one
+    zip. Files which have expired are left out of the zip."""
+
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+    )
+    collection_hex = models.CharField(
+        default=generate_hex_uuid, editable=False, unique=True, max_length=32
+    )
+    name = models.CharField(max_length=250)
+    files = models.ManyToManyField(FileUpload, related_name="collections")
+    created_datetime = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return self.name
+
+    @property
+    def filename(self):
+        return self.name + ".zip"
+
+    def get_files(self):
+        return (
+            FileUpload.get_non_expired_files()
+            .filter(collections=self)
+            .order_by("upload_datetime", "pk")
+        )
+
+    def zip_stream(self, files):
+        names = unique_names([f.filename for f in files])
+        return ZipStream(
+            [
+                zip_member(f, name, f.upload_datetime)
+                for name, f in zip(names, files, strict=True)
+            ]
+        )
+
+
+class FileProcessingJob(models.Model):
+    """An upload waiting to be processed by the processfiles worker, when
+    BACKGROUND_FILE_PROCESSING is enabled.
+
+    Reading the file to calculate its hash, CRC32 and whether it is a
+    duplicate is left to the worker, so uploads finish as soon as the file
+    has been received. Workers claim a job for LEASE, so a job abandoned by
+    a worker that stopped part way through is picked up again later. Jobs
+    which fail MAX_ATTEMPTS times are shown as failed, and are only run
+    again by processfiles --retry-failed.
+    """
+
+    LEASE = timedelta(minutes=30)
+    RETRY_DELAY = timedelta(minutes=5)
+    MAX_ATTEMPTS = 3
+
+    file_upload = models.OneToOneField(
+        FileUpload,
+        on_delete=models.CASCADE,
+        related_name="processing_job",
+    )
+    created_datetime = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    claimed_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    def __str__(self):
+        return str(self.file_upload)
+
+    def has_failed(self):
+        """Whether the job has used up its attempts, so won't be run again
+        unless retried."""
+        return self.attempts >= self.MAX_ATTEMPTS and (
+            self.claimed_until is None or self.claimed_until < timezone.now()
+        )
+
+    @classmethod
+    def failed_jobs(cls):
+        return cls.objects.filter(
+            Q(claimed_until__isnull=True) | Q(claimed_until__lt=Now()),
+            attempts__gte=cls.MAX_ATTEMPTS,
+        )
+
+    @classmethod
+    def retry_failed(cls):
+        """Queue failed jobs to be run again, returning the number queued."""
+        return cls.failed_jobs().update(attempts=0, claimed_until=None)
+
+    @classmethod
+    def claim_next(cls):
+        """Claim the oldest job not being worked on, or return None if there
+        are no jobs waiting."""
+        now = timezone.now()
+        available = cls.objects.filter(
+            Q(claimed_until__isnull=True) | Q(claimed_until__lt=now),
+            attempts__lt=cls.MAX_ATTEMPTS,
+        )
+        while True:
+            job = available.order_by("pk").first()
+            if job is None:
+                return None
+            # Only one worker's update matches, if several pick the same job
+            claimed = available.filter(pk=job.pk).update(
+                claimed_until=now + cls.LEASE, attempts=F("attempts") + 1
+            )
+            if claimed:
+                job.refresh_from_db()
+                return job
+
+    def run(self):
+        """Process the job's file, returning whether it succeeded. Failed jobs
+        are retried after RETRY_DELAY, up to MAX_ATTEMPTS times."""
+        try:
+            self.file_upload.process_file()
+        except Exception as e:
+            logger.exception("Failed to process %s", self.file_upload)
+            self.last_error = str(e)
+            if self.attempts >= self.MAX_ATTEMPTS:
+                logger.error(
+                    "Gave up processing %s after %d attempts",
+                    self.file_upload,
+                    self.attempts,
+                )
+                self.claimed_until = None
+            else:
+                self.claimed_until = timezone.now() + self.RETRY_DELAY
+            self.save(update_fields=["last_error", "claimed_until"])
+            return False
+        self.delete()
+        return True
+
+    @classmethod
+    def process_pending(cls, limit=None):
+        """Run waiting jobs until there are none left, or limit have been run.
+        Returns the number of jobs run."""
+        num_run = 0
+        while limit is None or num_run < limit:
+            job = cls.claim_next()
+            if job is None:
+                break
+            job.run()
+            num_run += 1
+        return num_run
+
+
+class StorageQuotaExceeded(Exception):
+    """Raised when completing an upload would take its owner over their
+    storage quota."""
+
+
+def storage_left(user):
+    """Return the number of bytes the user can still upload, or None if they
+    have no quota.
+
+    Chunked uploads still in progress count towards the quota, so several
+    started at once can't go over it between them.
+    """
+    quota = user.get_storage_quota()
+    if quota is None:
+        return None
+    return quota - user.storage_used - ChunkedUpload.storage_reserved(user)
+
+
+class ChunkedUpload(models.Model):
+    """An in-progress upload sent as a series of chunks.
+
+    Chunks are appended to a partial file in storage as they arrive, so an
+    interrupted upload can be resumed from the last stored offset. Once all
+    bytes have been received the partial file is moved into place and a
+    FileUpload is created using the same hex, or a BundleFile if the upload
+    is part of a bundle.
+
+    Storages which support multipart uploads, such as S3, are sent each
+    chunk as a part of the file instead, which are combined once the last
+    chunk arrives.
+    """
+
+    CHUNK_READ_SIZE = 64 * 1024
+    STALE_AFTER = timedelta(days=1)
+
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+    )
+    upload_id = models.CharField(
+        default=generate_hex_uuid, editable=False, unique=True, max_length=32
+    )
+    filename = models.CharField(max_length=255, blank=True)
+    bundle_hex = models.CharField(max_length=32, blank=True)
+    upload_length = models.BigIntegerField()
+    offset = models.BigIntegerField(default=0)
+    expiry_datetime = models.DateTimeField(null=True, blank=True)
+    created_datetime = models.DateTimeField(default=timezone.now)
+    # Set once the first chunk is sent to a storage using multipart uploads
+    multipart_upload_id = models.CharField(max_length=255, blank=True)
+    num_parts = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return self.filename or self.upload_id
+
+    @property
+    def storage(self):
+        return FileUpload._meta.get_field("file_content").storage
+
+    @property
+    def partial_name(self):
+        return f"partial_uploads/{self.upload_id}"
+
+    @property
+    def uses_multipart_upload(self):
+        return hasattr(self.storage, "create_multipart_upload")
+
+    @property
+    def multipart_name(self):
+        # Multipart uploads are written straight to the file's final name,
+        # which is unique as it contains the upload ID.
+        return sharded_name(self.upload_id)
+
+    def is_complete(self):
+        return self.offset >= self.upload_length
+
+    def write_chunk(self, stream, length):
+        """Append up to length bytes read from stream to the partial file.
+
+        Returns False if the offset was moved by another request before the
+        chunk could be written, in which case the chunk must be resent.
+        """
+        if self.uses_multipart_upload:
+            return self.upload_part(stream, length)
+
+        path = self.storage.path(self.partial_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        start = self.offset
+        with open(path, "ab") as partial_file:
+            # Requests writing to the same upload, such as a retry while the
+            # first attempt is still running, take turns. Otherwise both
+            # would append their chunk to the file.
+            fcntl.flock(partial_file, fcntl.LOCK_EX)
+            if (
+                ChunkedUpload.objects.filter(pk=self.pk)
+                .values_list("offset", flat=True)
+                .first()
+                != start
+            ):
+                return False
+
+            # Drop anything beyond the stored offset, left over from a
+            # previous chunk that failed part way through.
+            partial_file.truncate(start)
+            while self.offset - start < length:
+                data = stream.read(
+                    min(self.CHUNK_READ_SIZE, length - (self.offset - start))
+                )
+                if not data:
+                    break
+                partial_file.write(data)
+                self.offset += len(data)
+            partial_file.flush()
+
+            # Saved before the lock is released, so the next writer sees it
+            updated = ChunkedUpload.objects.filter(
+                pk=self.pk, offset=start
+            ).update(offset=self.offset)
+        return updated == 1
+
+    def upload_part(self, stream, length):
+        """Send up to length bytes read from stream as the next part of a
+        multipart upload.
+
+        A part can't be added to once sent, so a chunk which is cut short is
+        dropped and must be resent, unless it is the end of the file.
+        """
+        if not self.multipart_upload_id:
+            upload_id = self.storage.create_multipart_upload(
+                self.multipart_name
+            )
+            if ChunkedUpload.objects.filter(
+                pk=self.pk, multipart_upload_id=""
+            ).update(multipart_upload_id=upload_id):
+                self.multipart_upload_id = upload_id
+            else:
+                # Another request for this upload started one first
+                self.storage.abort_multipart_upload(
+                    self.multipart_name, upload_id
+                )
+                self.refresh_from_db()
+
+        start = self.offset
+        with tempfile.SpooledTemporaryFile(
+            max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE
+        ) as part:
+            received = 0
+            while received < length:
+                data = stream.read(
+                    min(self.CHUNK_READ_SIZE, length - received)
+                )
+                if not data:
+                    break
+                part.write(data)
+                received += len(data)
+            if received == 0 or (
+                received < length and start + received < self.upload_length
+            ):
+                return True
+            part.seek(0)
+            part_number = self.num_parts + 1
+            self.storage.upload_part(
+                self.multipart_name,
+                self.multipart_upload_id,
+                part_number,
+                part,
+            )
+
+        self.offset = start + received
+        self.num_parts = part_number
+        updated = ChunkedUpload.objects.filter(
+            pk=self.pk, offset=start
+        ).update(offset=self.offset, num_parts=self.num_parts)
+        return updated == 1
+
+    def complete(self):
+        """Move the assembled file into place and create its FileUpload, or
+        BundleFile for part of a bundle.
+
+        If that fails, the file and the upload are removed, and the upload
+        has to be started again.
+        """
+        if self.uses_multipart_upload:
+            name = self.multipart_name
+            self.storage.complete_multipart_upload(
+                name, self.multipart_upload_id
+            )
+            # Nothing is left to discard when this is deleted
+            self.multipart_upload_id = ""
+        else:
+            field = FileUpload._meta.get_field("file_content")
+            name = self.storage.get_available_name(
+                sharded_name(self.upload_id), max_length=field.max_length
+            )
+            final_path = self.storage.path(name)
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            os.replace(self.storage.path(self.partial_name), final_path)
+
+        pk = self.pk
+        try:
+            # Calculated by the processfiles worker if processing in
+            # background
+            file_hash = None
+            if not settings.BACKGROUND_FILE_PROCESSING:
+                with self.storage.open(name, "rb") as f:
+                    file_hash = FileUpload.calculate_file_hash(f)
+
+            with transaction.atomic():
+                if self.bundle_hex:
+                    file_upload = BundleFile.objects.create(
+                        owner=self.owner,
+                        bundle_hex=self.bundle_hex,
+                        filename=self.filename or "upload",
+                        file_content=name,
+                        file_hash=file_hash,
+                        file_size=self.upload_length,
+                    )
+                else:
+                    self.check_storage_quota()
+                    file_upload = FileUpload.objects.create(
+                        owner=self.owner,
+                        filename=self.filename or "upload",
+                        upload_datetime=timezone.now(),
+                        expiry_datetime=self.expiry_datetime,
+                        file_content=name,
+                        file_hex=self.upload_id,
+                        file_hash=file_hash,
+                        file_size=self.upload_length,
+                    )
+                self.delete()
+        except Exception:
+            # Once moved, the file can't be sent again to finish the upload,
+            # so the upload is removed rather than left stuck
+            self.storage.delete(name)
+            # Set back if the transaction deleting it failed to commit
+            self.pk = pk
+            self.delete()
+            raise
+
+        if not self.bundle_hex:
+            file_upload.finish_upload()
+        return file_upload
+
+    def check_storage_quota(self):
+        """Raise StorageQuotaExceeded if the owner doesn't have room for this
+        file.
+
+        The quota is checked when the upload starts, but uploads started at
+        the same time could each pass that check, so it is checked again
+        here. The owner's row stays locked until the FileUpload is created,
+        so uploads finishing at the same time are checked one at a time.
+        """
+        owner = (
+            get_user_model().objects.select_for_update().get(pk=self.owner_id)
+        )
+        quota = owner.get_storage_quota()
+        if (
+            quota is not None
+            and owner.storage_used + self.upload_length > quota
+        ):
+            raise StorageQuotaExceeded()
+
+    @classmethod
+    def storage_reserved(cls, owner):
+        """Return the total size of the owner's uploads still in progress."""
+        return cls.objects.filter(owner=owner).aggregate(
+            total=Coalesce(Sum("upload_length"), 0)
+        )["total"]
+
+    @classmethod
+    def delete_stale_uploads(cls):
+        """Delete uploads which have not been completed in time."""
+        uploads = cls.objects.filter(
+            created_datetime__lte=timezone.now() - cls.STALE_AFTER
+        )
+        num_uploads = uploads.count()
+        uploads.delete()
+        return num_uploads
+
+
+@receiver(pre_delete, sender=ChunkedUpload)
+def delete_partial_file(sender, instance, **kwargs):
+    if instance.multipart_upload_id:
+        instance.storage.abort_multipart_upload(
+            instance.multipart_name, instance.multipart_upload_id
+        )
+    elif not instance.uses_multipart_upload:
+        instance.storage.delete(instance.partial_name)
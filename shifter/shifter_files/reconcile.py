@@ -0,0 +1,191 @@
+"""
+Finds drift between the files in storage and the rows naming them: files
+left behind with no row, and rows whose file is missing.
+
+Both sides are streamed in name order and merged, so neither the storage
+listing nor the table is ever held in memory as a whole.
+"""
+
+import heapq
+import os
+from datetime import UTC, datetime, timedelta
+from itertools import groupby
+from operator import itemgetter
+
+from django.db import connections
+from django.db.models import F, Q
+from django.db.models.functions import Collate
+from django.utils import timezone
+
+from .models import BundleFile, FileBlob, FileUpload
+
+UPLOAD_DIRECTORY = "uploads"
+
+
+def iter_stored_files(storage, directory):
+    """Yield the name, size and modification time of each file under
+    directory, sorted by name."""
+    if hasattr(storage, "iter_files"):
+        yield from storage.iter_files(directory)
+        return
+
+    def walk(path, prefix):
+        try:
+            with os.scandir(path) as it:
+                entries = list(it)
+        except FileNotFoundError:
+            return
+        # Sort as full names would be, with a directory's contents placed
+        # by the "/" which follows its name.
+        entries.sort(
+            key=lambda e: (
+                e.name + ("/" if e.is_dir(follow_symlinks=False) else "")
+            )
+        )
+        for entry in entries:
+            name = prefix + entry.name
+            if entry.is_dir(follow_symlinks=False):
+                yield from walk(entry.path, name + "/")
+                continue
+            stat = entry.stat(follow_symlinks=False)
+            # Linking or moving a file changes its ctime but not its mtime
+            modified = max(stat.st_mtime, stat.st_ctime)
+            yield name, stat.st_size, datetime.fromtimestamp(modified, UTC)
+
+    yield from walk(storage.path(directory), directory + "/")
+
+
+def iter_referenced_names(directory, batch_size=1000):
+    """Yield the name of every stored file named by a row, sorted by name.
+    A name shared by several rows may be yielded more than once."""
+    querysets = [
+        # Uploads sharing a file are covered by their blob
+        FileUpload.objects.filter(blob__isnull=True),
+        FileBlob.objects.all(),
+        BundleFile.objects.all(),
+    ]
+    streams = []
+    for queryset in querysets:
+        if connections[queryset.db].vendor == "postgresql":
+            # Sort by code point, as Python and S3 do, rather than by the
+            # database's locale
+            name = Collate("file_content", "C")
+        else:
+            name = F("file_content")
+        streams.append(
+            queryset.filter(file_content__startswith=directory + "/")
+            .annotate(name=name)
+            .order_by("name")
+            .values_list("name", flat=True)
+            .iterator(chunk_size=batch_size)
+        )
+    return heapq.merge(*streams)
+
+
+def referenced(names):
+    """Return which of names are still named by a row."""
+    found = set()
+    for model in (FileUpload, FileBlob, BundleFile):
+        found.update(
+            model.objects.filter(file_content__in=names).values_list(
+                "file_content", flat=True
+            )
+        )
+    return found
+
+
+def delete_rows(names):
+    """Delete the rows naming files which are missing from storage. A bundle
+    missing any of its files is deleted as a whole."""
+    bundle_pks = BundleFile.objects.filter(
+        file_content__in=names, bundle__isnull=False
+    ).values("bundle")
+    FileUpload.objects.filter(
+        Q(file_content__in=names) | Q(pk__in=bundle_pks)
+    ).delete()
+    BundleFile.objects.filter(file_content__in=names).delete()
+    FileBlob.objects.filter(file_content__in=names).delete()
+
+
+def reconcile_storage(
+    remove=True, min_age=timedelta(days=1), batch_size=1000, report=None
+):
+    """Find stored files without a row and rows whose file is missing,
+    removing both unless remove is False.
+
+    Returns the number of orphaned files and their total size, and the
+    number of missing files.
+
+    Files changed within min_age are left alone, as they may belong to an
+    upload which hasn't been saved yet. Each file found is checked again
+    before it is counted, in case an upload or delete finished while the
+    scan was running. If given, report is called with "orphaned" or
+    "missing" and the name of each file found.
+    """
+    storage = FileUpload._meta.get_field("file_content").storage
+    cutoff = timezone.now() - min_age
+    num_orphaned = 0
+    bytes_orphaned = 0
+    num_missing = 0
+    orphaned = {}
+    missing = []
+
+    def check_orphaned():
+        nonlocal num_orphaned, bytes_orphaned
+        still_named = referenced(orphaned)
+        names = [n for n in orphaned if n not in still_named]
+        if remove and names:
+            if hasattr(storage, "delete_many"):
+                storage.delete_many(names)
+            else:
+                for name in names:
+                    storage.delete(name)
+        for name in names:
+            num_orphaned += 1
+            bytes_orphaned += orphaned[name]
+            if report is not None:
+                report("orphaned", name)
+        orphaned.clear()
+
+    def check_missing():
+        nonlocal num_missing
+        still_named = referenced(missing)
+        names = [
+            n for n in missing if n in still_named and not storage.exists(n)
+        ]
+        if remove and names:
+            delete_rows(names)
+        for name in names:
+            num_missing += 1
+            if report is not None:
+                report("missing", name)
+        missing.clear()
+
+    stored = (
+        (name, (size, modified))
+        for name, size, modified in iter_stored_files(
+            storage, UPLOAD_DIRECTORY
+        )
+    )
+    named = (
+        (name, None)
+        for name in iter_referenced_names(UPLOAD_DIRECTORY, batch_size)
+    )
+    for name, entries in groupby(
+        heapq.merge(stored, named, key=itemgetter(0)), key=itemgetter(0)
+    ):
+        stats = [stat for _, stat in entries]
+        stored_stat = next((s for s in stats if s is not None), None)
+        if stored_stat is None:
+            missing.append(name)
+            if len(missing) >= batch_size:
+                check_missing()
+        elif len(stats) == 1:
+            size, modified = stored_stat
+            if modified < cutoff:
+                orphaned[name] = size
+                if len(orphaned) >= batch_size:
+                    check_orphaned()
+    check_orphaned()
+    check_missing()
+    return num_orphaned, bytes_orphaned, num_missing
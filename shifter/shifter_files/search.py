@@ -0,0 +1,67 @@
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = "shifter_files_fileupload_fts"
+
+# The trigram tokenizer can only match queries of at least this many
+# characters.
+FTS_MIN_QUERY_LENGTH = 3
+
+
+class ContainsSearchBackend:
+    """Search filenames with a case-insensitive substring match.
+
+    On Postgres this is served by the pg_trgm GIN index on the filename,
+    added in migration 0007. Other databases fall back to a scan.
+    """
+
+    def filter(self, queryset, query):
+        return queryset.filter(filename__icontains=query)
+
+    def index(self, file_upload):
+        pass
+
+    def remove(self, file_upload):
+        pass
+
+
+class SQLiteFTSSearchBackend(ContainsSearchBackend):
+    """Search filenames using an SQLite FTS5 table with the trigram tokenizer,
+    which matches substrings case-insensitively like icontains does.
+
+    The table is kept in sync with FileUpload by the signal receivers in
+    models.py, within the same transaction as the change to the file.
+    """
+
+    def filter(self, queryset, query):
+        if len(query) < FTS_MIN_QUERY_LENGTH:
+            return super().filter(queryset, query)
+        # Quote the query so it is matched as a phrase rather than parsed as
+        # FTS5 query syntax
+        phrase = '"' + query.replace('"', '""') + '"'
+        return queryset.filter(
+            pk__in=RawSQL(
+                f"SELECT rowid FROM {FTS_TABLE} WHERE filename MATCH %s",
+                [phrase],
+            )
+        )
+
+    def index(self, file_upload):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT OR REPLACE INTO {FTS_TABLE} (rowid, filename) "
+                "VALUES (%s, %s)",
+                [file_upload.pk, file_upload.filename],
+            )
+
+    def remove(self, file_upload):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [file_upload.pk]
+            )
+
+
+def get_search_backend():
+    if connection.vendor == "sqlite":
+        return SQLiteFTSSearchBackend()
+    return ContainsSearchBackend()
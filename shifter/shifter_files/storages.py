@@ -0,0 +1,231 @@
+"""
+Storage for uploaded files in an S3 compatible bucket, used when
+STORAGE_BACKEND is s3.
+"""
+
+import io
+
+from botocore.exceptions import ClientError
+from django.core.files.base import File
+from storages.backends.s3 import S3Storage as BaseS3Storage
+from storages.utils import clean_name
+
+# S3 requires every part of a multipart upload except the last to be at
+# least this big.
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+# Size of the parts written by MultipartUploadWriter. S3 allows up to 10,000
+# parts, so this allows files of up to about 80GB.
+PART_SIZE = 8 * 1024 * 1024
+
+# The most keys a single DeleteObjects request can delete.
+DELETE_BATCH_SIZE = 1000
+
+
+class S3Storage(BaseS3Storage):
+    """S3 storage that can write a file a part at a time as it is received,
+    read a file as a stream rather than downloading it first, and delete
+    files in batches."""
+
+    def key(self, name):
+        return self._normalize_name(clean_name(name))
+
+    def _open(self, name, mode="rb"):
+        if mode != "rb":
+            return super()._open(name, mode)
+        try:
+            reader = S3ObjectReader(self.bucket.Object(self.key(name)))
+        except ClientError as err:
+            if err.response["ResponseMetadata"]["HTTPStatusCode"] == 404:
+                raise FileNotFoundError(f"File does not exist: {name}")
+            raise
+        return File(reader, name)
+
+    def multipart_writer(self, name):
+        return MultipartUploadWriter(self, name)
+
+    def create_multipart_upload(self, name):
+        """Start a multipart upload to name, returning its upload ID."""
+        key = self.key(name)
+        response = self.connection.meta.client.create_multipart_upload(
+            Bucket=self.bucket_name,
+            Key=key,
+            **self._get_write_parameters(key),
+        )
+        return response["UploadId"]
+
+    def upload_part(self, name, upload_id, part_number, data):
+        """Upload a part of a multipart upload. Parts are numbered from 1,
+        and data is bytes or a file object."""
+        self.connection.meta.client.upload_part(
+            Bucket=self.bucket_name,
+            Key=self.key(name),
+            UploadId=upload_id,
+            PartNumber=part_number,
+            Body=data,
+        )
+
+    def complete_multipart_upload(self, name, upload_id):
+        """Combine the uploaded parts into the file."""
+        client = self.connection.meta.client
+        key = self.key(name)
+        parts = []
+        paginator = client.get_paginator("list_parts")
+        for page in paginator.paginate(
+            Bucket=self.bucket_name, Key=key, UploadId=upload_id
+        ):
+            parts += [
+                {"ETag": part["ETag"], "PartNumber": part["PartNumber"]}
+                for part in page.get("Parts", ())
+            ]
+        client.complete_multipart_upload(
+            Bucket=self.bucket_name,
+            Key=key,
+            UploadId=upload_id,
+            MultipartUpload={"Parts": parts},
+        )
+
+    def abort_multipart_upload(self, name, upload_id):
+        """Discard a multipart upload and any parts uploaded so far."""
+        try:
+            self.connection.meta.client.abort_multipart_upload(
+                Bucket=self.bucket_name,
+                Key=self.key(name),
+                UploadId=upload_id,
+            )
+        except ClientError as err:
+            if err.response["ResponseMetadata"]["HTTPStatusCode"] == 404:
+                # Already completed or aborted
+                return
+            raise
+
+    def copy(self, name, new_name):
+        """Copy a file within the bucket, without downloading it."""
+        try:
+            self.bucket.Object(self.key(new_name)).copy(
+                {"Bucket": self.bucket_name, "Key": self.key(name)}
+            )
+        except ClientError as err:
+            if err.response["ResponseMetadata"]["HTTPStatusCode"] == 404:
+                raise FileNotFoundError(f"File does not exist: {name}")
+            raise
+
+    def iter_files(self, directory):
+        """Yield the name, size and modification time of each file under
+        directory, sorted by name. Listed a page at a time, so buckets of any
+        size can be walked."""
+        prefix = self.key(directory).rstrip("/") + "/"
+        # Keys include the storage location, which names don't
+        location = prefix[: len(prefix) - len(directory) - 1]
+        paginator = self.connection.meta.client.get_paginator(
+            "list_objects_v2"
+        )
+        for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix):
+            for obj in page.get("Contents", ()):
+                yield (
+                    obj["Key"][len(location) :],
+                    obj["Size"],
+                    obj["LastModified"],
+                )
+
+    def delete_many(self, names):
+        """Delete the named files, using as few requests as possible."""
+        keys = [self.key(name) for name in names]
+        for i in range(0, len(keys), DELETE_BATCH_SIZE):
+            response = self.bucket.delete_objects(
+                Delete={
+                    "Objects": [
+                        {"Key": key} for key in keys[i : i + DELETE_BATCH_SIZE]
+                    ],
+                    "Quiet": True,
+                }
+            )
+            errors = response.get("Errors")
+            if errors:
+                raise OSError(
+                    f"Failed to delete {len(errors)} file(s), first "
+                    f"{errors[0]['Key']}: {errors[0]['Message']}"
+                )
+
+
+class MultipartUploadWriter:
+    """Writes a file to S3 using a multipart upload, sending each part as
+    soon as enough of the file has been written, rather than once the whole
+    file has been received."""
+
+    def __init__(self, storage, name):
+        self.storage = storage
+        self.name = name
+        self.upload_id = storage.create_multipart_upload(name)
+        self.buffer = bytearray()
+        self.num_parts = 0
+
+    def write(self, data):
+        self.buffer += data
+        if len(self.buffer) >= PART_SIZE:
+            self.upload_buffer()
+
+    def upload_buffer(self):
+        self.num_parts += 1
+        self.storage.upload_part(
+            self.name, self.upload_id, self.num_parts, bytes(self.buffer)
+        )
+        self.buffer.clear()
+
+    def close(self):
+        """Send the rest of the file and complete the upload."""
+        # An empty file still needs one part
+        if self.buffer or self.num_parts == 0:
+            self.upload_buffer()
+        self.storage.complete_multipart_upload(self.name, self.upload_id)
+
+    def abort(self):
+        self.storage.abort_multipart_upload(self.name, self.upload_id)
+
+
+class S3ObjectReader(io.IOBase):
+    """Reads an object in S3 as a stream from the current position, so
+    seeking to part of a large file doesn't download the rest of it."""
+
+    def __init__(self, obj):
+        self.obj = obj
+        self.size = obj.content_length
+        self.position = 0
+        self.body = None
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        if offset != self.position:
+            self.close_body()
+            self.position = offset
+        return self.position
+
+    def read(self, size=-1):
+        if self.position >= self.size:
+            return b""
+        if self.body is None:
+            self.body = self.obj.get(Range=f"bytes={self.position}-")["Body"]
+        data = self.body.read(None if size is None or size < 0 else size)
+        self.position += len(data)
+        return data
+
+    def close_body(self):
+        if self.body is not None:
+            self.body.close()
+            self.body = None
+
+    def close(self):
+        self.close_body()
+        super().close()
@@ -5,6 +5,8 @@ register = template.Library()
 
 def pretty_file_size(value):
     """Converts a file size in bytes to a human readable format"""
+    if value is None:
+        return "Unknown"
     bytes = int(value)
     kilobytes = bytes // 1000
     megabytes = kilobytes // 1000
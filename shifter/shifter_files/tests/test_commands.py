@@ -1,4 +1,5 @@
 import datetime
+import pathlib
 import tempfile
 from io import StringIO
 from shutil import rmtree
@@ -6,7 +7,7 @@ from shutil import rmtree
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.core.management import call_command
+from django.core.management import CommandError, call_command
 from django.test import TestCase, override_settings
 from django.utils import timezone
 
@@ -57,3 +58,192 @@ class CleanUpExpiredCommandTest(TestCase):
     def test_no_expired_files(self):
         out = self.command_output()
         self.assertIn(out, "No expired files to be deleted\n")
+
+    def test_batches_with_progress(self):
+        for i in range(5):
+            FileUpload.objects.create(
+                owner=self.user,
+                file_content=SimpleUploadedFile(
+                    f"{i}_{TEST_FILE_NAME}", TEST_FILE_CONTENT
+                ),
+                upload_datetime=timezone.now(),
+                expiry_datetime=timezone.now() - datetime.timedelta(days=1),
+                filename=TEST_FILE_NAME,
+            )
+
+        out = self.command_output(
+            "--batch-size", "2", "--workers", "2", verbosity=2
+        )
+        self.assertEqual(
+            out,
+            "Deleted 2 expired file(s)...\n"
+            "Deleted 4 expired file(s)...\n"
+            "Deleted 5 expired file(s)...\n"
+            "Successfully deleted 5 expired file(s)\n",
+        )
+        self.assertEqual(FileUpload.objects.count(), 0)
+        uploads = pathlib.Path(settings.MEDIA_ROOT) / "uploads"
+        self.assertEqual(
+            [path for path in uploads.rglob("*") if path.is_file()], []
+        )
+
+    def test_invalid_batch_size(self):
+        with self.assertRaises(CommandError):
+            self.command_output("--batch-size", "0")
+
+    def test_invalid_workers(self):
+        with self.assertRaises(CommandError):
+            self.command_output("--workers", "0")
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class BackfillFileSizesCommandTest(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            TEST_USER_EMAIL, TEST_USER_PASSWORD
+        )
+
+    def tearDown(self):
+        rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+
+    def command_output(self, *args, **kwargs):
+        out = StringIO()
+        call_command(
+            "backfillfilesizes",
+            *args + ("--no-color",),
+            stdout=out,
+            stderr=StringIO(),
+            **kwargs,
+        )
+        return out.getvalue()
+
+    def test_files_without_size(self):
+        test_file = SimpleUploadedFile(TEST_FILE_NAME, TEST_FILE_CONTENT)
+        file_upload = FileUpload.objects.create(
+            owner=self.user,
+            file_content=test_file,
+            upload_datetime=timezone.now(),
+            expiry_datetime=timezone.now() + datetime.timedelta(days=1),
+            filename=TEST_FILE_NAME,
+        )
+        FileUpload.objects.update(file_size=None)
+
+        out = self.command_output()
+        self.assertIn("Successfully stored the size of 1 file(s)\n", out)
+        file_upload.refresh_from_db()
+        self.assertEqual(file_upload.file_size, len(TEST_FILE_CONTENT))
+
+    def test_no_files_without_size(self):
+        out = self.command_output()
+        self.assertIn("No file sizes to be stored\n", out)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class DeduplicateFilesCommandTest(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            TEST_USER_EMAIL, TEST_USER_PASSWORD
+        )
+
+    def tearDown(self):
+        rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+
+    def command_output(self, *args, **kwargs):
+        out = StringIO()
+        call_command(
+            "deduplicatefiles",
+            *args + ("--no-color",),
+            stdout=out,
+            stderr=StringIO(),
+            **kwargs,
+        )
+        return out.getvalue()
+
+    def create_file(self):
+        test_file = SimpleUploadedFile(TEST_FILE_NAME, TEST_FILE_CONTENT)
+        return FileUpload.objects.create(
+            owner=self.user,
+            file_content=test_file,
+            upload_datetime=timezone.now(),
+            expiry_datetime=timezone.now() + datetime.timedelta(days=1),
+            filename=TEST_FILE_NAME,
+            file_hash=FileUpload.calculate_file_hash(test_file),
+        )
+
+    @override_settings(DEDUPLICATE_UPLOADS=True)
+    def test_duplicate_files(self):
+        self.create_file()
+        self.create_file()
+
+        out = self.command_output()
+        self.assertIn(
+            "Successfully deduplicated 1 file(s), freeing 13B\n", out
+        )
+        uploads = pathlib.Path(settings.MEDIA_ROOT) / "uploads"
+        self.assertEqual(
+            len([path for path in uploads.rglob("*") if path.is_file()]), 1
+        )
+
+    @override_settings(DEDUPLICATE_UPLOADS=True)
+    def test_no_duplicate_files(self):
+        self.create_file()
+
+        out = self.command_output()
+        self.assertIn("No duplicate files found\n", out)
+
+    @override_settings(DEDUPLICATE_UPLOADS=False)
+    def test_not_enabled(self):
+        with self.assertRaises(CommandError):
+            self.command_output()
+
+
+class BenchmarkHashesCommandTest(TestCase):
+    def command_output(self, *args, **kwargs):
+        out = StringIO()
+        call_command(
+            "benchmarkhashes",
+            *args + ("--no-color",),
+            stdout=out,
+            stderr=StringIO(),
+            **kwargs,
+        )
+        return out.getvalue()
+
+    def test_benchmark(self):
+        out = self.command_output(
+            "--size",
+            "1",
+            "--algorithms",
+            "md5",
+            "sha256",
+            "--read-sizes",
+            "64",
+        )
+        lines = out.splitlines()
+        self.assertEqual(
+            lines[0].split(), ["Algorithm", "Read", "size", "MB/s"]
+        )
+        self.assertEqual(
+            [line.split()[:2] for line in lines[1:]],
+            [["md5", "64KB"], ["sha256", "64KB"]],
+        )
+
+    def test_benchmark_file(self):
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(TEST_FILE_CONTENT * 1000)
+            f.flush()
+            out = self.command_output(
+                "--file",
+                f.name,
+                "--algorithms",
+                "blake2b",
+                "--read-sizes",
+                "8",
+            )
+        self.assertEqual(out.splitlines()[1].split()[:2], ["blake2b", "8KB"])
+
+    def test_invalid_size(self):
+        with self.assertRaises(CommandError):
+            self.command_output("--size", "0")
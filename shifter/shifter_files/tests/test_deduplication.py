@@ -0,0 +1,200 @@
+import datetime
+import hashlib
+import io
+import pathlib
+import tempfile
+from shutil import rmtree
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from shifter_files.models import (
+    ChunkedUpload,
+    FileBlob,
+    FileUpload,
+    stored_files_match,
+)
+
+TEST_USER_EMAIL = "iama@test.com"
+TEST_USER_PASSWORD = "mytemporarypassword"
+
+TEST_FILE_NAME = "mytestfile.txt"
+TEST_FILE_CONTENT = b"Hello, World!"
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), DEDUPLICATE_UPLOADS=True)
+class DeduplicationTest(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            TEST_USER_EMAIL, TEST_USER_PASSWORD
+        )
+
+    def tearDown(self):
+        rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+
+    def stored_files(self):
+        uploads = pathlib.Path(settings.MEDIA_ROOT) / "uploads"
+        if not uploads.exists():
+            return []
+        return [path for path in uploads.rglob("*") if path.is_file()]
+
+    def create_file(self, content=TEST_FILE_CONTENT, file_hash=None):
+        file_upload = FileUpload.objects.create(
+            owner=self.user,
+            file_content=SimpleUploadedFile(TEST_FILE_NAME, content),
+            upload_datetime=timezone.now(),
+            expiry_datetime=timezone.now() + datetime.timedelta(days=1),
+            filename=TEST_FILE_NAME,
+            file_hash=file_hash or hashlib.md5(content).hexdigest(),
+        )
+        file_upload.deduplicate()
+        return file_upload
+
+    def test_identical_files_stored_once(self):
+        first = self.create_file()
+        second = self.create_file()
+        self.create_file(b"Something else")
+
+        self.assertEqual(len(self.stored_files()), 2)
+        self.assertEqual(first.blob, second.blob)
+        self.assertEqual(first.file_content.name, second.file_content.name)
+        self.assertEqual(second.file_content.read(), TEST_FILE_CONTENT)
+        blob = FileBlob.objects.get(pk=first.blob_id)
+        self.assertEqual(blob.ref_count, 2)
+
+    def test_file_kept_until_last_reference_deleted(self):
+        first = self.create_file()
+        second = self.create_file()
+
+        first.delete()
+        self.assertEqual(len(self.stored_files()), 1)
+        self.assertEqual(FileBlob.objects.get().ref_count, 1)
+
+        second.delete()
+        self.assertEqual(self.stored_files(), [])
+        self.assertEqual(FileBlob.objects.count(), 0)
+
+    def test_delete_expired_files_releases_references(self):
+        self.create_file()
+        self.create_file()
+        kept = self.create_file()
+        FileUpload.objects.exclude(pk=kept.pk).update(
+            expiry_datetime=timezone.now() - datetime.timedelta(days=1)
+        )
+
+        self.assertEqual(FileUpload.delete_expired_files(batch_size=1), 2)
+        self.assertEqual(len(self.stored_files()), 1)
+        self.assertEqual(FileBlob.objects.get().ref_count, 1)
+
+        FileUpload.objects.update(
+            expiry_datetime=timezone.now() - datetime.timedelta(days=1)
+        )
+        self.assertEqual(FileUpload.delete_expired_files(), 1)
+        self.assertEqual(self.stored_files(), [])
+        self.assertEqual(FileBlob.objects.count(), 0)
+
+    def test_same_hash_different_content_not_shared(self):
+        first = self.create_file(b"first", file_hash="0" * 32)
+        second = self.create_file(b"other", file_hash="0" * 32)
+
+        self.assertIsNone(second.blob)
+        self.assertNotEqual(first.file_content.name, second.file_content.name)
+        self.assertEqual(len(self.stored_files()), 2)
+
+        second.delete()
+        self.assertEqual(len(self.stored_files()), 1)
+
+    def test_blob_moved_while_compared(self):
+        first = self.create_file()
+        with self.settings(DEDUPLICATE_UPLOADS=False):
+            second = self.create_file()
+        moved_name = "uploads/moved"
+        compared = []
+
+        def move_blob(storage, name, other_name):
+            # The blob is moved, as by shardfiles, while the first compare
+            # runs without it locked
+            compared.append(name)
+            if len(compared) == 1:
+                with storage.open(name, "rb") as f:
+                    storage.save(moved_name, f)
+                FileBlob.objects.filter(pk=first.blob_id).update(
+                    file_content=moved_name
+                )
+            return stored_files_match(storage, name, other_name)
+
+        with mock.patch(
+            "shifter_files.models.stored_files_match", side_effect=move_blob
+        ):
+            self.assertTrue(second.deduplicate())
+        self.assertEqual(compared, [first.file_content.name, moved_name])
+        second.refresh_from_db()
+        self.assertEqual(second.blob_id, first.blob_id)
+        self.assertEqual(second.file_content.name, moved_name)
+        self.assertEqual(FileBlob.objects.get().ref_count, 2)
+
+    @override_settings(DEDUPLICATE_UPLOADS=False)
+    def test_disabled(self):
+        first = self.create_file()
+        second = self.create_file()
+
+        self.assertIsNone(first.blob)
+        self.assertIsNone(second.blob)
+        self.assertEqual(len(self.stored_files()), 2)
+
+    def test_deduplicate_existing_files(self):
+        with self.settings(DEDUPLICATE_UPLOADS=False):
+            self.create_file()
+            self.create_file()
+            self.create_file()
+        self.assertEqual(len(self.stored_files()), 3)
+
+        self.assertEqual(
+            FileUpload.deduplicate_files(), (2, len(TEST_FILE_CONTENT) * 2)
+        )
+        self.assertEqual(len(self.stored_files()), 1)
+        self.assertEqual(FileBlob.objects.get().ref_count, 3)
+
+    def test_upload_view_deduplicates(self):
+        client = Client()
+        client.login(email=TEST_USER_EMAIL, password=TEST_USER_PASSWORD)
+        for _ in range(2):
+            response = client.post(
+                reverse("shifter_files:index"),
+                {
+                    "file_content": SimpleUploadedFile(
+                        TEST_FILE_NAME, TEST_FILE_CONTENT
+                    ),
+                    "enable_expiry": "on",
+                    "expiry_datetime": (
+                        timezone.now() + datetime.timedelta(days=1)
+                    ).isoformat(sep=" ", timespec="minutes"),
+                },
+            )
+            self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(
+            FileUpload.objects.filter(blob__isnull=False).count(), 2
+        )
+        self.assertEqual(len(self.stored_files()), 1)
+
+    def test_chunked_upload_deduplicates(self):
+        first = self.create_file()
+        chunked_upload = ChunkedUpload.objects.create(
+            owner=self.user,
+            filename=TEST_FILE_NAME,
+            upload_length=len(TEST_FILE_CONTENT),
+        )
+        chunked_upload.write_chunk(
+            io.BytesIO(TEST_FILE_CONTENT), len(TEST_FILE_CONTENT)
+        )
+
+        second = chunked_upload.complete()
+        self.assertEqual(second.blob, first.blob)
+        self.assertEqual(len(self.stored_files()), 1)
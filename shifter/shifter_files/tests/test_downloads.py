@@ -0,0 +1,57 @@
+from django.test import SimpleTestCase
+
+from shifter_files.downloads import MAX_RANGES, parse_range_header
+
+
+class ParseRangeHeaderTest(SimpleTestCase):
+    def test_single_range(self):
+        self.assertEqual(parse_range_header("bytes=0-9", 100), [(0, 9)])
+
+    def test_open_ended_range(self):
+        self.assertEqual(parse_range_header("bytes=90-", 100), [(90, 99)])
+
+    def test_suffix_range(self):
+        self.assertEqual(parse_range_header("bytes=-10", 100), [(90, 99)])
+
+    def test_suffix_range_larger_than_file(self):
+        self.assertEqual(parse_range_header("bytes=-500", 100), [(0, 99)])
+
+    def test_end_past_file_is_clamped(self):
+        self.assertEqual(parse_range_header("bytes=50-500", 100), [(50, 99)])
+
+    def test_multiple_ranges_sorted(self):
+        self.assertEqual(
+            parse_range_header("bytes=50-59, 0-9", 100), [(0, 9), (50, 59)]
+        )
+
+    def test_overlapping_ranges_merged(self):
+        self.assertEqual(
+            parse_range_header("bytes=0-9,5-19,20-29", 100), [(0, 29)]
+        )
+
+    def test_unsatisfiable(self):
+        self.assertEqual(parse_range_header("bytes=100-", 100), [])
+        self.assertEqual(parse_range_header("bytes=-0", 100), [])
+
+    def test_partially_satisfiable(self):
+        self.assertEqual(
+            parse_range_header("bytes=0-9,200-300", 100), [(0, 9)]
+        )
+
+    def test_invalid_headers_ignored(self):
+        for header in [
+            "bytes=",
+            "bytes=a-b",
+            "bytes=-",
+            "bytes=9-0",
+            "items=0-9",
+            "0-9",
+        ]:
+            with self.subTest(header=header):
+                self.assertIsNone(parse_range_header(header, 100))
+
+    def test_too_many_ranges_ignored(self):
+        header = "bytes=" + ",".join(
+            f"{i * 2}-{i * 2}" for i in range(MAX_RANGES + 1)
+        )
+        self.assertIsNone(parse_range_header(header, 100))
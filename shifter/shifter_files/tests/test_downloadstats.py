@@ -0,0 +1,148 @@
+import datetime
+import tempfile
+from shutil import rmtree
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from shifter_files.downloadstats import download_stats
+from shifter_files.models import FileUpload
+
+TEST_USER_EMAIL = "iama@test.com"
+TEST_USER_PASSWORD = "mytemporarypassword"
+
+TEST_FILE_NAME = "mytestfile.txt"
+TEST_FILE_CONTENT = b"Hello, World!"
+
+
+@override_settings(
+    MEDIA_ROOT=tempfile.mkdtemp(), DOWNLOAD_STATS_FLUSH_INTERVAL=0
+)
+class DownloadStatsTest(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            TEST_USER_EMAIL, TEST_USER_PASSWORD
+        )
+        self.file_upload = FileUpload.objects.create(
+            owner=self.user,
+            file_content=SimpleUploadedFile(TEST_FILE_NAME, TEST_FILE_CONTENT),
+            upload_datetime=timezone.now(),
+            expiry_datetime=timezone.now() + datetime.timedelta(weeks=1),
+            filename=TEST_FILE_NAME,
+        )
+        self.url = reverse(
+            "shifter_files:file-download", args=[self.file_upload.file_hex]
+        )
+        self.client = Client()
+
+    def tearDown(self):
+        download_stats.flush()
+        rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+
+    def download(self, **kwargs):
+        response = self.client.get(self.url, **kwargs)
+        b"".join(response.streaming_content)
+        return response
+
+    def test_download_recorded(self):
+        before = timezone.now()
+        self.download()
+        self.file_upload.refresh_from_db()
+        self.assertEqual(self.file_upload.download_count, 1)
+        self.assertEqual(self.file_upload.bytes_served, len(TEST_FILE_CONTENT))
+        self.assertGreaterEqual(
+            self.file_upload.last_download_datetime, before
+        )
+
+    def test_head_and_not_modified_not_recorded(self):
+        self.client.head(self.url)
+        self.client.get(
+            self.url,
+            headers={"If-None-Match": f'"{self.file_upload.file_hex}"'},
+        )
+        self.file_upload.refresh_from_db()
+        self.assertEqual(self.file_upload.download_count, 0)
+        self.assertEqual(self.file_upload.bytes_served, 0)
+        self.assertIsNone(self.file_upload.last_download_datetime)
+
+    def test_resumed_download_counted_once(self):
+        self.download(headers={"Range": "bytes=0-4"})
+        self.download(headers={"Range": "bytes=5-"})
+        self.file_upload.refresh_from_db()
+        self.assertEqual(self.file_upload.download_count, 1)
+        self.assertEqual(self.file_upload.bytes_served, len(TEST_FILE_CONTENT))
+
+    @override_settings(DOWNLOAD_BACKEND="x-accel-redirect")
+    def test_proxy_download_counts_file_size(self):
+        self.client.get(self.url)
+        self.file_upload.refresh_from_db()
+        self.assertEqual(self.file_upload.download_count, 1)
+        self.assertEqual(self.file_upload.bytes_served, len(TEST_FILE_CONTENT))
+
+    @override_settings(DOWNLOAD_STATS_FLUSH_INTERVAL=60)
+    def test_downloads_written_in_batches(self):
+        with (
+            mock.patch("shifter_files.downloadstats.threading.Timer") as timer,
+            CaptureQueriesContext(connection) as queries,
+        ):
+            self.download()
+            self.download()
+        self.assertFalse(
+            any(
+                q["sql"].startswith("UPDATE") for q in queries.captured_queries
+            )
+        )
+        # One write is scheduled for both downloads
+        timer.assert_called_once()
+        self.file_upload.refresh_from_db()
+        self.assertEqual(self.file_upload.download_count, 0)
+
+        self.assertEqual(download_stats.flush(), 1)
+        self.file_upload.refresh_from_db()
+        self.assertEqual(self.file_upload.download_count, 2)
+        self.assertEqual(
+            self.file_upload.bytes_served, 2 * len(TEST_FILE_CONTENT)
+        )
+        self.assertEqual(download_stats.flush(), 0)
+
+    def test_add_download_stats_keeps_latest_download(self):
+        now = timezone.now()
+        earlier = now - datetime.timedelta(minutes=1)
+        FileUpload.add_download_stats({self.file_upload.pk: (1, 10, now)})
+        FileUpload.add_download_stats({self.file_upload.pk: (2, 20, earlier)})
+        self.file_upload.refresh_from_db()
+        self.assertEqual(self.file_upload.download_count, 3)
+        self.assertEqual(self.file_upload.bytes_served, 30)
+        self.assertEqual(self.file_upload.last_download_datetime, now)
+
+    def test_deleted_file_skipped(self):
+        pk = self.file_upload.pk
+        self.file_upload.delete()
+        FileUpload.add_download_stats({pk: (1, 10, timezone.now())})
+        self.assertFalse(FileUpload.objects.exists())
+
+    def test_stats_shown_on_detail_page(self):
+        self.download()
+        client = Client()
+        client.login(email=TEST_USER_EMAIL, password=TEST_USER_PASSWORD)
+        response = client.get(
+            reverse(
+                "shifter_files:file-details", args=[self.file_upload.file_hex]
+            )
+        )
+        self.assertInHTML(
+            '<div><span class="font-semibold">Downloads:</span> 1</div>',
+            response.content.decode(),
+        )
+        self.assertInHTML(
+            '<div><span class="font-semibold">Data Served:</span> 13B</div>',
+            response.content.decode(),
+        )
@@ -0,0 +1,57 @@
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import Count, Q
+from django.test import TestCase
+from django.utils import timezone
+
+from shifter_files.models import FileUpload
+
+TEST_USER_EMAIL = "iama@test.com"
+TEST_USER_PASSWORD = "mytemporarypassword"
+
+
+class FileUploadIndexTest(TestCase):
+    """Check the common FileUpload queries are planned using an index rather
+    than a scan of the whole table."""
+
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            TEST_USER_EMAIL, TEST_USER_PASSWORD
+        )
+
+    def explain(self, queryset):
+        with transaction.atomic():
+            if connection.vendor == "postgresql":
+                # The test tables are tiny, so Postgres would otherwise
+                # prefer a sequential scan whatever indexes exist
+                with connection.cursor() as cursor:
+                    cursor.execute("SET LOCAL enable_seqscan = off")
+            return queryset.explain()
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = self.explain(queryset)
+        self.assertIn(index_name, plan)
+
+    def test_file_list_uses_owner_index(self):
+        queryset = (
+            FileUpload.get_non_expired_files()
+            .filter(owner=self.user)
+            .order_by("upload_datetime")
+        )
+        self.assertUsesIndex(queryset, "fileupload_owner_uploaded_idx")
+
+    def test_expired_files_uses_expiry_index(self):
+        self.assertUsesIndex(
+            FileUpload.get_expired_files(), "fileupload_expiry_idx"
+        )
+
+    def test_active_files_count_uses_owner_expiry_index(self):
+        queryset = FileUpload.objects.values("owner").annotate(
+            active_files_count=Count(
+                "pk",
+                filter=Q(expiry_datetime__gt=timezone.now())
+                | Q(expiry_datetime__isnull=True),
+            )
+        )
+        self.assertUsesIndex(queryset, "fileupload_owner_expiry_idx")
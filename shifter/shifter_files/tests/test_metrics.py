@@ -0,0 +1,337 @@
+import datetime
+import os
+import tempfile
+from shutil import rmtree
+from wsgiref.util import FileWrapper, setup_testing_defaults
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.signals import request_started
+from django.db import close_old_connections, connection
+from django.test import TestCase, modify_settings, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from prometheus_client import REGISTRY, CollectorRegistry
+from prometheus_client.mmap_dict import MmapedDict, mmap_key
+from prometheus_client.multiprocess import MultiProcessCollector
+
+from shifter_files.metricfiles import merge_process_files
+from shifter_files.models import FileUpload
+
+TEST_USER_EMAIL = "iama@test.com"
+TEST_USER_PASSWORD = "mytemporarypassword"
+
+TEST_FILE_NAME = "mytestfile.txt"
+TEST_FILE_CONTENT = b"Hello, World!"
+
+
+def sample(name, labels=None):
+    return REGISTRY.get_sample_value(name, labels or {}) or 0
+
+
+@override_settings(
+    MEDIA_ROOT=tempfile.mkdtemp(),
+    DOWNLOAD_STATS_FLUSH_INTERVAL=0,
+    METRICS_ENABLED=True,
+    METRICS_TOKEN="",
+)
+class MetricsTest(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            TEST_USER_EMAIL, TEST_USER_PASSWORD
+        )
+        self.client.login(email=TEST_USER_EMAIL, password=TEST_USER_PASSWORD)
+        cache.clear()
+
+    def tearDown(self):
+        rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        cache.clear()
+
+    def create_file(self, expiry_datetime=None):
+        if expiry_datetime is None:
+            expiry_datetime = timezone.now() + datetime.timedelta(days=1)
+        return FileUpload.objects.create(
+            owner=self.user,
+            file_content=SimpleUploadedFile(TEST_FILE_NAME, TEST_FILE_CONTENT),
+            upload_datetime=timezone.now(),
+            expiry_datetime=expiry_datetime,
+            filename=TEST_FILE_NAME,
+            file_size=len(TEST_FILE_CONTENT),
+        )
+
+    def test_metrics(self):
+        self.create_file()
+        self.create_file(expiry_datetime=None)
+        self.create_file(timezone.now() - datetime.timedelta(minutes=1))
+
+        response = self.client.get(reverse("shifter_files:metrics"))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+        content = response.content.decode()
+        self.assertIn("shifter_active_files 2.0", content)
+        self.assertIn("shifter_expired_files 1.0", content)
+        self.assertIn(
+            "# TYPE shifter_upload_duration_seconds histogram", content
+        )
+
+    def test_file_counts_cached(self):
+        self.create_file()
+        self.client.get(reverse("shifter_files:metrics"))
+        self.create_file()
+        content = self.client.get(reverse("shifter_files:metrics")).content
+        self.assertIn(b"shifter_active_files 1.0", content)
+
+    @override_settings(METRICS_ENABLED=False)
+    def test_metrics_disabled(self):
+        response = self.client.get(reverse("shifter_files:metrics"))
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(METRICS_TOKEN="secret")
+    def test_metrics_token(self):
+        url = reverse("shifter_files:metrics")
+        self.assertEqual(self.client.get(url).status_code, 401)
+        response = self.client.get(
+            url, headers={"Authorization": "Bearer wrong"}
+        )
+        self.assertEqual(response.status_code, 401)
+        response = self.client.get(
+            url, headers={"Authorization": "Bearer secret"}
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_form_upload(self):
+        labels = {"method": "form"}
+        count = sample("shifter_upload_duration_seconds_count", labels)
+        size = sample("shifter_upload_size_bytes_sum")
+
+        response = self.client.post(
+            reverse("shifter_files:index"),
+            {
+                "expiry_datetime": (
+                    timezone.now() + datetime.timedelta(days=1)
+                ).isoformat(sep=" ", timespec="minutes"),
+                "file_content": SimpleUploadedFile(
+                    TEST_FILE_NAME, TEST_FILE_CONTENT
+                ),
+            },
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            sample("shifter_upload_duration_seconds_count", labels),
+            count + 1,
+        )
+        self.assertEqual(
+            sample("shifter_upload_size_bytes_sum"),
+            size + len(TEST_FILE_CONTENT),
+        )
+
+    def test_chunked_upload(self):
+        labels = {"method": "chunked"}
+        count = sample("shifter_upload_duration_seconds_count", labels)
+
+        response = self.client.post(
+            reverse("shifter_files:chunked-upload"),
+            {
+                "expiry_datetime": (
+                    timezone.now() + datetime.timedelta(days=1)
+                ).isoformat(sep=" ", timespec="minutes"),
+            },
+            headers={"Upload-Length": str(len(TEST_FILE_CONTENT))},
+        )
+        response = self.client.patch(
+            reverse(
+                "shifter_files:chunked-upload-patch",
+                args=[response.json()["upload_id"]],
+            ),
+            TEST_FILE_CONTENT,
+            content_type="application/offset+octet-stream",
+            headers={"Upload-Offset": "0", "Upload-Name": TEST_FILE_NAME},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            sample("shifter_upload_duration_seconds_count", labels),
+            count + 1,
+        )
+
+    def test_download(self):
+        file_upload = self.create_file()
+        url = reverse(
+            "shifter_files:file-download", args=[file_upload.file_hex]
+        )
+        ttfb = sample("shifter_download_time_to_first_byte_seconds_count")
+        throughput = sample(
+            "shifter_download_throughput_bytes_per_second_count"
+        )
+
+        # The whole file is sent by the server, and a range by Django
+        for headers, content in [
+            ({}, TEST_FILE_CONTENT),
+            ({"Range": "bytes=7-"}, b"World!"),
+        ]:
+            response = self.client.get(url, headers=headers)
+            self.assertEqual(b"".join(response.streaming_content), content)
+
+        self.assertEqual(
+            sample("shifter_download_time_to_first_byte_seconds_count"),
+            ttfb + 2,
+        )
+        self.assertEqual(
+            sample("shifter_download_throughput_bytes_per_second_count"),
+            throughput + 2,
+        )
+
+    def test_download_sent_with_file_wrapper(self):
+        file_upload = self.create_file()
+        environ = {
+            "PATH_INFO": reverse(
+                "shifter_files:file-download", args=[file_upload.file_hex]
+            ),
+            "HTTP_HOST": "testserver",
+            "wsgi.file_wrapper": FileWrapper,
+        }
+        setup_testing_defaults(environ)
+        throughput = sample(
+            "shifter_download_throughput_bytes_per_second_count"
+        )
+
+        # As the test client does, so the test's transaction isn't closed
+        request_started.disconnect(close_old_connections)
+        try:
+            result = WSGIHandler()(environ, lambda status, headers: None)
+            self.assertIsInstance(result, FileWrapper)
+            self.assertEqual(b"".join(result), TEST_FILE_CONTENT)
+            result.close()
+        finally:
+            request_started.connect(close_old_connections)
+        self.assertEqual(
+            sample("shifter_download_throughput_bytes_per_second_count"),
+            throughput + 1,
+        )
+
+    async def test_asgi_download(self):
+        file_upload = await FileUpload.objects.acreate(
+            owner=self.user,
+            file_content=SimpleUploadedFile(TEST_FILE_NAME, TEST_FILE_CONTENT),
+            upload_datetime=timezone.now(),
+            filename=TEST_FILE_NAME,
+        )
+        url = reverse(
+            "shifter_files:file-download", args=[file_upload.file_hex]
+        )
+        throughput = sample(
+            "shifter_download_throughput_bytes_per_second_count"
+        )
+
+        response = await self.async_client.get(url)
+        content = [chunk async for chunk in response.streaming_content]
+        self.assertEqual(b"".join(content), TEST_FILE_CONTENT)
+        self.assertEqual(
+            sample("shifter_download_throughput_bytes_per_second_count"),
+            throughput + 1,
+        )
+
+    def test_not_modified_not_timed(self):
+        file_upload = self.create_file()
+        url = reverse(
+            "shifter_files:file-download", args=[file_upload.file_hex]
+        )
+        etag = self.client.get(url)["ETag"]
+        ttfb = sample("shifter_download_time_to_first_byte_seconds_count")
+
+        response = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(
+            sample("shifter_download_time_to_first_byte_seconds_count"), ttfb
+        )
+
+    def test_delete_expired_files(self):
+        self.create_file(timezone.now() - datetime.timedelta(minutes=1))
+        self.create_file()
+        count = sample("shifter_delete_expired_files_duration_seconds_count")
+        deleted = sample("shifter_delete_expired_files_deleted_files_sum")
+
+        FileUpload.delete_expired_files()
+        self.assertEqual(
+            sample("shifter_delete_expired_files_duration_seconds_count"),
+            count + 1,
+        )
+        self.assertEqual(
+            sample("shifter_delete_expired_files_deleted_files_sum"),
+            deleted + 1,
+        )
+
+    @modify_settings(
+        MIDDLEWARE={"prepend": "shifter_files.middleware.count_queries"}
+    )
+    def test_queries_counted_by_view(self):
+        labels = {"view": "shifter_files:myfiles"}
+        count = sample("shifter_db_queries_per_request_count", labels)
+        queries = sample("shifter_db_queries_per_request_sum", labels)
+
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(reverse("shifter_files:myfiles"))
+        self.assertEqual(
+            sample("shifter_db_queries_per_request_count", labels), count + 1
+        )
+        self.assertEqual(
+            sample("shifter_db_queries_per_request_sum", labels),
+            queries + len(context.captured_queries),
+        )
+
+
+class MergeProcessFilesTest(TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        rmtree(self.path, ignore_errors=True)
+
+    def write_histogram(self, pid, value):
+        """Write a process's file as prometheus_client does."""
+        values = MmapedDict(os.path.join(self.path, f"histogram_{pid}.db"))
+        for name, labels, sample_value in [
+            ("test_bucket", {"le": "1.0"}, value),
+            ("test_bucket", {"le": "+Inf"}, 1),
+            ("test_sum", {}, value + 5),
+        ]:
+            key = mmap_key(
+                "test", name, list(labels), list(labels.values()), "Test."
+            )
+            values.write_value(key, sample_value, 0)
+        values.close()
+
+    def collect(self):
+        registry = CollectorRegistry()
+        MultiProcessCollector(registry, self.path)
+        return {
+            (sample.name, sample.labels.get("le")): sample.value
+            for metric in registry.collect()
+            for sample in metric.samples
+        }
+
+    def test_merge_process_files(self):
+        self.write_histogram(100, 2)
+        self.write_histogram(101, 3)
+        totals = self.collect()
+        self.assertEqual(totals[("test_count", None)], 7)
+
+        merge_process_files(100, self.path)
+        self.assertEqual(
+            sorted(os.listdir(self.path)),
+            ["histogram_101.db", "histogram_archive.db", "merge.lock"],
+        )
+        self.assertEqual(self.collect(), totals)
+
+        merge_process_files(101, self.path)
+        # Processes without files of their own are skipped
+        merge_process_files(102, self.path)
+        self.assertEqual(
+            sorted(os.listdir(self.path)),
+            ["histogram_archive.db", "merge.lock"],
+        )
+        self.assertEqual(self.collect(), totals)
@@ -3,14 +3,16 @@ import hashlib
 import pathlib
 import tempfile
 from shutil import rmtree
+from unittest import mock
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.files.storage import FileSystemStorage
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import TestCase, override_settings
 from django.utils import timezone
 
-from shifter_files.models import FileUpload
+from shifter_files.models import HASH_READ_SIZE, FileUpload, sharded_name
 
 TEST_USER_EMAIL = "iama@test.com"
 TEST_USER_PASSWORD = "mytemporarypassword"
@@ -57,7 +59,9 @@ class FileUploadModelTest(TestCase):
             delta=datetime.timedelta(minutes=1),
         )
         # Ensure file has been uploaded to the correct location
-        path = pathlib.Path(settings.MEDIA_ROOT + "/uploads/" + TEST_FILE_NAME)
+        path = pathlib.Path(
+            settings.MEDIA_ROOT, sharded_name(file_upload.file_hex)
+        )
         self.assertTrue(path.is_file())
 
     def test_is_expired_false(self):
@@ -143,6 +147,35 @@ class FileUploadModelTest(TestCase):
         self.assertEqual(num_files_deleted, 2)
         self.assertEqual(FileUpload.get_expired_files().count(), 0)
 
+    def test_delete_expired_files_storage_error(self):
+        current_datetime = timezone.now()
+        for _ in range(3):
+            FileUpload.objects.create(
+                owner=self.user,
+                file_content=SimpleUploadedFile(
+                    TEST_FILE_NAME, TEST_FILE_CONTENT
+                ),
+                upload_datetime=current_datetime,
+                expiry_datetime=current_datetime - datetime.timedelta(days=1),
+                filename=TEST_FILE_NAME,
+            )
+
+        progress = []
+        with (
+            mock.patch.object(
+                FileSystemStorage, "delete", side_effect=OSError
+            ) as delete,
+            self.assertLogs("shifter_files.models", "ERROR"),
+        ):
+            num_files_deleted = FileUpload.delete_expired_files(
+                batch_size=2, progress=progress.append
+            )
+        # Rows are still removed when storage fails, leaving orphaned files
+        self.assertEqual(num_files_deleted, 3)
+        self.assertEqual(progress, [2, 3])
+        self.assertEqual(delete.call_count, 3)
+        self.assertEqual(FileUpload.objects.count(), 0)
+
     def test_calculate_file_hash_returns_md5_hex(self):
         """Test calculate_file_hash returns 32-character MD5 hex."""
         test_file = SimpleUploadedFile(TEST_FILE_NAME, TEST_FILE_CONTENT)
@@ -189,8 +222,8 @@ class FileUploadModelTest(TestCase):
 
     def test_calculate_file_hash_large_file(self):
         """Test calculate_file_hash works with large files."""
-        # Create a file larger than 8KB chunk size (use 10KB)
-        large_content = b"A" * 10240
+        # Create a file larger than the chunk size
+        large_content = b"A" * (HASH_READ_SIZE + 10240)
         test_file = SimpleUploadedFile("largefile.txt", large_content)
 
         calculated_hash = FileUpload.calculate_file_hash(test_file)
@@ -198,6 +231,50 @@ class FileUploadModelTest(TestCase):
 
         self.assertEqual(calculated_hash, expected_hash)
 
+    @override_settings(FILE_HASH_ALGORITHM="sha256")
+    def test_calculate_file_hash_configured_algorithm(self):
+        """Test calculate_file_hash uses FILE_HASH_ALGORITHM."""
+        test_file = SimpleUploadedFile(TEST_FILE_NAME, TEST_FILE_CONTENT)
+
+        self.assertEqual(
+            FileUpload.calculate_file_hash(test_file),
+            hashlib.sha256(TEST_FILE_CONTENT).hexdigest(),
+        )
+        self.assertEqual(
+            FileUpload.calculate_file_hash(test_file, "blake2b"),
+            hashlib.blake2b(TEST_FILE_CONTENT).hexdigest(),
+        )
+
+    def test_file_hash_algorithm_stored(self):
+        """Test the algorithm in use is stored with each file's hash."""
+        test_file = SimpleUploadedFile(TEST_FILE_NAME, TEST_FILE_CONTENT)
+        file_upload = FileUpload.objects.create(
+            owner=self.user,
+            file_content=test_file,
+            upload_datetime=timezone.now(),
+            filename=TEST_FILE_NAME,
+            file_hash=FileUpload.calculate_file_hash(test_file),
+        )
+
+        with self.settings(FILE_HASH_ALGORITHM="sha512"):
+            test_file = SimpleUploadedFile(TEST_FILE_NAME, TEST_FILE_CONTENT)
+            sha512_file_upload = FileUpload.objects.create(
+                owner=self.user,
+                file_content=test_file,
+                upload_datetime=timezone.now(),
+                filename=TEST_FILE_NAME,
+                file_hash=FileUpload.calculate_file_hash(test_file),
+            )
+
+        file_upload.refresh_from_db()
+        sha512_file_upload.refresh_from_db()
+        self.assertEqual(file_upload.file_hash_algorithm, "md5")
+        self.assertEqual(sha512_file_upload.file_hash_algorithm, "sha512")
+        self.assertEqual(
+            sha512_file_upload.file_hash,
+            hashlib.sha512(TEST_FILE_CONTENT).hexdigest(),
+        )
+
     def test_file_upload_without_hash(self):
         """Test FileUpload can be created without hash."""
         test_file = SimpleUploadedFile(TEST_FILE_NAME, TEST_FILE_CONTENT)
@@ -346,3 +423,40 @@ class FileUploadModelTest(TestCase):
         self.assertTrue(
             FileUpload.objects.filter(file_hex=no_expiry.file_hex).exists()
         )
+
+    def test_file_size_stored_on_save(self):
+        test_file = SimpleUploadedFile(TEST_FILE_NAME, TEST_FILE_CONTENT)
+        file_upload = FileUpload.objects.create(
+            owner=self.user,
+            file_content=test_file,
+            upload_datetime=timezone.now(),
+            expiry_datetime=timezone.now() + datetime.timedelta(days=1),
+            filename=TEST_FILE_NAME,
+        )
+        file_upload.refresh_from_db()
+        self.assertEqual(file_upload.file_size, len(TEST_FILE_CONTENT))
+
+    def test_backfill_file_sizes(self):
+        test_file = SimpleUploadedFile(TEST_FILE_NAME, TEST_FILE_CONTENT)
+        file_upload = FileUpload.objects.create(
+            owner=self.user,
+            file_content=test_file,
+            upload_datetime=timezone.now(),
+            expiry_datetime=timezone.now() + datetime.timedelta(days=1),
+            filename=TEST_FILE_NAME,
+        )
+        missing_file = FileUpload.objects.create(
+            owner=self.user,
+            file_content="uploads/missing.txt",
+            upload_datetime=timezone.now(),
+            expiry_datetime=timezone.now() + datetime.timedelta(days=1),
+            filename="missing.txt",
+            file_size=0,
+        )
+        FileUpload.objects.update(file_size=None)
+
+        self.assertEqual(FileUpload.backfill_file_sizes(), (1, 1))
+        file_upload.refresh_from_db()
+        missing_file.refresh_from_db()
+        self.assertEqual(file_upload.file_size, len(TEST_FILE_CONTENT))
+        self.assertIsNone(missing_file.file_size)
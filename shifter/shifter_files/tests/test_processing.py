@@ -0,0 +1,204 @@
+import datetime
+import hashlib
+import io
+import tempfile
+import zlib
+from io import StringIO
+from shutil import rmtree
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from shifter_files.models import (
+    ChunkedUpload,
+    FileBlob,
+    FileProcessingJob,
+    FileUpload,
+)
+
+TEST_USER_EMAIL = "iama@test.com"
+TEST_USER_PASSWORD = "mytemporarypassword"
+
+TEST_FILE_NAME = "mytestfile.txt"
+TEST_FILE_CONTENT = b"Hello, World!"
+
+
+@override_settings(
+    MEDIA_ROOT=tempfile.mkdtemp(), BACKGROUND_FILE_PROCESSING=True
+)
+class BackgroundProcessingTest(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            TEST_USER_EMAIL, TEST_USER_PASSWORD
+        )
+        self.client = Client()
+        self.client.login(email=TEST_USER_EMAIL, password=TEST_USER_PASSWORD)
+
+    def tearDown(self):
+        rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+
+    def complete_chunked_upload(self, content=TEST_FILE_CONTENT):
+        chunked_upload = ChunkedUpload.objects.create(
+            owner=self.user,
+            filename=TEST_FILE_NAME,
+            upload_length=len(content),
+        )
+        chunked_upload.write_chunk(io.BytesIO(content), len(content))
+        return chunked_upload.complete()
+
+    def test_chunked_upload_queued(self):
+        with mock.patch.object(
+            FileUpload, "calculate_file_hash"
+        ) as calculate_file_hash:
+            file_upload = self.complete_chunked_upload()
+        calculate_file_hash.assert_not_called()
+
+        self.assertIsNone(file_upload.file_hash)
+        self.assertTrue(file_upload.processing_pending)
+
+    def test_process_pending(self):
+        file_upload = self.complete_chunked_upload()
+
+        self.assertEqual(FileProcessingJob.process_pending(), 1)
+        file_upload.refresh_from_db()
+        self.assertEqual(
+            file_upload.file_hash, hashlib.md5(TEST_FILE_CONTENT).hexdigest()
+        )
+        self.assertEqual(file_upload.file_hash_algorithm, "md5")
+        self.assertEqual(file_upload.file_crc32, zlib.crc32(TEST_FILE_CONTENT))
+        self.assertFalse(file_upload.processing_pending)
+        self.assertEqual(FileProcessingJob.process_pending(), 0)
+
+    @override_settings(DEDUPLICATE_UPLOADS=True)
+    def test_process_pending_deduplicates(self):
+        first = self.complete_chunked_upload()
+        second = self.complete_chunked_upload()
+        self.assertEqual(FileBlob.objects.count(), 0)
+
+        FileProcessingJob.process_pending()
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.blob, second.blob)
+        self.assertEqual(FileBlob.objects.get().ref_count, 2)
+
+    def test_claimed_job_skipped(self):
+        self.complete_chunked_upload()
+        job = FileProcessingJob.claim_next()
+        self.assertEqual(job.attempts, 1)
+
+        self.assertIsNone(FileProcessingJob.claim_next())
+
+        # Abandoned jobs are claimed again once the lease runs out
+        FileProcessingJob.objects.update(
+            claimed_until=timezone.now() - datetime.timedelta(seconds=1)
+        )
+        self.assertEqual(FileProcessingJob.claim_next(), job)
+
+    def test_failed_job_retried(self):
+        file_upload = self.complete_chunked_upload()
+        file_upload.file_content.storage.delete(file_upload.file_content.name)
+
+        for _ in range(FileProcessingJob.MAX_ATTEMPTS):
+            with self.assertLogs("shifter_files.models", "ERROR"):
+                self.assertEqual(FileProcessingJob.process_pending(), 1)
+            # Not retried until the delay has passed
+            self.assertEqual(FileProcessingJob.process_pending(), 0)
+            FileProcessingJob.objects.update(
+                claimed_until=timezone.now() - datetime.timedelta(seconds=1)
+            )
+        self.assertEqual(FileProcessingJob.process_pending(), 0)
+
+        job = FileProcessingJob.objects.get()
+        self.assertEqual(job.attempts, FileProcessingJob.MAX_ATTEMPTS)
+        self.assertTrue(job.last_error)
+        self.assertTrue(job.has_failed())
+        file_upload.refresh_from_db()
+        self.assertTrue(file_upload.processing_failed)
+        self.assertFalse(file_upload.processing_pending)
+
+    def test_failed_job_shown_and_retried(self):
+        file_upload = self.complete_chunked_upload()
+        FileProcessingJob.objects.update(
+            attempts=FileProcessingJob.MAX_ATTEMPTS
+        )
+        url = reverse(
+            "shifter_files:file-details", args=[file_upload.file_hex]
+        )
+        response = self.client.get(url)
+        self.assertNotContains(response, "Checksum pending")
+        self.assertContains(response, "checksum couldn't be calculated")
+
+        err = StringIO()
+        call_command("processfiles", "--once", stdout=StringIO(), stderr=err)
+        self.assertIn("1 file(s) couldn't be processed", err.getvalue())
+
+        out = StringIO()
+        call_command("processfiles", "--once", "--retry-failed", stdout=out)
+        self.assertIn("Queued 1 failed file(s) again", out.getvalue())
+        self.assertIn("Processed 1 file(s)", out.getvalue())
+        self.assertFalse(FileProcessingJob.objects.exists())
+
+    def test_details_page_shows_pending(self):
+        file_upload = self.complete_chunked_upload()
+        url = reverse(
+            "shifter_files:file-details", args=[file_upload.file_hex]
+        )
+
+        response = self.client.get(url)
+        self.assertContains(response, "Checksum pending")
+
+        FileProcessingJob.process_pending()
+        response = self.client.get(url)
+        self.assertNotContains(response, "Checksum pending")
+        self.assertContains(
+            response, hashlib.md5(TEST_FILE_CONTENT).hexdigest()
+        )
+
+    def test_upload_view_queues_job(self):
+        response = self.client.post(
+            reverse("shifter_files:index"),
+            {
+                "file_content": SimpleUploadedFile(
+                    TEST_FILE_NAME, TEST_FILE_CONTENT
+                ),
+                "enable_expiry": "on",
+                "expiry_datetime": (
+                    timezone.now() + datetime.timedelta(days=1)
+                ).isoformat(sep=" ", timespec="minutes"),
+            },
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(FileUpload.objects.get().processing_pending)
+
+    @override_settings(BACKGROUND_FILE_PROCESSING=False)
+    def test_disabled(self):
+        file_upload = self.complete_chunked_upload()
+
+        self.assertEqual(
+            file_upload.file_hash, hashlib.md5(TEST_FILE_CONTENT).hexdigest()
+        )
+        self.assertFalse(file_upload.processing_pending)
+
+    def test_processfiles_command(self):
+        self.complete_chunked_upload()
+        self.complete_chunked_upload()
+
+        out = StringIO()
+        call_command(
+            "processfiles",
+            "--once",
+            "--no-color",
+            stdout=out,
+            stderr=StringIO(),
+        )
+        self.assertIn("Processed 2 file(s)\n", out.getvalue())
+        self.assertFalse(
+            FileUpload.objects.filter(file_hash__isnull=True).exists()
+        )
@@ -0,0 +1,182 @@
+import datetime
+import tempfile
+from io import StringIO
+from shutil import rmtree
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from shifter_files.models import (
+    BundleFile,
+    FileBlob,
+    FileUpload,
+    generate_hex_uuid,
+    sharded_name,
+)
+from shifter_files.reconcile import iter_stored_files, reconcile_storage
+
+TEST_USER_EMAIL = "iama@test.com"
+TEST_USER_PASSWORD = "mytemporarypassword"
+
+TEST_FILE_NAME = "mytestfile.txt"
+TEST_FILE_CONTENT = b"Hello, World!"
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ReconcileStorageTest(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            TEST_USER_EMAIL, TEST_USER_PASSWORD
+        )
+
+    def tearDown(self):
+        rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+
+    def store_file(self, name=None):
+        if name is None:
+            name = sharded_name(generate_hex_uuid())
+        return default_storage.save(name, ContentFile(TEST_FILE_CONTENT))
+
+    def create_file(self, name=None):
+        return FileUpload.objects.create(
+            owner=self.user,
+            file_content=self.store_file(name),
+            upload_datetime=timezone.now(),
+            expiry_datetime=timezone.now() + datetime.timedelta(days=1),
+            filename=TEST_FILE_NAME,
+        )
+
+    def create_bundle(self):
+        bundle_hex = generate_hex_uuid()
+        bundle_files = [
+            BundleFile.objects.create(
+                owner=self.user,
+                bundle_hex=bundle_hex,
+                filename=f"{i}.txt",
+                file_content=self.store_file(),
+                file_size=len(TEST_FILE_CONTENT),
+            )
+            for i in range(2)
+        ]
+        return FileUpload.create_bundle(
+            self.user, bundle_hex, "bundle.zip", None, bundle_files
+        )
+
+    def command_output(self, *args):
+        out = StringIO()
+        call_command("reconcilestorage", "--min-age", "0", *args, stdout=out)
+        return out.getvalue()
+
+    def test_storage_matches(self):
+        self.create_file()
+        self.create_bundle()
+        blob_name = self.store_file()
+        blob = FileBlob.objects.create(
+            file_hash="hash",
+            file_size=len(TEST_FILE_CONTENT),
+            file_content=blob_name,
+            ref_count=2,
+        )
+        for _ in range(2):
+            FileUpload.objects.create(
+                owner=self.user,
+                file_content=blob_name,
+                blob=blob,
+                upload_datetime=timezone.now(),
+                filename=TEST_FILE_NAME,
+            )
+        self.assertIn("Storage matches the database", self.command_output())
+
+    def test_orphaned_file_deleted(self):
+        file_upload = self.create_file()
+        orphan = self.store_file()
+
+        self.assertIn(
+            "Deleted 1 orphaned file(s) (13B) and the uploads of 0 missing "
+            "file(s)",
+            self.command_output(),
+        )
+        self.assertFalse(default_storage.exists(orphan))
+        self.assertTrue(default_storage.exists(file_upload.file_content.name))
+
+    def test_recent_file_kept(self):
+        orphan = self.store_file()
+        self.assertEqual(reconcile_storage(), (0, 0, 0))
+        self.assertTrue(default_storage.exists(orphan))
+
+    def test_missing_file_upload_deleted(self):
+        file_upload = self.create_file()
+        default_storage.delete(file_upload.file_content.name)
+        kept = self.create_file()
+
+        out = self.command_output("-v", "2")
+        self.assertIn(f"Missing: {file_upload.file_content.name}", out)
+        self.assertEqual(list(FileUpload.objects.all()), [kept])
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.storage_used, len(TEST_FILE_CONTENT))
+
+    def test_bundle_missing_file_deleted(self):
+        bundle = self.create_bundle()
+        self.create_bundle()
+        default_storage.delete(bundle.bundle_files.first().file_content.name)
+
+        self.assertEqual(
+            reconcile_storage(min_age=datetime.timedelta()), (0, 0, 1)
+        )
+        self.assertFalse(FileUpload.objects.filter(pk=bundle.pk).exists())
+        self.assertEqual(FileUpload.objects.count(), 1)
+        self.assertEqual(BundleFile.objects.count(), 2)
+
+    def test_dry_run(self):
+        file_upload = self.create_file()
+        default_storage.delete(file_upload.file_content.name)
+        orphan = self.store_file()
+
+        out = self.command_output("--dry-run", "-v", "2")
+        self.assertIn(f"Orphaned: {orphan}", out)
+        self.assertIn(f"Missing: {file_upload.file_content.name}", out)
+        self.assertIn(
+            "Found 1 orphaned file(s) (13B) and 1 missing file(s)", out
+        )
+        self.assertTrue(default_storage.exists(orphan))
+        self.assertTrue(FileUpload.objects.filter(pk=file_upload.pk).exists())
+
+    def test_legacy_names_merged_in_order(self):
+        # Names which sort differently by path component than as a whole
+        for name in [
+            "uploads/ab.txt",
+            "uploads/ab/c",
+            "uploads/a b",
+            "uploads/ab-c",
+        ]:
+            self.create_file(name)
+        orphans = [
+            self.store_file(name) for name in ["uploads/ab/b", "uploads/ab0"]
+        ]
+        for _ in range(3):
+            self.create_file()
+
+        names = [
+            name
+            for name, _, _ in iter_stored_files(default_storage, "uploads")
+        ]
+        self.assertEqual(names, sorted(names))
+        self.assertEqual(len(names), 9)
+
+        self.assertEqual(
+            reconcile_storage(min_age=datetime.timedelta(), batch_size=1),
+            (2, 2 * len(TEST_FILE_CONTENT), 0),
+        )
+        for orphan in orphans:
+            self.assertFalse(default_storage.exists(orphan))
+        self.assertEqual(FileUpload.objects.count(), 7)
+
+    def test_invalid_arguments(self):
+        with self.assertRaisesMessage(CommandError, "--batch-size"):
+            self.command_output("--batch-size", "0")
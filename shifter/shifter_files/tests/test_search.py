@@ -0,0 +1,126 @@
+import datetime
+import tempfile
+from shutil import rmtree
+from unittest import skipUnless
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from shifter_files.models import FileUpload
+from shifter_files.search import (
+    FTS_TABLE,
+    SQLiteFTSSearchBackend,
+    get_search_backend,
+)
+
+TEST_USER_EMAIL = "iama@test.com"
+TEST_USER_PASSWORD = "mytemporarypassword"
+
+TEST_USER_EMAIL_2 = "shifter@github.com"
+TEST_USER_PASSWORD_2 = "mytemporarypassword"
+
+TEST_FILE_CONTENT = b"Hello, World!"
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class FileSearchTest(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            TEST_USER_EMAIL, TEST_USER_PASSWORD
+        )
+        self.user_2 = User.objects.create_user(
+            TEST_USER_EMAIL_2, TEST_USER_PASSWORD_2
+        )
+
+    def tearDown(self):
+        rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+
+    def create_file(self, filename, owner=None):
+        return FileUpload.objects.create(
+            owner=owner or self.user,
+            file_content=SimpleUploadedFile(filename, TEST_FILE_CONTENT),
+            upload_datetime=timezone.now(),
+            expiry_datetime=timezone.now() + datetime.timedelta(days=1),
+            filename=filename,
+        )
+
+    def search(self, query):
+        return list(
+            get_search_backend()
+            .filter(FileUpload.objects.order_by("pk"), query)
+            .values_list("filename", flat=True)
+        )
+
+    def test_search_matches_substring(self):
+        self.create_file("holiday_photos.zip")
+        self.create_file("Quarterly Report.pdf")
+        self.create_file("notes.txt")
+
+        self.assertEqual(self.search("report"), ["Quarterly Report.pdf"])
+        self.assertEqual(self.search("PHOTO"), ["holiday_photos.zip"])
+        self.assertEqual(self.search("missing"), [])
+
+    def test_search_short_query(self):
+        self.create_file("a.txt")
+        self.create_file("b.pdf")
+
+        self.assertEqual(self.search("a."), ["a.txt"])
+
+    def test_search_query_syntax_is_literal(self):
+        self.create_file('my "quoted" file OR other.txt')
+        self.create_file("other.txt")
+
+        self.assertEqual(
+            self.search('"quoted" file OR'),
+            ['my "quoted" file OR other.txt'],
+        )
+        self.assertEqual(self.search("file*"), [])
+
+    def test_deleted_file_not_found(self):
+        file_upload = self.create_file("report.pdf")
+        file_upload.delete()
+
+        self.assertEqual(self.search("report"), [])
+
+    def test_file_list_search(self):
+        self.create_file("report.pdf")
+        self.create_file("notes.txt")
+        self.create_file("other_report.pdf", owner=self.user_2)
+
+        client = Client()
+        client.login(email=TEST_USER_EMAIL, password=TEST_USER_PASSWORD)
+        response = client.get(
+            reverse("shifter_files:myfiles"), {"search": "report"}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [file.filename for file in response.context["object_list"]],
+            ["report.pdf"],
+        )
+
+    @skipUnless(connection.vendor == "sqlite", "SQLite only")
+    def test_sqlite_index_kept_in_sync(self):
+        self.assertIsInstance(get_search_backend(), SQLiteFTSSearchBackend)
+        file_upload = self.create_file("report.pdf")
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT rowid, filename FROM {FTS_TABLE}")
+            self.assertEqual(
+                cursor.fetchall(), [(file_upload.pk, "report.pdf")]
+            )
+
+            file_upload.filename = "renamed.pdf"
+            file_upload.save()
+            cursor.execute(f"SELECT rowid, filename FROM {FTS_TABLE}")
+            self.assertEqual(
+                cursor.fetchall(), [(file_upload.pk, "renamed.pdf")]
+            )
+
+            file_upload.delete()
+            cursor.execute(f"SELECT rowid FROM {FTS_TABLE}")
+            self.assertEqual(cursor.fetchall(), [])
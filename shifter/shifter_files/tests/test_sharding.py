@@ -0,0 +1,224 @@
+import datetime
+import tempfile
+from io import StringIO
+from shutil import rmtree
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from shifter_files.models import (
+    BundleFile,
+    FileBlob,
+    FileProcessingJob,
+    FileUpload,
+    generate_hex_uuid,
+    move_stored_file,
+    sharded_name,
+)
+
+TEST_USER_EMAIL = "iama@test.com"
+TEST_USER_PASSWORD = "mytemporarypassword"
+
+TEST_FILE_NAME = "mytestfile.txt"
+TEST_FILE_CONTENT = b"Hello, World!"
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ShardedNameTest(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            TEST_USER_EMAIL, TEST_USER_PASSWORD
+        )
+        self.client = Client()
+        self.client.login(email=TEST_USER_EMAIL, password=TEST_USER_PASSWORD)
+        self.expiry_datetime = timezone.now() + datetime.timedelta(days=1)
+
+    def tearDown(self):
+        rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+
+    def test_upload_stored_under_sharded_name(self):
+        response = self.client.post(
+            reverse("shifter_files:index"),
+            {
+                "expiry_datetime": self.expiry_datetime.isoformat(
+                    sep=" ", timespec="minutes"
+                ),
+                "file_content": SimpleUploadedFile(
+                    TEST_FILE_NAME, TEST_FILE_CONTENT
+                ),
+            },
+        )
+        self.assertEqual(response.status_code, 200)
+        file_upload = FileUpload.objects.get()
+        name = file_upload.file_content.name
+        self.assertEqual(name, sharded_name(file_upload.file_hex))
+        self.assertEqual(
+            name,
+            f"uploads/{file_upload.file_hex[:2]}/"
+            f"{file_upload.file_hex[2:4]}/{file_upload.file_hex}",
+        )
+        self.assertEqual(default_storage.open(name).read(), TEST_FILE_CONTENT)
+
+    def test_chunked_upload_stored_under_sharded_name(self):
+        response = self.client.post(
+            reverse("shifter_files:chunked-upload"),
+            {
+                "expiry_datetime": self.expiry_datetime.isoformat(
+                    sep=" ", timespec="minutes"
+                )
+            },
+            headers={"Upload-Length": str(len(TEST_FILE_CONTENT))},
+        )
+        upload_id = response.json()["upload_id"]
+        response = self.client.patch(
+            reverse("shifter_files:chunked-upload-patch", args=[upload_id]),
+            TEST_FILE_CONTENT,
+            content_type="application/offset+octet-stream",
+            headers={
+                "Upload-Offset": "0",
+                "Upload-Length": str(len(TEST_FILE_CONTENT)),
+                "Upload-Name": TEST_FILE_NAME,
+            },
+        )
+        self.assertEqual(response.status_code, 200)
+        file_upload = FileUpload.objects.get(file_hex=upload_id)
+        self.assertEqual(
+            file_upload.file_content.name, sharded_name(upload_id)
+        )
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ShardFilesTest(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            TEST_USER_EMAIL, TEST_USER_PASSWORD
+        )
+
+    def tearDown(self):
+        rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+
+    def store_legacy_file(self):
+        # Stored the way files were named before they were sharded
+        return default_storage.save(
+            f"uploads/{TEST_FILE_NAME}_{generate_hex_uuid()}",
+            ContentFile(TEST_FILE_CONTENT),
+        )
+
+    def create_legacy_file(self, **kwargs):
+        if "file_content" not in kwargs:
+            kwargs["file_content"] = self.store_legacy_file()
+        return FileUpload.objects.create(
+            owner=self.user,
+            upload_datetime=timezone.now(),
+            expiry_datetime=timezone.now() + datetime.timedelta(days=1),
+            filename=TEST_FILE_NAME,
+            **kwargs,
+        )
+
+    def assertSharded(self, obj):
+        obj.refresh_from_db()
+        name = obj.file_content.name
+        self.assertRegex(name, r"^uploads/\w\w/\w\w/\w{32}$")
+        self.assertEqual(default_storage.open(name).read(), TEST_FILE_CONTENT)
+
+    def test_shard_files(self):
+        file_upload = self.create_legacy_file()
+        blob_name = self.store_legacy_file()
+        blob = FileBlob.objects.create(
+            file_hash="hash",
+            file_size=len(TEST_FILE_CONTENT),
+            file_content=blob_name,
+            ref_count=2,
+        )
+        shared = [
+            self.create_legacy_file(blob=blob, file_content=blob_name)
+            for _ in range(2)
+        ]
+        bundle_file = BundleFile.objects.create(
+            owner=self.user,
+            bundle_hex=generate_hex_uuid(),
+            filename=TEST_FILE_NAME,
+            file_content=self.store_legacy_file(),
+            file_size=len(TEST_FILE_CONTENT),
+        )
+        legacy_names = default_storage.listdir("uploads")[1]
+
+        out = StringIO()
+        call_command("shardfiles", batch_size=1, stdout=out)
+        self.assertIn("Successfully moved 3 file(s)", out.getvalue())
+
+        self.assertSharded(file_upload)
+        self.assertEqual(
+            file_upload.file_content.name, sharded_name(file_upload.file_hex)
+        )
+        self.assertSharded(bundle_file)
+        self.assertSharded(blob)
+        for shared_upload in shared:
+            shared_upload.refresh_from_db()
+            self.assertEqual(
+                shared_upload.file_content.name, blob.file_content.name
+            )
+        for name in legacy_names:
+            self.assertFalse(default_storage.exists(f"uploads/{name}"))
+
+        out = StringIO()
+        call_command("shardfiles", stdout=out)
+        self.assertIn("All files already have sharded names", out.getvalue())
+
+    def test_missing_file_not_moved(self):
+        file_upload = self.create_legacy_file()
+        legacy_name = file_upload.file_content.name
+        default_storage.delete(legacy_name)
+
+        with self.assertLogs("shifter_files.models", "WARNING"):
+            self.assertEqual(FileUpload.shard_files(), 0)
+        file_upload.refresh_from_db()
+        self.assertEqual(file_upload.file_content.name, legacy_name)
+
+    def test_changed_file_not_moved(self):
+        file_upload = self.create_legacy_file()
+        legacy_name = file_upload.file_content.name
+        # Renamed by something else after the row was read
+        other_name = self.store_legacy_file()
+        FileUpload.objects.filter(pk=file_upload.pk).update(
+            file_content=other_name
+        )
+
+        new_name = sharded_name(file_upload.file_hex)
+        self.assertFalse(move_stored_file(file_upload, new_name))
+        file_upload.refresh_from_db()
+        self.assertEqual(file_upload.file_content.name, other_name)
+        self.assertTrue(default_storage.exists(legacy_name))
+        self.assertFalse(default_storage.exists(new_name))
+
+    def test_files_waiting_for_processing_skipped(self):
+        waiting = self.create_legacy_file()
+        FileProcessingJob.objects.create(file_upload=waiting)
+        failed = self.create_legacy_file()
+        FileProcessingJob.objects.create(
+            file_upload=failed, attempts=FileProcessingJob.MAX_ATTEMPTS
+        )
+        legacy_name = waiting.file_content.name
+
+        self.assertEqual(FileUpload.shard_files(), 1)
+        waiting.refresh_from_db()
+        self.assertEqual(waiting.file_content.name, legacy_name)
+        self.assertSharded(failed)
+
+    def test_interrupted_move_resumed(self):
+        file_upload = self.create_legacy_file()
+        new_name = sharded_name(file_upload.file_hex)
+        # Copied by a run which stopped before the row was updated
+        default_storage.save(new_name, ContentFile(b"partial"))
+
+        self.assertEqual(FileUpload.shard_files(), 1)
+        self.assertSharded(file_upload)
@@ -0,0 +1,255 @@
+import datetime
+import pathlib
+import tempfile
+from io import StringIO
+from shutil import rmtree
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from shifter_files.models import ChunkedUpload, FileUpload
+from shifter_site_settings.models import SiteSetting
+
+TEST_USER_EMAIL = "iama@test.com"
+TEST_USER_PASSWORD = "mytemporarypassword"
+
+TEST_USER_EMAIL_2 = "shifter@github.com"
+TEST_USER_PASSWORD_2 = "mytemporarypassword"
+
+TEST_FILE_NAME = "mytestfile.txt"
+TEST_FILE_CONTENT = b"Hello, World!"
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class StorageUsedTest(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            TEST_USER_EMAIL, TEST_USER_PASSWORD
+        )
+        self.user_2 = User.objects.create_user(
+            TEST_USER_EMAIL_2, TEST_USER_PASSWORD_2
+        )
+
+    def tearDown(self):
+        rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+
+    def create_file(self, owner, expiry_datetime=None):
+        if expiry_datetime is None:
+            expiry_datetime = timezone.now() + datetime.timedelta(days=1)
+        return FileUpload.objects.create(
+            owner=owner,
+            file_content=SimpleUploadedFile(TEST_FILE_NAME, TEST_FILE_CONTENT),
+            upload_datetime=timezone.now(),
+            expiry_datetime=expiry_datetime,
+            filename=TEST_FILE_NAME,
+        )
+
+    def assertStorageUsed(self, user, expected):
+        user.refresh_from_db()
+        self.assertEqual(user.storage_used, expected)
+
+    def test_upload_adds_storage_used(self):
+        self.create_file(self.user)
+        self.create_file(self.user)
+        self.assertStorageUsed(self.user, 2 * len(TEST_FILE_CONTENT))
+        self.assertStorageUsed(self.user_2, 0)
+
+    def test_delete_removes_storage_used(self):
+        file_upload = self.create_file(self.user)
+        self.create_file(self.user)
+        file_upload.delete()
+        self.assertStorageUsed(self.user, len(TEST_FILE_CONTENT))
+
+    def test_edit_does_not_change_storage_used(self):
+        file_upload = self.create_file(self.user)
+        file_upload.filename = "renamed.txt"
+        file_upload.save()
+        self.assertStorageUsed(self.user, len(TEST_FILE_CONTENT))
+
+    def test_delete_expired_files_removes_storage_used(self):
+        expired = timezone.now() - datetime.timedelta(days=1)
+        for _ in range(3):
+            self.create_file(self.user, expiry_datetime=expired)
+        self.create_file(self.user_2, expiry_datetime=expired)
+        self.create_file(self.user)
+
+        self.assertEqual(FileUpload.delete_expired_files(batch_size=2), 4)
+        self.assertStorageUsed(self.user, len(TEST_FILE_CONTENT))
+        self.assertStorageUsed(self.user_2, 0)
+
+    def test_backfill_file_sizes_adds_storage_used(self):
+        file_upload = self.create_file(self.user)
+        FileUpload.objects.filter(pk=file_upload.pk).update(file_size=None)
+        get_user_model().objects.update(storage_used=0)
+
+        self.assertEqual(FileUpload.backfill_file_sizes(), (1, 0))
+        self.assertStorageUsed(self.user, len(TEST_FILE_CONTENT))
+
+    def test_recalculate_storage_used(self):
+        self.create_file(self.user)
+        get_user_model().objects.filter(pk=self.user.pk).update(
+            storage_used=1000
+        )
+
+        out = StringIO()
+        call_command("recalculatestorage", stdout=out)
+        self.assertIn(
+            "Corrected the storage used by 1 user(s)", out.getvalue()
+        )
+        self.assertStorageUsed(self.user, len(TEST_FILE_CONTENT))
+        self.assertStorageUsed(self.user_2, 0)
+
+        out = StringIO()
+        call_command("recalculatestorage", stdout=out)
+        self.assertIn("Storage used is correct for all users", out.getvalue())
+
+    def test_get_storage_quota(self):
+        self.assertIsNone(self.user.get_storage_quota())
+
+        SiteSetting.objects.create(name="default_storage_quota", value="10")
+        self.assertEqual(self.user.get_storage_quota(), 10 * 1024 * 1024)
+
+        self.user.storage_quota = 5
+        self.assertEqual(self.user.get_storage_quota(), 5 * 1024 * 1024)
+
+        self.user.storage_quota = 0
+        self.assertIsNone(self.user.get_storage_quota())
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class StorageQuotaUploadTest(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            TEST_USER_EMAIL, TEST_USER_PASSWORD
+        )
+        # Leave less than one test file of space
+        self.user.storage_quota = 1
+        self.user.storage_used = 1024 * 1024 - 1
+        self.user.save()
+        self.client = Client()
+        self.client.login(email=TEST_USER_EMAIL, password=TEST_USER_PASSWORD)
+        self.expiry_datetime = (
+            timezone.now() + datetime.timedelta(days=1)
+        ).isoformat(sep=" ", timespec="minutes")
+
+    def tearDown(self):
+        rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+
+    def upload(self):
+        return self.client.post(
+            reverse("shifter_files:index"),
+            {
+                "expiry_datetime": self.expiry_datetime,
+                "file_content": SimpleUploadedFile(
+                    TEST_FILE_NAME, TEST_FILE_CONTENT
+                ),
+            },
+        )
+
+    def test_upload_over_quota(self):
+        response = self.upload()
+        self.assertEqual(response.status_code, 400)
+        self.assertJSONEqual(
+            response.content.decode(),
+            {
+                "errors": {
+                    "file_content": [
+                        (
+                            "You don't have enough storage left to upload "
+                            "this file. You have used 1MB of your 1MB quota."
+                        )
+                    ]
+                }
+            },
+        )
+        self.assertEqual(FileUpload.objects.count(), 0)
+        # The file written as it was received is removed
+        self.assertEqual(
+            list(pathlib.Path(settings.MEDIA_ROOT).rglob("*.txt*")), []
+        )
+
+    def test_upload_within_quota(self):
+        self.user.storage_quota = 2
+        self.user.save()
+        response = self.upload()
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        self.assertEqual(
+            self.user.storage_used, 1024 * 1024 - 1 + len(TEST_FILE_CONTENT)
+        )
+
+    def test_default_quota_used(self):
+        self.user.storage_quota = None
+        self.user.save()
+        self.assertEqual(self.upload().status_code, 200)
+
+        SiteSetting.objects.create(name="default_storage_quota", value="1")
+        self.assertEqual(self.upload().status_code, 400)
+
+    def test_unlimited_quota(self):
+        SiteSetting.objects.create(name="default_storage_quota", value="1")
+        self.user.storage_quota = 0
+        self.user.save()
+        self.assertEqual(self.upload().status_code, 200)
+
+    def test_chunked_upload_over_quota(self):
+        response = self.client.post(
+            reverse("shifter_files:chunked-upload"),
+            {"expiry_datetime": self.expiry_datetime},
+            headers={"Upload-Length": str(len(TEST_FILE_CONTENT))},
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("upload_length", response.json()["errors"])
+        self.assertEqual(ChunkedUpload.objects.count(), 0)
+
+    def start_chunked_upload(self):
+        return self.client.post(
+            reverse("shifter_files:chunked-upload"),
+            {"expiry_datetime": self.expiry_datetime},
+            headers={"Upload-Length": str(len(TEST_FILE_CONTENT))},
+        )
+
+    def test_chunked_uploads_in_progress_count_towards_quota(self):
+        self.user.storage_used = 0
+        self.user.save()
+        ChunkedUpload.objects.create(
+            owner=self.user, upload_length=1024 * 1024 - 1
+        )
+        response = self.start_chunked_upload()
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("upload_length", response.json()["errors"])
+        self.assertEqual(ChunkedUpload.objects.count(), 1)
+
+    def test_chunked_upload_over_quota_when_completed(self):
+        self.user.storage_used = 0
+        self.user.save()
+        response = self.start_chunked_upload()
+        self.assertEqual(response.status_code, 201)
+
+        # Another upload finishes first and uses up the space
+        self.user.storage_used = 1024 * 1024 - 1
+        self.user.save()
+        response = self.client.patch(
+            reverse(
+                "shifter_files:chunked-upload-patch",
+                args=[response.json()["upload_id"]],
+            ),
+            TEST_FILE_CONTENT,
+            content_type="application/offset+octet-stream",
+            headers={"Upload-Offset": "0", "Upload-Name": TEST_FILE_NAME},
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(FileUpload.objects.count(), 0)
+        self.assertEqual(ChunkedUpload.objects.count(), 0)
+        # The assembled file is removed
+        media_root = pathlib.Path(settings.MEDIA_ROOT)
+        self.assertEqual([p for p in media_root.rglob("*") if p.is_file()], [])
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.storage_used, 1024 * 1024 - 1)
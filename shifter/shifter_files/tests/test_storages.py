@@ -0,0 +1,349 @@
+import datetime
+import hashlib
+import os
+from unittest import mock, skipUnless
+from urllib.parse import parse_qs, urlparse
+
+import boto3
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from shifter_files.downloads import read_range
+from shifter_files.models import ChunkedUpload, FileUpload, sharded_name
+from shifter_files.reconcile import reconcile_storage
+from shifter_files.storages import PART_SIZE, S3Storage
+
+try:
+    from moto import mock_aws
+except ImportError:
+    # Only installed for development, from requirements_dev.txt
+    mock_aws = None
+
+TEST_USER_EMAIL = "iama@test.com"
+TEST_USER_PASSWORD = "mytemporarypassword"
+
+TEST_FILE_NAME = "mytestfile.txt"
+TEST_FILE_CONTENT = b"Hello, World!"
+
+TEST_BUCKET_NAME = "shifter-test"
+
+S3_STORAGES = {
+    **settings.STORAGES,
+    "default": {
+        "BACKEND": "shifter_files.storages.S3Storage",
+        "OPTIONS": {
+            "bucket_name": TEST_BUCKET_NAME,
+            "region_name": "us-east-1",
+            "access_key": "testing",
+            "secret_key": "testing",
+            "file_overwrite": False,
+        },
+    },
+}
+
+
+@skipUnless(mock_aws, "moto is not installed")
+@override_settings(
+    STORAGES=S3_STORAGES,
+    DOWNLOAD_BACKEND="redirect",
+    DOWNLOAD_STATS_FLUSH_INTERVAL=0,
+)
+class S3StorageTest(TestCase):
+    def setUp(self):
+        aws = mock_aws()
+        aws.start()
+        self.addCleanup(aws.stop)
+        self.client_s3 = boto3.client(
+            "s3",
+            region_name="us-east-1",
+            aws_access_key_id="testing",
+            aws_secret_access_key="testing",
+        )
+        self.client_s3.create_bucket(Bucket=TEST_BUCKET_NAME)
+
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            TEST_USER_EMAIL, TEST_USER_PASSWORD
+        )
+        self.client = Client()
+        self.client.login(email=TEST_USER_EMAIL, password=TEST_USER_PASSWORD)
+        self.expiry_datetime = (
+            timezone.now() + datetime.timedelta(days=1)
+        ).isoformat(sep=" ", timespec="minutes")
+
+    def stored_keys(self):
+        response = self.client_s3.list_objects_v2(Bucket=TEST_BUCKET_NAME)
+        return [obj["Key"] for obj in response.get("Contents", [])]
+
+    def stored_content(self, name):
+        return self.client_s3.get_object(Bucket=TEST_BUCKET_NAME, Key=name)[
+            "Body"
+        ].read()
+
+    def multipart_uploads(self):
+        response = self.client_s3.list_multipart_uploads(
+            Bucket=TEST_BUCKET_NAME
+        )
+        return response.get("Uploads", [])
+
+    def create_file(self, content=TEST_FILE_CONTENT, expiry_datetime=None):
+        if expiry_datetime is None:
+            expiry_datetime = timezone.now() + datetime.timedelta(days=1)
+        return FileUpload.objects.create(
+            owner=self.user,
+            file_content=SimpleUploadedFile(TEST_FILE_NAME, content),
+            upload_datetime=timezone.now(),
+            expiry_datetime=expiry_datetime,
+            filename=TEST_FILE_NAME,
+        )
+
+    def test_upload_sent_in_parts(self):
+        content = os.urandom(2 * PART_SIZE + PART_SIZE // 2)
+        with mock.patch.object(
+            S3Storage,
+            "upload_part",
+            autospec=True,
+            side_effect=S3Storage.upload_part,
+        ) as upload_part:
+            response = self.client.post(
+                reverse("shifter_files:index"),
+                {
+                    "expiry_datetime": self.expiry_datetime,
+                    "file_content": SimpleUploadedFile(
+                        TEST_FILE_NAME, content
+                    ),
+                },
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(upload_part.call_count, 3)
+
+        file_upload = FileUpload.objects.get()
+        self.assertEqual(file_upload.file_size, len(content))
+        self.assertEqual(
+            file_upload.file_hash, hashlib.md5(content).hexdigest()
+        )
+        self.assertEqual(
+            self.stored_content(file_upload.file_content.name), content
+        )
+        self.assertEqual(self.multipart_uploads(), [])
+
+    def test_invalid_upload_discarded(self):
+        response = self.client.post(
+            reverse("shifter_files:index"),
+            {
+                "expiry_datetime": "not a date",
+                "file_content": SimpleUploadedFile(
+                    TEST_FILE_NAME, TEST_FILE_CONTENT
+                ),
+            },
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.stored_keys(), [])
+
+    def start_chunked_upload(self, upload_length):
+        response = self.client.post(
+            reverse("shifter_files:chunked-upload"),
+            {"expiry_datetime": self.expiry_datetime},
+            headers={"Upload-Length": str(upload_length)},
+        )
+        self.assertEqual(response.status_code, 201)
+        return response.json()["upload_id"]
+
+    def send_chunk(self, upload_id, data, offset, upload_length):
+        return self.client.patch(
+            reverse("shifter_files:chunked-upload-patch", args=[upload_id]),
+            data,
+            content_type="application/offset+octet-stream",
+            headers={
+                "Upload-Offset": str(offset),
+                "Upload-Length": str(upload_length),
+                "Upload-Name": TEST_FILE_NAME,
+            },
+        )
+
+    def test_chunked_upload(self):
+        chunk_size = 5 * 1024 * 1024
+        content = os.urandom(chunk_size + 1024)
+        upload_id = self.start_chunked_upload(len(content))
+
+        response = self.send_chunk(
+            upload_id, content[:chunk_size], 0, len(content)
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(response["Upload-Offset"], str(chunk_size))
+        self.assertEqual(len(self.multipart_uploads()), 1)
+
+        response = self.send_chunk(
+            upload_id, content[chunk_size:], chunk_size, len(content)
+        )
+        self.assertEqual(response.status_code, 200)
+
+        file_upload = FileUpload.objects.get(file_hex=upload_id)
+        self.assertEqual(
+            file_upload.file_hash, hashlib.md5(content).hexdigest()
+        )
+        self.assertEqual(
+            self.stored_content(file_upload.file_content.name), content
+        )
+        self.assertFalse(ChunkedUpload.objects.exists())
+        self.assertEqual(self.multipart_uploads(), [])
+
+    def test_short_chunk_must_be_resent(self):
+        upload_length = 6 * 1024 * 1024
+        self.start_chunked_upload(upload_length)
+        chunked_upload = ChunkedUpload.objects.get()
+
+        class ShortStream:
+            def __init__(self, data):
+                self.data = data
+
+            def read(self, size):
+                data, self.data = self.data[:size], self.data[size:]
+                return data
+
+        self.assertTrue(
+            chunked_upload.write_chunk(
+                ShortStream(b"x" * 1024), 5 * 1024 * 1024
+            )
+        )
+        chunked_upload.refresh_from_db()
+        self.assertEqual(chunked_upload.offset, 0)
+        self.assertEqual(chunked_upload.num_parts, 0)
+
+    def test_deleting_chunked_upload_aborts_it(self):
+        chunk_size = 5 * 1024 * 1024
+        upload_id = self.start_chunked_upload(chunk_size + 1)
+        self.send_chunk(upload_id, b"x" * chunk_size, 0, chunk_size + 1)
+        self.assertEqual(len(self.multipart_uploads()), 1)
+
+        ChunkedUpload.objects.get().delete()
+        self.assertEqual(self.multipart_uploads(), [])
+        self.assertEqual(self.stored_keys(), [])
+
+    def test_download_redirects_to_bucket(self):
+        file_upload = self.create_file()
+        response = self.client.get(
+            reverse("shifter_files:file-download", args=[file_upload.file_hex])
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertIn("no-cache", response["Cache-Control"])
+
+        url = urlparse(response["Location"])
+        self.assertIn(TEST_BUCKET_NAME, url.netloc)
+        self.assertEqual(url.path, f"/{file_upload.file_content.name}")
+        query = parse_qs(url.query)
+        self.assertEqual(
+            query["response-content-disposition"],
+            [f'attachment; filename="{TEST_FILE_NAME}"'],
+        )
+        self.assertTrue(any("Signature" in key for key in query))
+
+        file_upload.refresh_from_db()
+        self.assertEqual(file_upload.download_count, 1)
+        self.assertEqual(file_upload.bytes_served, len(TEST_FILE_CONTENT))
+
+    def test_expired_download_not_redirected(self):
+        file_upload = self.create_file(
+            expiry_datetime=timezone.now() - datetime.timedelta(days=1)
+        )
+        response = self.client.get(
+            reverse("shifter_files:file-download", args=[file_upload.file_hex])
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_read_range(self):
+        file_upload = self.create_file()
+        self.assertEqual(
+            b"".join(read_range(file_upload.file_content, 7, 11)), b"World"
+        )
+        with default_storage.open(file_upload.file_content.name) as f:
+            self.assertEqual(f.size, len(TEST_FILE_CONTENT))
+            f.seek(7)
+            self.assertEqual(f.read(5), b"World")
+            f.seek(0)
+            self.assertEqual(f.read(), TEST_FILE_CONTENT)
+            self.assertEqual(f.read(), b"")
+
+    def test_delete_expired_files_in_one_request(self):
+        expired = timezone.now() - datetime.timedelta(days=1)
+        for _ in range(3):
+            self.create_file(expiry_datetime=expired)
+        kept = self.create_file()
+
+        with mock.patch.object(
+            S3Storage, "delete", autospec=True, side_effect=S3Storage.delete
+        ) as delete:
+            self.assertEqual(FileUpload.delete_expired_files(), 3)
+        delete.assert_not_called()
+        self.assertEqual(self.stored_keys(), [kept.file_content.name])
+
+    def test_delete_file(self):
+        file_upload = self.create_file()
+        file_upload.delete()
+        self.assertEqual(self.stored_keys(), [])
+
+    def test_shard_files(self):
+        file_upload = self.create_file()
+        legacy_name = f"uploads/{TEST_FILE_NAME}_{file_upload.file_hex}"
+        self.client_s3.copy_object(
+            Bucket=TEST_BUCKET_NAME,
+            Key=legacy_name,
+            CopySource={
+                "Bucket": TEST_BUCKET_NAME,
+                "Key": file_upload.file_content.name,
+            },
+        )
+        self.client_s3.delete_object(
+            Bucket=TEST_BUCKET_NAME, Key=file_upload.file_content.name
+        )
+        FileUpload.objects.filter(pk=file_upload.pk).update(
+            file_content=legacy_name
+        )
+
+        self.assertEqual(FileUpload.shard_files(), 1)
+        new_name = sharded_name(file_upload.file_hex)
+        self.assertEqual(self.stored_keys(), [new_name])
+        self.assertEqual(self.stored_content(new_name), TEST_FILE_CONTENT)
+        file_upload.refresh_from_db()
+        self.assertEqual(file_upload.file_content.name, new_name)
+
+    def test_reconcile_storage(self):
+        kept = self.create_file()
+        missing = self.create_file()
+        self.client_s3.delete_object(
+            Bucket=TEST_BUCKET_NAME, Key=missing.file_content.name
+        )
+        orphan = sharded_name("0" * 32)
+        self.client_s3.put_object(
+            Bucket=TEST_BUCKET_NAME, Key=orphan, Body=TEST_FILE_CONTENT
+        )
+
+        self.assertEqual(
+            reconcile_storage(min_age=datetime.timedelta()),
+            (1, len(TEST_FILE_CONTENT), 1),
+        )
+        self.assertEqual(self.stored_keys(), [kept.file_content.name])
+        self.assertEqual(list(FileUpload.objects.all()), [kept])
+
+    def test_verify_files(self):
+        file_upload = self.create_file()
+        FileUpload.objects.filter(pk=file_upload.pk).update(
+            file_hash=hashlib.new(
+                settings.FILE_HASH_ALGORITHM, TEST_FILE_CONTENT
+            ).hexdigest()
+        )
+        self.assertEqual(FileUpload.verify_files(), {"ok": 1})
+
+        self.client_s3.put_object(
+            Bucket=TEST_BUCKET_NAME,
+            Key=file_upload.file_content.name,
+            Body=b"changed",
+        )
+        with self.assertLogs("shifter_files.models", "ERROR"):
+            counts = FileUpload.verify_files(min_interval=datetime.timedelta())
+        self.assertEqual(counts, {"mismatch": 1})
@@ -30,3 +30,6 @@ class PrettyFileSizeTest(TestCase):
         self.assertEqual(pretty_file_size(terabyte), "1TB")
         self.assertEqual(pretty_file_size(petabyte - 1), "999TB")
         self.assertEqual(pretty_file_size(petabyte), "1000TB")
+
+    def test_unknown(self):
+        self.assertEqual(pretty_file_size(None), "Unknown")
@@ -0,0 +1,220 @@
+import datetime
+import hashlib
+import os
+import pathlib
+import tempfile
+from shutil import rmtree
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.uploadhandler import StopFutureHandlers
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from shifter_files.models import FileUpload, sharded_name
+from shifter_files.uploadhandlers import (
+    HashingFileUploadHandler,
+    OverQuotaUploadedFile,
+    StoredUploadedFile,
+)
+
+TEST_USER_EMAIL = "iama@test.com"
+TEST_USER_PASSWORD = "mytemporarypassword"
+
+TEST_FILE_NAME = "mytestfile.txt"
+TEST_FILE_CONTENT = b"Hello, World!"
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class HashingFileUploadHandlerTest(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            TEST_USER_EMAIL, TEST_USER_PASSWORD
+        )
+        self.client = Client()
+        self.client.login(email=TEST_USER_EMAIL, password=TEST_USER_PASSWORD)
+
+    def tearDown(self):
+        rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+
+    def upload(self, content, expiry_datetime=None):
+        if expiry_datetime is None:
+            expiry_datetime = timezone.now() + datetime.timedelta(days=1)
+        return self.client.post(
+            reverse("shifter_files:index"),
+            {
+                "expiry_datetime": expiry_datetime.isoformat(
+                    sep=" ", timespec="minutes"
+                ),
+                "file_content": SimpleUploadedFile(TEST_FILE_NAME, content),
+            },
+        )
+
+    def post_request(self):
+        request = RequestFactory().post("/")
+        request.user = self.user
+        return request
+
+    def uploaded_files(self):
+        uploads = pathlib.Path(settings.MEDIA_ROOT) / "uploads"
+        if not uploads.exists():
+            return []
+        return [path for path in uploads.rglob("*") if path.is_file()]
+
+    def test_handler_writes_file_to_final_location(self):
+        with mock.patch.object(
+            FileUpload, "calculate_file_hash"
+        ) as calculate_file_hash:
+            response = self.upload(TEST_FILE_CONTENT)
+        self.assertEqual(response.status_code, 200)
+        # The hash comes from the handler rather than a second read
+        calculate_file_hash.assert_not_called()
+
+        file_upload = FileUpload.objects.get()
+        self.assertEqual(
+            file_upload.file_content.name,
+            sharded_name(file_upload.file_hex),
+        )
+        self.assertEqual(
+            file_upload.file_hash, hashlib.md5(TEST_FILE_CONTENT).hexdigest()
+        )
+        self.assertEqual(len(self.uploaded_files()), 1)
+        with file_upload.file_content.open("rb") as f:
+            self.assertEqual(f.read(), TEST_FILE_CONTENT)
+
+    def test_handler_hashes_multiple_chunks(self):
+        content = os.urandom(HashingFileUploadHandler.chunk_size * 2 + 100)
+        response = self.upload(content)
+        self.assertEqual(response.status_code, 200)
+
+        file_upload = FileUpload.objects.get()
+        self.assertEqual(
+            file_upload.file_hash, hashlib.md5(content).hexdigest()
+        )
+        self.assertEqual(file_upload.file_content.size, len(content))
+
+    def test_invalid_upload_removes_stored_file(self):
+        response = self.upload(
+            TEST_FILE_CONTENT,
+            expiry_datetime=timezone.now() - datetime.timedelta(days=1),
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(FileUpload.objects.count(), 0)
+        self.assertEqual(self.uploaded_files(), [])
+
+    def test_unauthenticated_upload_not_stored(self):
+        client = Client()
+        response = client.post(
+            reverse("shifter_files:index"),
+            {
+                "file_content": SimpleUploadedFile(
+                    TEST_FILE_NAME, TEST_FILE_CONTENT
+                ),
+            },
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.uploaded_files(), [])
+
+    def test_csrf_failure_removes_stored_file(self):
+        client = Client(enforce_csrf_checks=True)
+        client.login(email=TEST_USER_EMAIL, password=TEST_USER_PASSWORD)
+        response = client.post(
+            reverse("shifter_files:index"),
+            {
+                "expiry_datetime": (
+                    timezone.now() + datetime.timedelta(days=1)
+                ).isoformat(sep=" ", timespec="minutes"),
+                "file_content": SimpleUploadedFile(
+                    TEST_FILE_NAME, TEST_FILE_CONTENT
+                ),
+            },
+        )
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(FileUpload.objects.count(), 0)
+        self.assertEqual(self.uploaded_files(), [])
+
+    def test_only_first_file_stored(self):
+        response = self.client.post(
+            reverse("shifter_files:index"),
+            {
+                "expiry_datetime": (
+                    timezone.now() + datetime.timedelta(days=1)
+                ).isoformat(sep=" ", timespec="minutes"),
+                "file_content": [
+                    SimpleUploadedFile(TEST_FILE_NAME, TEST_FILE_CONTENT),
+                    SimpleUploadedFile("other.txt", b"Other content"),
+                ],
+            },
+        )
+        self.assertEqual(response.status_code, 200)
+        file_upload = FileUpload.objects.get()
+        self.assertEqual(file_upload.filename, TEST_FILE_NAME)
+        self.assertEqual(len(self.uploaded_files()), 1)
+        with file_upload.file_content.open("rb") as f:
+            self.assertEqual(f.read(), TEST_FILE_CONTENT)
+
+    def test_upload_interrupted_removes_partial_file(self):
+        handler = HashingFileUploadHandler(self.post_request())
+        with self.assertRaises(StopFutureHandlers):
+            handler.new_file(
+                "file_content", TEST_FILE_NAME, "text/plain", None
+            )
+        handler.receive_data_chunk(TEST_FILE_CONTENT, 0)
+        self.assertEqual(len(self.uploaded_files()), 1)
+
+        handler.upload_interrupted()
+        self.assertEqual(self.uploaded_files(), [])
+
+    def test_handler_returns_stored_uploaded_file(self):
+        handler = HashingFileUploadHandler(self.post_request())
+        with self.assertRaises(StopFutureHandlers):
+            handler.new_file(
+                "file_content", TEST_FILE_NAME, "text/plain", None
+            )
+        handler.receive_data_chunk(TEST_FILE_CONTENT, 0)
+        uploaded_file = handler.file_complete(len(TEST_FILE_CONTENT))
+
+        self.assertIsInstance(uploaded_file, StoredUploadedFile)
+        self.assertEqual(uploaded_file.name, TEST_FILE_NAME)
+        self.assertEqual(uploaded_file.size, len(TEST_FILE_CONTENT))
+        self.assertEqual(uploaded_file.read(), TEST_FILE_CONTENT)
+
+        uploaded_file.discard()
+        self.assertEqual(self.uploaded_files(), [])
+
+    def test_file_over_quota_not_stored(self):
+        # Room for the first chunk, but not the second
+        self.user.storage_quota = 1
+        self.user.storage_used = 1024 * 1024 - len(TEST_FILE_CONTENT)
+        self.user.save()
+        handler = HashingFileUploadHandler(self.post_request())
+        with self.assertRaises(StopFutureHandlers):
+            handler.new_file(
+                "file_content", TEST_FILE_NAME, "text/plain", None
+            )
+        handler.receive_data_chunk(TEST_FILE_CONTENT, 0)
+        self.assertEqual(len(self.uploaded_files()), 1)
+
+        handler.receive_data_chunk(TEST_FILE_CONTENT, len(TEST_FILE_CONTENT))
+        self.assertEqual(self.uploaded_files(), [])
+        handler.receive_data_chunk(
+            TEST_FILE_CONTENT, 2 * len(TEST_FILE_CONTENT)
+        )
+        uploaded_file = handler.file_complete(3 * len(TEST_FILE_CONTENT))
+        self.assertIsInstance(uploaded_file, OverQuotaUploadedFile)
+        self.assertEqual(uploaded_file.size, 3 * len(TEST_FILE_CONTENT))
+        self.assertEqual(self.uploaded_files(), [])
+
+    def test_handler_ignores_other_fields(self):
+        handler = HashingFileUploadHandler(self.post_request())
+        handler.new_file("other_file", TEST_FILE_NAME, "text/plain", None)
+        self.assertEqual(
+            handler.receive_data_chunk(TEST_FILE_CONTENT, 0),
+            TEST_FILE_CONTENT,
+        )
+        self.assertIsNone(handler.file_complete(len(TEST_FILE_CONTENT)))
+        self.assertEqual(self.uploaded_files(), [])
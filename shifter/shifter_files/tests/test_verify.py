@@ -0,0 +1,195 @@
+import datetime
+import hashlib
+import io
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+from shutil import rmtree
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from shifter_files.models import BundleFile, FileBlob, FileUpload
+from shifter_files.verify import hash_file
+
+TEST_USER_EMAIL = "iama@test.com"
+TEST_USER_PASSWORD = "mytemporarypassword"
+
+TEST_FILE_NAME = "mytestfile.txt"
+TEST_FILE_CONTENT = b"Hello, World!"
+
+
+# Test runner processes can't start worker processes of their own
+@mock.patch("shifter_files.models.ProcessPoolExecutor", ThreadPoolExecutor)
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class VerifyFilesTest(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            TEST_USER_EMAIL, TEST_USER_PASSWORD
+        )
+
+    def tearDown(self):
+        rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+
+    def create_file(self, **kwargs):
+        return FileUpload.objects.create(
+            owner=self.user,
+            file_content=SimpleUploadedFile(TEST_FILE_NAME, TEST_FILE_CONTENT),
+            upload_datetime=timezone.now(),
+            filename=TEST_FILE_NAME,
+            file_hash=hashlib.new(
+                settings.FILE_HASH_ALGORITHM, TEST_FILE_CONTENT
+            ).hexdigest(),
+            **kwargs,
+        )
+
+    def command_output(self, *args):
+        out = StringIO()
+        call_command("verifyfiles", *args, stdout=out)
+        return out.getvalue()
+
+    def test_verify_files(self):
+        file_upload = self.create_file()
+        before = timezone.now()
+
+        out = self.command_output()
+        self.assertIn(
+            "Verified 1 file(s): 1 OK, 0 not matching their hash, 0 missing",
+            out,
+        )
+        file_upload.refresh_from_db()
+        self.assertEqual(file_upload.verify_status, "ok")
+        self.assertGreaterEqual(file_upload.last_verified_datetime, before)
+
+    def test_changed_file(self):
+        file_upload = self.create_file()
+        with open(
+            default_storage.path(file_upload.file_content.name), "wb"
+        ) as f:
+            f.write(b"Hello, World?")
+
+        with self.assertLogs("shifter_files.models", "ERROR"):
+            out = self.command_output()
+        self.assertIn("0 OK, 1 not matching their hash, 0 missing", out)
+        file_upload.refresh_from_db()
+        self.assertEqual(file_upload.verify_status, "mismatch")
+
+    def test_missing_file(self):
+        file_upload = self.create_file()
+        default_storage.delete(file_upload.file_content.name)
+
+        with self.assertLogs("shifter_files.models", "ERROR"):
+            counts = FileUpload.verify_files()
+        self.assertEqual(counts["missing"], 1)
+        file_upload.refresh_from_db()
+        self.assertEqual(file_upload.verify_status, "missing")
+
+    def test_recently_verified_files_skipped(self):
+        verified = self.create_file()
+        FileUpload.objects.filter(pk=verified.pk).update(
+            last_verified_datetime=timezone.now(), verify_status="ok"
+        )
+        self.create_file(
+            last_verified_datetime=timezone.now() - datetime.timedelta(days=1)
+        )
+        self.create_file()
+        # Files without a hash yet can't be verified
+        FileUpload.objects.create(
+            owner=self.user,
+            file_content=SimpleUploadedFile(TEST_FILE_NAME, TEST_FILE_CONTENT),
+            upload_datetime=timezone.now(),
+            filename=TEST_FILE_NAME,
+        )
+
+        self.assertEqual(FileUpload.verify_files(batch_size=1)["ok"], 2)
+        self.assertIn("No files need verifying", self.command_output())
+        self.assertEqual(
+            FileUpload.verify_files(min_interval=datetime.timedelta())["ok"],
+            3,
+        )
+
+    def test_shared_file_verified_for_each_upload(self):
+        first = self.create_file()
+        blob = FileBlob.objects.create(
+            file_hash=first.file_hash,
+            file_size=len(TEST_FILE_CONTENT),
+            file_content=first.file_content.name,
+            ref_count=2,
+        )
+        FileUpload.objects.filter(pk=first.pk).update(blob=blob)
+        FileUpload.objects.create(
+            owner=self.user,
+            file_content=first.file_content.name,
+            blob=blob,
+            upload_datetime=timezone.now(),
+            filename=TEST_FILE_NAME,
+            file_hash=first.file_hash,
+        )
+
+        self.assertEqual(FileUpload.verify_files(), {"ok": 2})
+        self.assertEqual(
+            FileUpload.objects.filter(verify_status="ok").count(), 2
+        )
+
+    def test_bundle_files_verified(self):
+        bundle = self.create_file(is_bundle=True)
+        file_hash = bundle.file_hash
+        bundle_files = [
+            BundleFile.objects.create(
+                bundle=bundle,
+                owner=self.user,
+                bundle_hex=bundle.file_hex,
+                filename=TEST_FILE_NAME,
+                file_content=SimpleUploadedFile(
+                    TEST_FILE_NAME, TEST_FILE_CONTENT
+                ),
+                file_hash=file_hash,
+                file_size=len(TEST_FILE_CONTENT),
+            )
+            for _ in range(2)
+        ]
+        with open(
+            default_storage.path(bundle_files[1].file_content.name), "wb"
+        ) as f:
+            f.write(b"Hello, World?")
+
+        with self.assertLogs("shifter_files.models", "ERROR"):
+            counts = FileUpload.verify_files()
+        self.assertEqual(counts, {"ok": 1, "mismatch": 1})
+        for bundle_file in bundle_files:
+            bundle_file.refresh_from_db()
+        self.assertEqual(bundle_files[0].verify_status, "ok")
+        self.assertEqual(bundle_files[1].verify_status, "mismatch")
+        self.assertIsNotNone(bundle_files[0].last_verified_datetime)
+        bundle.refresh_from_db()
+        self.assertEqual(bundle.verify_status, "")
+
+    def test_invalid_arguments(self):
+        for args in [["--workers", "0"], ["--max-rate", "0"]]:
+            with self.assertRaises(CommandError):
+                self.command_output(*args)
+
+
+class HashFileTest(TestCase):
+    def test_hash_file(self):
+        self.assertEqual(
+            hash_file(io.BytesIO(TEST_FILE_CONTENT), "sha256", 4),
+            hashlib.sha256(TEST_FILE_CONTENT).hexdigest(),
+        )
+
+    @mock.patch("shifter_files.verify.time")
+    def test_reads_throttled(self, time):
+        time.monotonic.return_value = 0
+        hash_file(io.BytesIO(b"x" * 30), "md5", 10, max_rate=5)
+        # Each 10 bytes read at 5 bytes a second should take 2 more seconds
+        self.assertEqual(
+            time.sleep.call_args_list,
+            [mock.call(2.0), mock.call(4.0), mock.call(6.0)],
+        )
@@ -0,0 +1,130 @@
+import datetime
+import io
+import tempfile
+import zipfile
+import zlib
+from shutil import rmtree
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from shifter_files.models import FileCollection, FileUpload
+from shifter_files.zipstream import (
+    ZIP64_END_SIGNATURE,
+    ZIP64_LOCATOR_SIGNATURE,
+    unique_names,
+)
+
+TEST_USER_EMAIL = "iama@test.com"
+TEST_USER_PASSWORD = "mytemporarypassword"
+
+TEST_FILE_CONTENT = b"Hello, World!"
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ZipStreamTest(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            TEST_USER_EMAIL, TEST_USER_PASSWORD
+        )
+        self.collection = FileCollection.objects.create(
+            owner=self.user, name="collection"
+        )
+
+    def tearDown(self):
+        rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+
+    def create_file(self, filename, content):
+        file_upload = FileUpload.objects.create(
+            owner=self.user,
+            file_content=SimpleUploadedFile(filename, content),
+            upload_datetime=timezone.now(),
+            expiry_datetime=timezone.now() + datetime.timedelta(days=1),
+            filename=filename,
+        )
+        self.collection.files.add(file_upload)
+        return file_upload
+
+    def zip_stream(self):
+        return self.collection.zip_stream(list(self.collection.get_files()))
+
+    def test_zip_contents(self):
+        large_content = bytes(range(256)) * 1024
+        self.create_file("hello.txt", TEST_FILE_CONTENT)
+        self.create_file("large.bin", large_content)
+        self.create_file("empty.txt", b"")
+        self.create_file("hello.txt", b"Another file")
+
+        zip_stream = self.zip_stream()
+        content = b"".join(zip_stream.stream())
+        self.assertEqual(len(content), zip_stream.size)
+        with zipfile.ZipFile(io.BytesIO(content)) as zf:
+            self.assertIsNone(zf.testzip())
+            self.assertEqual(
+                zf.namelist(),
+                ["hello.txt", "large.bin", "empty.txt", "hello (1).txt"],
+            )
+            self.assertEqual(zf.read("hello.txt"), TEST_FILE_CONTENT)
+            self.assertEqual(zf.read("large.bin"), large_content)
+            self.assertEqual(zf.read("empty.txt"), b"")
+            self.assertEqual(zf.read("hello (1).txt"), b"Another file")
+
+    def test_zip64_records(self):
+        self.create_file("hello.txt", TEST_FILE_CONTENT)
+
+        content = b"".join(self.zip_stream().stream())
+        self.assertIn(ZIP64_END_SIGNATURE.to_bytes(4, "little"), content)
+        self.assertIn(ZIP64_LOCATOR_SIGNATURE.to_bytes(4, "little"), content)
+
+    def test_ranges_match_whole_zip(self):
+        self.create_file("hello.txt", TEST_FILE_CONTENT)
+        self.create_file("large.bin", bytes(range(256)) * 1024)
+        content = b"".join(self.zip_stream().stream())
+
+        for start, end in [
+            (0, 0),
+            (10, 100),
+            (50, 200000),
+            (len(content) - 30, len(content) - 1),
+        ]:
+            with self.subTest(start=start, end=end):
+                # New stream each time, so CRC32s are recalculated
+                FileUpload.objects.update(file_crc32=None)
+                self.assertEqual(
+                    b"".join(self.zip_stream().stream(start, end)),
+                    content[start : end + 1],
+                )
+
+    def test_crc32_stored(self):
+        file_upload = self.create_file("hello.txt", TEST_FILE_CONTENT)
+        b"".join(self.zip_stream().stream())
+
+        file_upload.refresh_from_db()
+        self.assertEqual(file_upload.file_crc32, zlib.crc32(TEST_FILE_CONTENT))
+
+        # The stored CRC32 is used, rather than reading the file again
+        with mock.patch("zlib.crc32") as crc32:
+            b"".join(self.zip_stream().stream(40))
+        crc32.assert_not_called()
+
+    def test_size_known_before_streaming(self):
+        self.create_file("hello.txt", TEST_FILE_CONTENT)
+        with mock.patch(
+            "django.core.files.storage.FileSystemStorage.open"
+        ) as storage_open:
+            zip_stream = self.zip_stream()
+        storage_open.assert_not_called()
+        self.assertEqual(
+            zip_stream.size, len(b"".join(self.zip_stream().stream()))
+        )
+
+    def test_unique_names(self):
+        self.assertEqual(
+            unique_names(["a.txt", "b.txt", "a.txt", "a.txt", "a (1).txt"]),
+            ["a.txt", "b.txt", "a (1).txt", "a (2).txt", "a (1) (1).txt"],
+        )
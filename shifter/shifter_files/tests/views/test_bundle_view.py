@@ -0,0 +1,308 @@
+import datetime
+import io
+import pathlib
+import tempfile
+import zipfile
+from shutil import rmtree
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from shifter_files.models import BundleFile, ChunkedUpload, FileUpload
+from shifter_site_settings.models import SiteSetting
+
+TEST_USER_EMAIL = "iama@test.com"
+TEST_USER_PASSWORD = "mytemporarypassword"
+
+TEST_USER_EMAIL_2 = "shifter@github.com"
+TEST_USER_PASSWORD_2 = "mytemporarypassword"
+
+TEST_FILE_NAME = "mytestfile.txt"
+TEST_FILE_CONTENT = b"Hello, World!"
+
+
+@override_settings(
+    MEDIA_ROOT=tempfile.mkdtemp(), DOWNLOAD_STATS_FLUSH_INTERVAL=0
+)
+class BundleViewTest(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            TEST_USER_EMAIL, TEST_USER_PASSWORD
+        )
+        self.user_2 = User.objects.create_user(
+            TEST_USER_EMAIL_2, TEST_USER_PASSWORD_2
+        )
+        self.client = Client()
+        self.client.login(email=TEST_USER_EMAIL, password=TEST_USER_PASSWORD)
+
+    def tearDown(self):
+        rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+
+    def stored_files(self):
+        uploads = pathlib.Path(settings.MEDIA_ROOT) / "uploads"
+        return [path for path in uploads.rglob("*") if path.is_file()]
+
+    def expiry_data(self):
+        expiry_datetime = timezone.now() + datetime.timedelta(days=1)
+        return {
+            "enable_expiry": "on",
+            "expiry_datetime": expiry_datetime.isoformat(
+                sep=" ", timespec="minutes"
+            ),
+        }
+
+    def start_bundle(self):
+        response = self.client.post(reverse("shifter_files:bundle"))
+        self.assertEqual(response.status_code, 201)
+        return response.json()["bundle_hex"]
+
+    def start_upload(self, bundle_hex, content):
+        response = self.client.post(
+            reverse("shifter_files:chunked-upload"),
+            {**self.expiry_data(), "bundle_hex": bundle_hex},
+            headers={"Upload-Length": str(len(content))},
+        )
+        self.assertEqual(response.status_code, 201)
+        return response.json()["upload_id"]
+
+    def upload_file(self, bundle_hex, filename, content):
+        upload_id = self.start_upload(bundle_hex, content)
+        return self.client.patch(
+            reverse("shifter_files:chunked-upload-patch", args=[upload_id]),
+            content,
+            content_type="application/offset+octet-stream",
+            headers={
+                "Upload-Offset": "0",
+                "Upload-Length": str(len(content)),
+                "Upload-Name": filename,
+            },
+        )
+
+    def complete_bundle(self, bundle_hex, name="combined"):
+        return self.client.post(
+            reverse("shifter_files:bundle-complete", args=[bundle_hex]),
+            {**self.expiry_data(), "name": name},
+        )
+
+    def test_start_bundle_unauthenticated(self):
+        response = Client().post(reverse("shifter_files:bundle"))
+        self.assertEqual(response.status_code, 302)
+
+    def test_bundle_file_upload(self):
+        bundle_hex = self.start_bundle()
+        upload_id = self.start_upload(bundle_hex, TEST_FILE_CONTENT)
+        self.assertEqual(
+            ChunkedUpload.objects.get(upload_id=upload_id).bundle_hex,
+            bundle_hex,
+        )
+
+        response = self.client.patch(
+            reverse("shifter_files:chunked-upload-patch", args=[upload_id]),
+            TEST_FILE_CONTENT,
+            content_type="application/offset+octet-stream",
+            headers={
+                "Upload-Offset": "0",
+                "Upload-Length": str(len(TEST_FILE_CONTENT)),
+                "Upload-Name": TEST_FILE_NAME,
+            },
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(FileUpload.objects.count(), 0)
+
+        bundle_file = BundleFile.objects.get()
+        self.assertEqual(bundle_file.bundle_hex, bundle_hex)
+        self.assertIsNone(bundle_file.bundle)
+        self.assertEqual(bundle_file.filename, TEST_FILE_NAME)
+        self.assertEqual(bundle_file.file_size, len(TEST_FILE_CONTENT))
+
+    def test_complete_bundle(self):
+        bundle_hex = self.start_bundle()
+        self.upload_file(bundle_hex, "first.txt", b"first")
+        self.upload_file(bundle_hex, "second.txt", b"second file")
+
+        response = self.complete_bundle(bundle_hex, name="holiday")
+        self.assertEqual(response.status_code, 201)
+        self.assertJSONEqual(
+            response.content.decode(),
+            {
+                "redirect_url": reverse(
+                    "shifter_files:file-details", args=[bundle_hex]
+                )
+            },
+        )
+
+        bundle = FileUpload.objects.get()
+        self.assertTrue(bundle.is_bundle)
+        self.assertEqual(bundle.file_hex, bundle_hex)
+        self.assertEqual(bundle.filename, "holiday.zip")
+        self.assertEqual(bundle.owner, self.user)
+        self.assertEqual(bundle.bundle_files.count(), 2)
+
+        # The size of the zip the files are downloaded as
+        response = self.client.get(
+            reverse("shifter_files:file-download", args=[bundle_hex])
+        )
+        self.assertEqual(
+            bundle.file_size, len(b"".join(response.streaming_content))
+        )
+
+    def test_complete_bundle_without_files(self):
+        bundle_hex = self.start_bundle()
+        response = self.complete_bundle(bundle_hex)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(FileUpload.objects.count(), 0)
+
+    def test_complete_bundle_upload_in_progress(self):
+        bundle_hex = self.start_bundle()
+        self.upload_file(bundle_hex, "first.txt", b"first")
+        self.start_upload(bundle_hex, b"second file")
+
+        response = self.complete_bundle(bundle_hex)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(FileUpload.objects.count(), 0)
+
+    def test_complete_bundle_too_large(self):
+        SiteSetting.objects.create(name="max_file_size", value="1KB")
+        bundle_hex = self.start_bundle()
+        self.upload_file(bundle_hex, "first.txt", b"a" * 600)
+        self.upload_file(bundle_hex, "second.txt", b"b" * 600)
+
+        response = self.complete_bundle(bundle_hex)
+        self.assertEqual(response.status_code, 400)
+        self.assertJSONEqual(
+            response.content.decode(),
+            {
+                "errors": {
+                    "__all__": ["You can't upload a file larger than 1KB"]
+                }
+            },
+        )
+        self.assertEqual(FileUpload.objects.count(), 0)
+
+    def test_complete_other_users_bundle(self):
+        bundle_hex = self.start_bundle()
+        self.upload_file(bundle_hex, "first.txt", b"first")
+
+        client = Client()
+        client.login(email=TEST_USER_EMAIL_2, password=TEST_USER_PASSWORD_2)
+        response = client.post(
+            reverse("shifter_files:bundle-complete", args=[bundle_hex]),
+            {**self.expiry_data(), "name": "combined"},
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(FileUpload.objects.count(), 0)
+        self.assertIsNone(BundleFile.objects.get().bundle)
+
+    def test_download_bundle(self):
+        bundle_hex = self.start_bundle()
+        self.upload_file(bundle_hex, "first.txt", b"first")
+        self.upload_file(bundle_hex, "second.txt", b"second file")
+        self.upload_file(bundle_hex, "first.txt", b"another first")
+        self.complete_bundle(bundle_hex, name="holiday")
+
+        response = self.client.get(
+            reverse("shifter_files:file-download", args=[bundle_hex])
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/zip")
+        self.assertEqual(
+            response["Content-Disposition"],
+            'attachment; filename="holiday.zip"',
+        )
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+
+        content = b"".join(response.streaming_content)
+        with zipfile.ZipFile(io.BytesIO(content)) as zf:
+            self.assertIsNone(zf.testzip())
+            self.assertEqual(
+                zf.namelist(), ["first.txt", "second.txt", "first (1).txt"]
+            )
+            self.assertEqual(zf.read("first.txt"), b"first")
+            self.assertEqual(zf.read("second.txt"), b"second file")
+            self.assertEqual(zf.read("first (1).txt"), b"another first")
+
+    def test_asgi_download_bundle(self):
+        bundle_hex = self.start_bundle()
+        self.upload_file(bundle_hex, "first.txt", b"first")
+        self.upload_file(bundle_hex, "second.txt", b"second file")
+        self.complete_bundle(bundle_hex)
+        url = reverse("shifter_files:file-download", args=[bundle_hex])
+
+        async def download():
+            response = await self.async_client.get(url)
+            self.assertTrue(response.is_async)
+            return b"".join(
+                [chunk async for chunk in response.streaming_content]
+            )
+
+        self.assertTrue(
+            BundleFile.objects.filter(file_crc32__isnull=True).exists()
+        )
+        content = async_to_sync(download)()
+        with zipfile.ZipFile(io.BytesIO(content)) as zf:
+            self.assertIsNone(zf.testzip())
+            self.assertEqual(zf.read("second.txt"), b"second file")
+        # CRC32s worked out while streaming are saved
+        self.assertFalse(
+            BundleFile.objects.filter(file_crc32__isnull=True).exists()
+        )
+
+    def test_resume_bundle_download(self):
+        bundle_hex = self.start_bundle()
+        self.upload_file(bundle_hex, "first.txt", b"first")
+        self.upload_file(bundle_hex, "second.txt", b"second file")
+        self.complete_bundle(bundle_hex)
+        url = reverse("shifter_files:file-download", args=[bundle_hex])
+        content = b"".join(self.client.get(url).streaming_content)
+
+        response = self.client.get(url, headers={"Range": "bytes=40-"})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(
+            response["Content-Range"],
+            f"bytes 40-{len(content) - 1}/{len(content)}",
+        )
+        self.assertEqual(b"".join(response.streaming_content), content[40:])
+
+    def test_delete_bundle_deletes_files(self):
+        bundle_hex = self.start_bundle()
+        self.upload_file(bundle_hex, "first.txt", b"first")
+        self.upload_file(bundle_hex, "second.txt", b"second file")
+        self.complete_bundle(bundle_hex)
+        self.assertEqual(len(self.stored_files()), 2)
+
+        FileUpload.objects.get().delete()
+        self.assertEqual(BundleFile.objects.count(), 0)
+        self.assertEqual(self.stored_files(), [])
+
+    def test_expired_bundle_deletes_files(self):
+        bundle_hex = self.start_bundle()
+        self.upload_file(bundle_hex, "first.txt", b"first")
+        self.upload_file(bundle_hex, "second.txt", b"second file")
+        self.complete_bundle(bundle_hex)
+        FileUpload.objects.update(
+            expiry_datetime=timezone.now() - datetime.timedelta(days=1)
+        )
+
+        self.assertEqual(FileUpload.delete_expired_files(), 1)
+        self.assertEqual(BundleFile.objects.count(), 0)
+        self.assertEqual(self.stored_files(), [])
+
+    def test_delete_stale_files(self):
+        bundle_hex = self.start_bundle()
+        self.upload_file(bundle_hex, "first.txt", b"first")
+        self.upload_file(bundle_hex, "second.txt", b"second file")
+        BundleFile.objects.filter(filename="first.txt").update(
+            created_datetime=timezone.now() - BundleFile.STALE_AFTER
+        )
+
+        self.assertEqual(BundleFile.delete_stale_files(), 1)
+        self.assertEqual(
+            list(BundleFile.objects.values_list("filename", flat=True)),
+            ["second.txt"],
+        )
+        self.assertEqual(len(self.stored_files()), 1)
@@ -0,0 +1,330 @@
+import datetime
+import hashlib
+import json
+import pathlib
+import tempfile
+import threading
+from shutil import rmtree
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import (
+    Client,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.urls import reverse
+from django.utils import timezone
+
+from shifter_files.models import ChunkedUpload, FileUpload
+from shifter_site_settings.models import SiteSetting
+
+TEST_USER_EMAIL = "iama@test.com"
+TEST_USER_PASSWORD = "mytemporarypassword"
+
+TEST_USER_EMAIL_2 = "shifter@github.com"
+TEST_USER_PASSWORD_2 = "mytemporarypassword"
+
+TEST_FILE_NAME = "mytestfile.txt"
+TEST_FILE_CONTENT = b"Hello, World!"
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ChunkedUploadViewTest(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            TEST_USER_EMAIL, TEST_USER_PASSWORD
+        )
+        self.user_2 = User.objects.create_user(
+            TEST_USER_EMAIL_2, TEST_USER_PASSWORD_2
+        )
+        self.client = Client()
+        self.client.login(email=TEST_USER_EMAIL, password=TEST_USER_PASSWORD)
+
+    def tearDown(self):
+        rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+
+    def start_upload(self, upload_length, expiry_datetime=None):
+        if expiry_datetime is None:
+            expiry_datetime = timezone.now() + datetime.timedelta(days=1)
+        return self.client.post(
+            reverse("shifter_files:chunked-upload"),
+            {
+                "expiry_datetime": expiry_datetime.isoformat(
+                    sep=" ", timespec="minutes"
+                ),
+            },
+            headers={"Upload-Length": str(upload_length)},
+        )
+
+    def send_chunk(self, upload_id, data, offset, client=None):
+        client = client or self.client
+        return client.patch(
+            reverse("shifter_files:chunked-upload-patch", args=[upload_id]),
+            data,
+            content_type="application/offset+octet-stream",
+            headers={
+                "Upload-Offset": str(offset),
+                "Upload-Length": str(len(TEST_FILE_CONTENT)),
+                "Upload-Name": TEST_FILE_NAME,
+            },
+        )
+
+    def test_start_upload(self):
+        response = self.start_upload(len(TEST_FILE_CONTENT))
+        self.assertEqual(response.status_code, 201)
+
+        chunked_upload = ChunkedUpload.objects.get()
+        self.assertEqual(chunked_upload.owner, self.user)
+        self.assertEqual(chunked_upload.upload_length, len(TEST_FILE_CONTENT))
+        self.assertEqual(chunked_upload.offset, 0)
+        self.assertJSONEqual(
+            response.content.decode(),
+            {
+                "upload_id": chunked_upload.upload_id,
+                "redirect_url": reverse(
+                    "shifter_files:file-details",
+                    args=[chunked_upload.upload_id],
+                ),
+            },
+        )
+
+    def test_start_upload_unauthenticated(self):
+        client = Client()
+        response = client.post(
+            reverse("shifter_files:chunked-upload"),
+            headers={"Upload-Length": str(len(TEST_FILE_CONTENT))},
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(ChunkedUpload.objects.count(), 0)
+
+    def test_start_upload_too_large(self):
+        SiteSetting.objects.create(name="max_file_size", value="1KB")
+        response = self.start_upload(2048)
+        self.assertEqual(response.status_code, 400)
+        self.assertJSONEqual(
+            response.content.decode(),
+            {
+                "errors": {
+                    "upload_length": [
+                        "You can't upload a file larger than 1KB"
+                    ]
+                }
+            },
+        )
+        self.assertEqual(ChunkedUpload.objects.count(), 0)
+
+    def test_start_upload_expiry_in_past(self):
+        response = self.start_upload(
+            len(TEST_FILE_CONTENT),
+            expiry_datetime=timezone.now() - datetime.timedelta(days=1),
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(
+            "expiry_datetime", json.loads(response.content)["errors"]
+        )
+        self.assertEqual(ChunkedUpload.objects.count(), 0)
+
+    def test_upload_in_chunks(self):
+        response = self.start_upload(len(TEST_FILE_CONTENT))
+        upload_id = response.json()["upload_id"]
+
+        response = self.send_chunk(upload_id, TEST_FILE_CONTENT[:5], 0)
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(response["Upload-Offset"], "5")
+        self.assertEqual(FileUpload.objects.count(), 0)
+
+        response = self.send_chunk(upload_id, TEST_FILE_CONTENT[5:], 5)
+        self.assertEqual(response.status_code, 200)
+        self.assertJSONEqual(
+            response.content.decode(),
+            {
+                "redirect_url": reverse(
+                    "shifter_files:file-details", args=[upload_id]
+                )
+            },
+        )
+
+        self.assertEqual(ChunkedUpload.objects.count(), 0)
+        file_upload = FileUpload.objects.get()
+        self.assertEqual(file_upload.file_hex, upload_id)
+        self.assertEqual(file_upload.owner, self.user)
+        self.assertEqual(file_upload.filename, TEST_FILE_NAME)
+        self.assertEqual(
+            file_upload.file_hash, hashlib.md5(TEST_FILE_CONTENT).hexdigest()
+        )
+        with file_upload.file_content.open("rb") as f:
+            self.assertEqual(f.read(), TEST_FILE_CONTENT)
+        self.assertFalse(
+            (pathlib.Path(settings.MEDIA_ROOT) / "partial_uploads" / upload_id)
+            .exists()
+        )
+
+    def test_resume_upload(self):
+        response = self.start_upload(len(TEST_FILE_CONTENT))
+        upload_id = response.json()["upload_id"]
+        self.send_chunk(upload_id, TEST_FILE_CONTENT[:5], 0)
+
+        response = self.client.head(
+            reverse("shifter_files:chunked-upload-patch", args=[upload_id])
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Upload-Offset"], "5")
+
+        response = self.send_chunk(upload_id, TEST_FILE_CONTENT[5:], 5)
+        self.assertEqual(response.status_code, 200)
+        file_upload = FileUpload.objects.get()
+        with file_upload.file_content.open("rb") as f:
+            self.assertEqual(f.read(), TEST_FILE_CONTENT)
+
+    def test_resend_received_chunk(self):
+        response = self.start_upload(len(TEST_FILE_CONTENT))
+        upload_id = response.json()["upload_id"]
+        self.send_chunk(upload_id, TEST_FILE_CONTENT[:5], 0)
+
+        # Overlaps with the bytes already received
+        response = self.send_chunk(upload_id, TEST_FILE_CONTENT[:8], 0)
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(response["Upload-Offset"], "8")
+
+        response = self.send_chunk(upload_id, TEST_FILE_CONTENT[8:], 8)
+        self.assertEqual(response.status_code, 200)
+        file_upload = FileUpload.objects.get()
+        with file_upload.file_content.open("rb") as f:
+            self.assertEqual(f.read(), TEST_FILE_CONTENT)
+
+    def test_chunk_at_wrong_offset(self):
+        response = self.start_upload(len(TEST_FILE_CONTENT))
+        upload_id = response.json()["upload_id"]
+
+        response = self.send_chunk(upload_id, TEST_FILE_CONTENT[5:], 5)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response["Upload-Offset"], "0")
+        self.assertEqual(ChunkedUpload.objects.get().offset, 0)
+
+    def test_chunk_exceeds_upload_length(self):
+        response = self.start_upload(len(TEST_FILE_CONTENT))
+        upload_id = response.json()["upload_id"]
+
+        response = self.send_chunk(upload_id, TEST_FILE_CONTENT + b"!", 0)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(ChunkedUpload.objects.get().offset, 0)
+
+    def test_chunk_another_user(self):
+        response = self.start_upload(len(TEST_FILE_CONTENT))
+        upload_id = response.json()["upload_id"]
+
+        client_2 = Client()
+        client_2.login(email=TEST_USER_EMAIL_2, password=TEST_USER_PASSWORD_2)
+        response = self.send_chunk(
+            upload_id, TEST_FILE_CONTENT, 0, client=client_2
+        )
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(ChunkedUpload.objects.get().offset, 0)
+
+    def test_delete_stale_uploads(self):
+        response = self.start_upload(len(TEST_FILE_CONTENT))
+        upload_id = response.json()["upload_id"]
+        self.send_chunk(upload_id, TEST_FILE_CONTENT[:5], 0)
+        partial_path = (
+            pathlib.Path(settings.MEDIA_ROOT) / "partial_uploads" / upload_id
+        )
+        self.assertTrue(partial_path.is_file())
+
+        self.assertEqual(ChunkedUpload.delete_stale_uploads(), 0)
+        ChunkedUpload.objects.update(
+            created_datetime=timezone.now() - datetime.timedelta(days=2)
+        )
+        self.assertEqual(ChunkedUpload.delete_stale_uploads(), 1)
+        self.assertEqual(ChunkedUpload.objects.count(), 0)
+        self.assertFalse(partial_path.exists())
+
+    def test_failed_completion_removes_upload(self):
+        response = self.start_upload(len(TEST_FILE_CONTENT))
+        upload_id = response.json()["upload_id"]
+
+        with (
+            mock.patch.object(
+                FileUpload, "calculate_file_hash", side_effect=OSError
+            ),
+            self.assertRaises(OSError),
+        ):
+            self.send_chunk(upload_id, TEST_FILE_CONTENT, 0)
+        self.assertEqual(ChunkedUpload.objects.count(), 0)
+        self.assertEqual(FileUpload.objects.count(), 0)
+        media_root = pathlib.Path(settings.MEDIA_ROOT)
+        self.assertEqual([p for p in media_root.rglob("*") if p.is_file()], [])
+
+        # The client has to start the upload again
+        response = self.send_chunk(upload_id, TEST_FILE_CONTENT, 0)
+        self.assertEqual(response.status_code, 404)
+
+
+class BlockingStream:
+    """Stream which returns its first half, then waits for release before
+    returning the rest."""
+
+    def __init__(self, content):
+        self.content = content
+        self.position = 0
+        self.reading = threading.Event()
+        self.release = threading.Event()
+
+    def read(self, size):
+        half = len(self.content) // 2
+        if self.position == half:
+            self.reading.set()
+            self.release.wait(5)
+        limit = half if self.position < half else len(self.content)
+        end = min(self.position + size, limit)
+        data = self.content[self.position : end]
+        self.position = end
+        return data
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ChunkedUploadConcurrencyTest(TransactionTestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            TEST_USER_EMAIL, TEST_USER_PASSWORD
+        )
+
+    def tearDown(self):
+        rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+
+    def test_overlapping_writes_at_same_offset(self):
+        chunked_upload = ChunkedUpload.objects.create(
+            owner=self.user, upload_length=len(TEST_FILE_CONTENT)
+        )
+        # A retry of the same chunk, sent while the first is still writing
+        first = BlockingStream(TEST_FILE_CONTENT)
+        retry = BlockingStream(TEST_FILE_CONTENT)
+        retry.release.set()
+        results = {}
+
+        def write(name, stream):
+            upload = ChunkedUpload.objects.get(pk=chunked_upload.pk)
+            results[name] = upload.write_chunk(stream, len(TEST_FILE_CONTENT))
+
+        first_thread = threading.Thread(target=write, args=("first", first))
+        first_thread.start()
+        self.assertTrue(first.reading.wait(5))
+        retry_thread = threading.Thread(target=write, args=("retry", retry))
+        retry_thread.start()
+        # The retry waits for the first write rather than appending as well
+        retry_thread.join(0.5)
+        self.assertTrue(retry_thread.is_alive())
+        first.release.set()
+        first_thread.join(5)
+        retry_thread.join(5)
+
+        self.assertEqual(results, {"first": True, "retry": False})
+        chunked_upload.refresh_from_db()
+        self.assertEqual(chunked_upload.offset, len(TEST_FILE_CONTENT))
+        path = chunked_upload.storage.path(chunked_upload.partial_name)
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), TEST_FILE_CONTENT)
@@ -0,0 +1,242 @@
+import datetime
+import io
+import tempfile
+import zipfile
+from shutil import rmtree
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from shifter_files.models import FileCollection, FileUpload
+
+TEST_USER_EMAIL = "iama@test.com"
+TEST_USER_PASSWORD = "mytemporarypassword"
+
+TEST_USER_EMAIL_2 = "shifter@github.com"
+TEST_USER_PASSWORD_2 = "mytemporarypassword"
+
+TEST_FILE_CONTENT = b"Hello, World!"
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class FileCollectionViewTest(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            TEST_USER_EMAIL, TEST_USER_PASSWORD
+        )
+        self.user_2 = User.objects.create_user(
+            TEST_USER_EMAIL_2, TEST_USER_PASSWORD_2
+        )
+        self.client = Client()
+        self.client.login(email=TEST_USER_EMAIL, password=TEST_USER_PASSWORD)
+
+    def tearDown(self):
+        rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+
+    def create_file(self, filename, content=TEST_FILE_CONTENT, owner=None):
+        return FileUpload.objects.create(
+            owner=owner or self.user,
+            file_content=SimpleUploadedFile(filename, content),
+            upload_datetime=timezone.now(),
+            expiry_datetime=timezone.now() + datetime.timedelta(days=1),
+            filename=filename,
+        )
+
+    def create_collection(self, *files):
+        collection = FileCollection.objects.create(
+            owner=self.user, name="holiday"
+        )
+        collection.files.set(files)
+        return collection
+
+    def test_create_collection(self):
+        first = self.create_file("first.txt")
+        second = self.create_file("second.txt")
+        self.create_file("third.txt")
+
+        response = self.client.post(
+            reverse("shifter_files:collection-create"),
+            {"name": "holiday", "files": [first.pk, second.pk]},
+        )
+        collection = FileCollection.objects.get()
+        self.assertRedirects(
+            response,
+            reverse(
+                "shifter_files:collection-details",
+                args=[collection.collection_hex],
+            ),
+        )
+        self.assertEqual(collection.owner, self.user)
+        self.assertEqual(collection.filename, "holiday.zip")
+        self.assertEqual(list(collection.get_files()), [first, second])
+
+        response = self.client.get(reverse("shifter_files:myfiles"))
+        self.assertContains(response, "holiday.zip")
+
+    def test_create_collection_other_users_file(self):
+        other_file = self.create_file("other.txt", owner=self.user_2)
+
+        response = self.client.post(
+            reverse("shifter_files:collection-create"),
+            {"name": "holiday", "files": [other_file.pk]},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context["form"].errors["files"])
+        self.assertEqual(FileCollection.objects.count(), 0)
+
+    def test_create_collection_unauthenticated(self):
+        response = Client().get(reverse("shifter_files:collection-create"))
+        self.assertEqual(response.status_code, 302)
+
+    def test_collection_details(self):
+        collection = self.create_collection(self.create_file("first.txt"))
+
+        response = self.client.get(
+            reverse(
+                "shifter_files:collection-details",
+                args=[collection.collection_hex],
+            )
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "first.txt")
+        self.assertContains(
+            response,
+            reverse(
+                "shifter_files:collection-download-landing",
+                args=[collection.collection_hex],
+            ),
+        )
+
+    def test_collection_details_other_user(self):
+        collection = self.create_collection(self.create_file("first.txt"))
+
+        client = Client()
+        client.login(email=TEST_USER_EMAIL_2, password=TEST_USER_PASSWORD_2)
+        response = client.get(
+            reverse(
+                "shifter_files:collection-details",
+                args=[collection.collection_hex],
+            )
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_delete_collection_keeps_files(self):
+        collection = self.create_collection(self.create_file("first.txt"))
+
+        response = self.client.post(
+            reverse(
+                "shifter_files:collection-delete",
+                args=[collection.collection_hex],
+            )
+        )
+        self.assertRedirects(response, reverse("shifter_files:myfiles"))
+        self.assertEqual(FileCollection.objects.count(), 0)
+        self.assertEqual(FileUpload.objects.count(), 1)
+
+    def test_download_landing_anon_user(self):
+        collection = self.create_collection(self.create_file("first.txt"))
+
+        response = Client().get(
+            reverse(
+                "shifter_files:collection-download-landing",
+                args=[collection.collection_hex],
+            )
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "first.txt")
+
+    def test_download(self):
+        first = self.create_file("first.txt", b"first")
+        second = self.create_file("second.txt", b"second file")
+        expired = self.create_file("expired.txt")
+        expired.expiry_datetime = timezone.now() - datetime.timedelta(days=1)
+        expired.save()
+        collection = self.create_collection(first, second, expired)
+
+        response = Client().get(
+            reverse(
+                "shifter_files:collection-download",
+                args=[collection.collection_hex],
+            )
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/zip")
+        self.assertEqual(
+            response["Content-Disposition"],
+            'attachment; filename="holiday.zip"',
+        )
+        content = b"".join(response.streaming_content)
+        self.assertEqual(int(response["Content-Length"]), len(content))
+        with zipfile.ZipFile(io.BytesIO(content)) as zf:
+            self.assertEqual(zf.namelist(), ["first.txt", "second.txt"])
+            self.assertEqual(zf.read("second.txt"), b"second file")
+
+    def test_download_range(self):
+        collection = self.create_collection(
+            self.create_file("first.txt", b"first"),
+            self.create_file("second.txt", b"second file"),
+        )
+        url = reverse(
+            "shifter_files:collection-download",
+            args=[collection.collection_hex],
+        )
+        response = self.client.get(url)
+        content = b"".join(response.streaming_content)
+        etag = response["ETag"]
+
+        response = self.client.get(
+            url, headers={"Range": "bytes=10-99", "If-Range": etag}
+        )
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(
+            response["Content-Range"], f"bytes 10-99/{len(content)}"
+        )
+        self.assertEqual(response["Content-Length"], "90")
+        self.assertEqual(b"".join(response.streaming_content), content[10:100])
+
+        # Range is ignored if the files in the collection have changed
+        response = self.client.get(
+            url, headers={"Range": "bytes=10-99", "If-Range": '"changed"'}
+        )
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get(
+            url, headers={"Range": f"bytes={len(content)}-"}
+        )
+        self.assertEqual(response.status_code, 416)
+
+    def test_download_not_modified(self):
+        collection = self.create_collection(self.create_file("first.txt"))
+        url = reverse(
+            "shifter_files:collection-download",
+            args=[collection.collection_hex],
+        )
+        etag = self.client.get(url)["ETag"]
+
+        response = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+
+        collection.files.add(self.create_file("second.txt"))
+        response = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+
+    def test_download_all_expired(self):
+        expired = self.create_file("expired.txt")
+        expired.expiry_datetime = timezone.now() - datetime.timedelta(days=1)
+        expired.save()
+        collection = self.create_collection(expired)
+
+        for name in [
+            "shifter_files:collection-download",
+            "shifter_files:collection-download-landing",
+        ]:
+            with self.subTest(name=name):
+                response = Client().get(
+                    reverse(name, args=[collection.collection_hex])
+                )
+                self.assertEqual(response.status_code, 404)
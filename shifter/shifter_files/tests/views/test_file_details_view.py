@@ -1,9 +1,11 @@
 import datetime
 import tempfile
 from shutil import rmtree
+from unittest import mock
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.files.storage import FileSystemStorage
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
@@ -104,6 +106,49 @@ class FileDetailsViewTest(TestCase):
             response, "shifter_files/fileupload_detail.html"
         )
 
+    def test_file_size_not_read_from_storage(self):
+        client = Client()
+        client.login(email=TEST_USER_EMAIL, password=TEST_USER_PASSWORD)
+        test_file = SimpleUploadedFile(TEST_FILE_NAME, TEST_FILE_CONTENT)
+        file_upload = FileUpload.objects.create(
+            owner=self.user,
+            file_content=test_file,
+            upload_datetime=timezone.now(),
+            expiry_datetime=timezone.now() + datetime.timedelta(weeks=1),
+            filename=TEST_FILE_NAME,
+        )
+        url = reverse(
+            "shifter_files:file-details", args=[file_upload.file_hex]
+        )
+        with mock.patch.object(
+            FileSystemStorage, "size", side_effect=AssertionError
+        ):
+            response = client.get(url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "13B")
+
+    def test_checksum_algorithm_shown(self):
+        client = Client()
+        client.login(email=TEST_USER_EMAIL, password=TEST_USER_PASSWORD)
+        test_file = SimpleUploadedFile(TEST_FILE_NAME, TEST_FILE_CONTENT)
+        file_upload = FileUpload.objects.create(
+            owner=self.user,
+            file_content=test_file,
+            upload_datetime=timezone.now(),
+            expiry_datetime=timezone.now() + datetime.timedelta(weeks=1),
+            filename=TEST_FILE_NAME,
+            file_hash=FileUpload.calculate_file_hash(test_file, "sha256"),
+            file_hash_algorithm="sha256",
+        )
+        url = reverse(
+            "shifter_files:file-details", args=[file_upload.file_hex]
+        )
+        response = client.get(url)
+
+        self.assertContains(response, "<span>SHA-256:</span>", html=True)
+        self.assertContains(response, file_upload.file_hash)
+
     def test_file_does_not_exist(self):
         client = Client()
         client.login(email=TEST_USER_EMAIL, password=TEST_USER_PASSWORD)
@@ -1,13 +1,20 @@
 import datetime
 import tempfile
 from shutil import rmtree
+from unittest import mock
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase, override_settings
+from django.test import (
+    Client,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
 from django.urls import reverse
-from django.utils import timezone
+from django.utils import dateformat, timezone
 
 from shifter_files.models import FileUpload
 
@@ -136,3 +143,140 @@ class FileDownloadLandingViewTest(TestCase):
         response = client.get(url)
 
         self.assertEqual(response.status_code, 404)
+
+    async def test_asgi_get(self):
+        test_file = SimpleUploadedFile(TEST_FILE_NAME, TEST_FILE_CONTENT)
+        file_upload = await FileUpload.objects.acreate(
+            owner=self.user,
+            file_content=test_file,
+            upload_datetime=timezone.now(),
+            expiry_datetime=timezone.now() + datetime.timedelta(weeks=1),
+            filename=TEST_FILE_NAME,
+        )
+        url = reverse(
+            "shifter_files:file-download-landing", args=[file_upload.file_hex]
+        )
+        response = await self.async_client.get(url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(
+            response, "shifter_files/file_download_landing.html"
+        )
+        self.assertInHTML(
+            f"You are downloading: {TEST_FILE_NAME}", response.content.decode()
+        )
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class FileDownloadLandingCacheTest(TransactionTestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            TEST_USER_EMAIL, TEST_USER_PASSWORD
+        )
+        test_file = SimpleUploadedFile(TEST_FILE_NAME, TEST_FILE_CONTENT)
+        self.file_upload = FileUpload.objects.create(
+            owner=self.user,
+            file_content=test_file,
+            upload_datetime=timezone.now(),
+            expiry_datetime=timezone.now() + datetime.timedelta(weeks=1),
+            filename=TEST_FILE_NAME,
+        )
+        self.url = reverse(
+            "shifter_files:file-download-landing",
+            args=[self.file_upload.file_hex],
+        )
+        cache.clear()
+
+    def tearDown(self):
+        cache.clear()
+        rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+
+    def test_cached_page_needs_no_queries(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertInHTML(
+            f"<title>{TEST_FILE_NAME} | Shifter</title>",
+            response.content.decode(),
+        )
+        self.assertInHTML(
+            f"You are downloading: {TEST_FILE_NAME}", response.content.decode()
+        )
+
+    def test_cached_page_shows_user_navigation(self):
+        self.client.get(self.url)
+        client = Client()
+        client.login(email=TEST_USER_EMAIL, password=TEST_USER_PASSWORD)
+        response = client.get(self.url)
+        self.assertContains(response, reverse("shifter_files:myfiles"))
+        self.assertNotContains(
+            self.client.get(self.url), reverse("shifter_files:myfiles")
+        )
+
+    def test_cache_cleared_on_expiry_edit(self):
+        self.client.get(self.url)
+        client = Client()
+        client.login(email=TEST_USER_EMAIL, password=TEST_USER_PASSWORD)
+        new_expiry = timezone.now() + datetime.timedelta(days=3)
+        client.post(
+            reverse(
+                "shifter_files:file-edit-expiry",
+                args=[self.file_upload.file_hex],
+            ),
+            {
+                "enable_expiry": "on",
+                "expiry_datetime": new_expiry.strftime(
+                    settings.DATETIME_INPUT_FORMATS[0]
+                ),
+            },
+        )
+        self.file_upload.refresh_from_db()
+
+        response = self.client.get(self.url)
+        self.assertContains(
+            response,
+            dateformat.format(
+                timezone.localtime(self.file_upload.expiry_datetime), "c"
+            ),
+        )
+
+    def test_cache_cleared_on_delete(self):
+        self.client.get(self.url)
+        self.file_upload.delete()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 404)
+
+    def test_cached_page_not_served_after_expiry(self):
+        self.client.get(self.url)
+        after_expiry = self.file_upload.expiry_datetime + datetime.timedelta(
+            seconds=1
+        )
+        with mock.patch(
+            "django.utils.timezone.now", return_value=after_expiry
+        ):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 404)
+
+    def test_cache_timeout_limited_by_expiry(self):
+        self.file_upload.expiry_datetime = timezone.now() + datetime.timedelta(
+            seconds=30
+        )
+        self.file_upload.save()
+        with mock.patch.object(cache, "set") as cache_set:
+            self.client.get(self.url)
+        key, _, timeout = cache_set.call_args.args
+        self.assertEqual(
+            key, FileUpload.landing_page_cache_key(self.file_upload.file_hex)
+        )
+        self.assertLessEqual(timeout, 30)
+
+    @override_settings(LANDING_PAGE_CACHE_TIMEOUT=0)
+    def test_cache_disabled(self):
+        self.client.get(self.url)
+        self.assertIsNone(
+            cache.get(
+                FileUpload.landing_page_cache_key(self.file_upload.file_hex)
+            )
+        )
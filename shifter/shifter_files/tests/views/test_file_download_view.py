@@ -1,4 +1,5 @@
 import datetime
+import hashlib
 import tempfile
 from shutil import rmtree
 
@@ -8,6 +9,7 @@ from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 from django.utils import timezone
+from django.utils.http import http_date
 
 from shifter_files.models import FileUpload
 
@@ -21,7 +23,9 @@ TEST_FILE_NAME = "mytestfile.txt"
 TEST_FILE_CONTENT = b"Hello, World!"
 
 
-@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+@override_settings(
+    MEDIA_ROOT=tempfile.mkdtemp(), DOWNLOAD_STATS_FLUSH_INTERVAL=0
+)
 class FileDownloadViewTest(TestCase):
     def setUp(self):
         User = get_user_model()
@@ -104,3 +108,263 @@ class FileDownloadViewTest(TestCase):
         url = reverse("shifter_files:file-download", args=["0" * 32])
         response = client.get(url)
         self.assertEqual(response.status_code, 404)
+
+
+@override_settings(
+    MEDIA_ROOT=tempfile.mkdtemp(), DOWNLOAD_STATS_FLUSH_INTERVAL=0
+)
+class FileDownloadRangeTest(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            TEST_USER_EMAIL, TEST_USER_PASSWORD
+        )
+        test_file = SimpleUploadedFile(TEST_FILE_NAME, TEST_FILE_CONTENT)
+        self.file_upload = FileUpload.objects.create(
+            owner=self.user,
+            file_content=test_file,
+            upload_datetime=timezone.now(),
+            expiry_datetime=timezone.now() + datetime.timedelta(weeks=1),
+            filename=TEST_FILE_NAME,
+            file_hash=hashlib.md5(TEST_FILE_CONTENT).hexdigest(),
+        )
+        self.url = reverse(
+            "shifter_files:file-download", args=[self.file_upload.file_hex]
+        )
+        self.etag = f'"{self.file_upload.file_hash}"'
+
+    def tearDown(self):
+        rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+
+    def test_full_download_headers(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertEqual(response["ETag"], self.etag)
+        self.assertEqual(
+            response["Last-Modified"],
+            http_date(self.file_upload.upload_datetime.timestamp()),
+        )
+        self.assertEqual(
+            b"".join(response.streaming_content), TEST_FILE_CONTENT
+        )
+
+    async def test_asgi_full_download(self):
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+        self.assertEqual(response["Content-Type"], "text/plain")
+        self.assertEqual(
+            response["Content-Length"], str(len(TEST_FILE_CONTENT))
+        )
+        self.assertEqual(
+            response["Content-Disposition"],
+            f'attachment; filename="{TEST_FILE_NAME}"',
+        )
+        self.assertEqual(response["ETag"], self.etag)
+        content = [chunk async for chunk in response.streaming_content]
+        self.assertEqual(b"".join(content), TEST_FILE_CONTENT)
+
+    async def test_asgi_range(self):
+        response = await self.async_client.get(
+            self.url, headers={"Range": "bytes=7-"}
+        )
+        self.assertEqual(response.status_code, 206)
+        self.assertTrue(response.is_async)
+        self.assertEqual(response["Content-Range"], "bytes 7-12/13")
+        content = [chunk async for chunk in response.streaming_content]
+        self.assertEqual(b"".join(content), b"World!")
+
+    async def test_asgi_expired_file(self):
+        self.file_upload.expiry_datetime = timezone.now()
+        await self.file_upload.asave()
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response.status_code, 404)
+
+    def test_etag_falls_back_to_file_hex(self):
+        self.file_upload.file_hash = None
+        self.file_upload.save()
+        response = self.client.get(self.url)
+        self.assertEqual(response["ETag"], f'"{self.file_upload.file_hex}"')
+
+    def test_single_range(self):
+        response = self.client.get(self.url, headers={"Range": "bytes=0-4"})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], "bytes 0-4/13")
+        self.assertEqual(response["Content-Length"], "5")
+        self.assertIn("attachment", response["Content-Disposition"])
+        self.assertEqual(b"".join(response.streaming_content), b"Hello")
+
+    def test_open_ended_range(self):
+        response = self.client.get(self.url, headers={"Range": "bytes=7-"})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], "bytes 7-12/13")
+        self.assertEqual(b"".join(response.streaming_content), b"World!")
+
+    def test_suffix_range(self):
+        response = self.client.get(self.url, headers={"Range": "bytes=-6"})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], "bytes 7-12/13")
+        self.assertEqual(b"".join(response.streaming_content), b"World!")
+
+    def test_multiple_ranges(self):
+        response = self.client.get(
+            self.url, headers={"Range": "bytes=0-4,7-11"}
+        )
+        self.assertEqual(response.status_code, 206)
+        content_type = response["Content-Type"]
+        self.assertTrue(
+            content_type.startswith("multipart/byteranges; boundary=")
+        )
+        boundary = content_type.split("boundary=")[1]
+        body = b"".join(response.streaming_content)
+        self.assertEqual(int(response["Content-Length"]), len(body))
+        self.assertEqual(
+            body,
+            (
+                f"--{boundary}\r\n"
+                "Content-Type: text/plain\r\n"
+                "Content-Range: bytes 0-4/13\r\n"
+                "\r\n"
+                "Hello\r\n"
+                f"--{boundary}\r\n"
+                "Content-Type: text/plain\r\n"
+                "Content-Range: bytes 7-11/13\r\n"
+                "\r\n"
+                "World\r\n"
+                f"--{boundary}--\r\n"
+            ).encode(),
+        )
+
+    def test_unsatisfiable_range(self):
+        response = self.client.get(self.url, headers={"Range": "bytes=50-"})
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], "bytes */13")
+
+    def test_invalid_range_ignored(self):
+        response = self.client.get(self.url, headers={"Range": "bytes=5-2"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            b"".join(response.streaming_content), TEST_FILE_CONTENT
+        )
+
+    def test_if_none_match(self):
+        response = self.client.get(
+            self.url, headers={"If-None-Match": self.etag}
+        )
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], self.etag)
+
+    def test_if_none_match_different_etag(self):
+        response = self.client.get(
+            self.url, headers={"If-None-Match": '"somethingelse"'}
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_if_range_matching_etag(self):
+        response = self.client.get(
+            self.url, headers={"Range": "bytes=0-4", "If-Range": self.etag}
+        )
+        self.assertEqual(response.status_code, 206)
+
+    def test_if_range_different_etag(self):
+        response = self.client.get(
+            self.url,
+            headers={"Range": "bytes=0-4", "If-Range": '"somethingelse"'},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            b"".join(response.streaming_content), TEST_FILE_CONTENT
+        )
+
+    def test_if_range_date(self):
+        last_modified = self.client.get(self.url)["Last-Modified"]
+        response = self.client.get(
+            self.url,
+            headers={"Range": "bytes=0-4", "If-Range": last_modified},
+        )
+        self.assertEqual(response.status_code, 206)
+
+        response = self.client.get(
+            self.url,
+            headers={
+                "Range": "bytes=0-4",
+                "If-Range": http_date(0),
+            },
+        )
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(
+    MEDIA_ROOT=tempfile.mkdtemp(), DOWNLOAD_STATS_FLUSH_INTERVAL=0
+)
+class FileDownloadBackendTest(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            TEST_USER_EMAIL, TEST_USER_PASSWORD
+        )
+        test_file = SimpleUploadedFile(TEST_FILE_NAME, TEST_FILE_CONTENT)
+        self.file_upload = FileUpload.objects.create(
+            owner=self.user,
+            file_content=test_file,
+            upload_datetime=timezone.now(),
+            expiry_datetime=timezone.now() + datetime.timedelta(weeks=1),
+            filename=TEST_FILE_NAME,
+        )
+        self.url = reverse(
+            "shifter_files:file-download", args=[self.file_upload.file_hex]
+        )
+
+    def tearDown(self):
+        rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+
+    @override_settings(
+        DOWNLOAD_BACKEND="x-accel-redirect",
+        X_ACCEL_REDIRECT_PREFIX="/protected-media/",
+    )
+    def test_x_accel_redirect(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response["X-Accel-Redirect"],
+            "/protected-media/" + self.file_upload.file_content.name,
+        )
+        self.assertEqual(response.content, b"")
+        self.assertEqual(response["Content-Type"], "text/plain")
+        self.assertEqual(
+            response["Content-Disposition"],
+            f'attachment; filename="{TEST_FILE_NAME}"',
+        )
+
+    @override_settings(DOWNLOAD_BACKEND="x-sendfile")
+    def test_x_sendfile(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response["X-Sendfile"], self.file_upload.file_content.path
+        )
+        self.assertEqual(response.content, b"")
+
+    @override_settings(DOWNLOAD_BACKEND="x-sendfile")
+    def test_proxy_backend_conditional_request(self):
+        response = self.client.get(
+            self.url,
+            headers={"If-None-Match": f'"{self.file_upload.file_hex}"'},
+        )
+        self.assertEqual(response.status_code, 304)
+        self.assertNotIn("X-Sendfile", response)
+
+    @override_settings(DOWNLOAD_BACKEND="x-accel-redirect")
+    def test_proxy_backend_expired_file(self):
+        self.file_upload.expiry_datetime = timezone.now()
+        self.file_upload.save()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn("X-Accel-Redirect", response)
+
+    def test_expired_file(self):
+        self.file_upload.expiry_datetime = timezone.now()
+        self.file_upload.save()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 404)
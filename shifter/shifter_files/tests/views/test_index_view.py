@@ -12,7 +12,7 @@ from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 from django.utils import timezone
 
-from shifter_files.models import FileUpload
+from shifter_files.models import FileUpload, sharded_name
 from shifter_site_settings.models import SiteSetting
 
 TEST_USER_EMAIL = "iama@test.com"
@@ -85,11 +85,7 @@ class IndexViewTest(TestCase):
         )
         # Ensure file has been uploaded to the correct location
         path = pathlib.Path(
-            settings.MEDIA_ROOT
-            + "/uploads/"
-            + TEST_FILE_NAME
-            + "_"
-            + file_upload.file_hex
+            settings.MEDIA_ROOT, sharded_name(file_upload.file_hex)
         )
         self.assertTrue(path.is_file())
 
@@ -0,0 +1,184 @@
+import io
+import os
+
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import (
+    FileUploadHandler,
+    SkipFile,
+    StopFutureHandlers,
+)
+
+from .models import (
+    FileUpload,
+    generate_hex_uuid,
+    sharded_name,
+    storage_left,
+)
+
+
+class StoredUploadedFile(UploadedFile):
+    """An uploaded file that has already been written to its final location
+    in storage, with its hash calculated as it was received."""
+
+    def __init__(
+        self,
+        file,
+        name,
+        content_type,
+        size,
+        charset,
+        storage,
+        storage_name,
+        file_hex,
+        file_hash,
+        content_type_extra=None,
+    ):
+        super().__init__(
+            file, name, content_type, size, charset, content_type_extra
+        )
+        self.storage = storage
+        self.storage_name = storage_name
+        self.file_hex = file_hex
+        self.file_hash = file_hash
+        # Set once a FileUpload uses the stored file
+        self.saved = False
+
+    def discard(self):
+        """Remove the stored file, e.g. when the upload fails validation."""
+        self.close()
+        self.storage.delete(self.storage_name)
+
+
+class OverQuotaUploadedFile(UploadedFile):
+    """Stands in for an upload which went over the user's storage quota while
+    it was received, so wasn't stored. Only its size is known."""
+
+    def __init__(self, name, content_type, size, charset):
+        super().__init__(io.BytesIO(), name, content_type, size, charset)
+
+
+class HashingFileUploadHandler(FileUploadHandler):
+    """Upload handler which streams the uploaded file straight to its final
+    location in storage, updating the file hash as each chunk is written.
+
+    This avoids spooling the upload to a temporary file, re-reading it to
+    calculate the hash and then copying it into storage. Storages that
+    expose a local filesystem path are written to directly, and storages
+    with a multipart_writer, such as S3, are sent the file a part at a time.
+    For any other storage the handler steps aside and the default handlers
+    are used instead.
+
+    Only the first file is stored, as the form only uses one. Any others
+    are skipped without being stored. Once a file goes over the user's
+    storage quota, what has been written is removed and the rest of it is
+    only counted, so the form can reject it.
+    """
+
+    upload_field_name = "file_content"
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.activated = False
+        self.destination = None
+        self.stored_file = None
+
+    def new_file(self, field_name, *args, **kwargs):
+        super().new_file(field_name, *args, **kwargs)
+        self.activated = False
+        if field_name != self.upload_field_name:
+            return
+        if self.stored_file is not None:
+            raise SkipFile()
+
+        field = FileUpload._meta.get_field("file_content")
+        self.storage = field.storage
+        self.file_hex = generate_hex_uuid()
+        self.storage_name = self.storage.get_available_name(
+            sharded_name(self.file_hex), max_length=field.max_length
+        )
+        try:
+            path = self.storage.path(self.storage_name)
+        except NotImplementedError:
+            multipart_writer = getattr(self.storage, "multipart_writer", None)
+            if multipart_writer is None:
+                return
+            self.local = False
+            self.destination = multipart_writer(self.storage_name)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.local = True
+            # Closed in file_complete or upload_interrupted
+            self.destination = open(path, "xb")  # noqa: SIM115
+        self.hasher = FileUpload.new_file_hasher()
+        self.bytes_written = 0
+        self.space_left = storage_left(self.request.user)
+        self.over_quota = False
+        self.activated = True
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        if not self.activated:
+            return raw_data
+        if (
+            not self.over_quota
+            and self.space_left is not None
+            and self.bytes_written + len(raw_data) > self.space_left
+        ):
+            self.remove_destination()
+            self.over_quota = True
+        if not self.over_quota:
+            self.destination.write(raw_data)
+            self.hasher.update(raw_data)
+        self.bytes_written += len(raw_data)
+
+    def file_complete(self, file_size):
+        if not self.activated:
+            return None
+        self.activated = False
+
+        if self.over_quota:
+            return OverQuotaUploadedFile(
+                name=self.file_name,
+                content_type=self.content_type,
+                size=self.bytes_written,
+                charset=self.charset,
+            )
+
+        self.destination.close()
+        if self.local and self.storage.file_permissions_mode is not None:
+            os.chmod(
+                self.destination.name, self.storage.file_permissions_mode
+            )
+
+        self.stored_file = StoredUploadedFile(
+            file=self.storage.open(self.storage_name, "rb"),
+            name=self.file_name,
+            content_type=self.content_type,
+            size=self.bytes_written,
+            charset=self.charset,
+            storage=self.storage,
+            storage_name=self.storage_name,
+            file_hex=self.file_hex,
+            file_hash=self.hasher.hexdigest(),
+            content_type_extra=self.content_type_extra,
+        )
+        return self.stored_file
+
+    def upload_interrupted(self):
+        if self.activated:
+            self.activated = False
+            if not self.over_quota:
+                self.remove_destination()
+
+    def remove_destination(self):
+        if self.local:
+            self.destination.close()
+            self.storage.delete(self.storage_name)
+        else:
+            self.destination.abort()
+
+    def discard_unsaved(self):
+        """Remove the stored file if no FileUpload uses it, such as when the
+        request is rejected after the body has been read."""
+        if self.stored_file is not None and not self.stored_file.saved:
+            self.stored_file.discard()
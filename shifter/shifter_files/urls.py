@@ -31,9 +31,55 @@ urlpatterns = [
         views.FileEditExpiryView.as_view(),
         name="file-edit-expiry",
     ),
+    path(
+        "collections/new",
+        views.FileCollectionCreateView.as_view(),
+        name="collection-create",
+    ),
+    path(
+        "collections/<str:collection_hex>",
+        views.FileCollectionDetailView.as_view(),
+        name="collection-details",
+    ),
+    path(
+        "collections/<str:collection_hex>/delete",
+        views.FileCollectionDeleteView.as_view(),
+        name="collection-delete",
+    ),
+    path(
+        "collection/<str:collection_hex>",
+        views.FileCollectionDownloadLandingView.as_view(),
+        name="collection-download-landing",
+    ),
+    path(
+        "c/<str:collection_hex>",
+        views.FileCollectionDownloadView.as_view(),
+        name="collection-download",
+    ),
+    path(
+        "api/uploads",
+        views.ChunkedUploadView.as_view(),
+        name="chunked-upload",
+    ),
+    path(
+        "api/uploads/<str:upload_id>",
+        views.ChunkedUploadPatchView.as_view(),
+        name="chunked-upload-patch",
+    ),
+    path(
+        "api/bundles",
+        views.BundleView.as_view(),
+        name="bundle",
+    ),
+    path(
+        "api/bundles/<str:bundle_hex>",
+        views.BundleCompleteView.as_view(),
+        name="bundle-complete",
+    ),
     path(
         "api/cleanup-files",
         views.CleanupExpiredFilesView.as_view(),
         name="cleanup-files",
     ),
+    path("metrics", views.MetricsView.as_view(), name="metrics"),
 ]
@@ -0,0 +1,37 @@
+"""
+Hashing of stored files for the verifyfiles command, to check they haven't
+changed since they were uploaded.
+
+Files are read at a limited rate, so that checking every file doesn't take
+disk bandwidth needed by downloads. Nothing here imports Django, as it runs
+in worker processes.
+"""
+
+import hashlib
+import time
+
+
+def hash_file(f, algorithm, read_size, max_rate=None):
+    """Return the hash of a file object's content, reading it at no more than
+    max_rate bytes per second if given."""
+    hasher = hashlib.new(algorithm)
+    start = time.monotonic()
+    num_read = 0
+    while chunk := f.read(read_size):
+        hasher.update(chunk)
+        num_read += len(chunk)
+        if max_rate:
+            # Wait until reading this much would have taken at max_rate
+            delay = num_read / max_rate - (time.monotonic() - start)
+            if delay > 0:
+                time.sleep(delay)
+    return hasher.hexdigest()
+
+
+def hash_path(path, algorithm, read_size, max_rate=None):
+    """Return the hash of a local file, or None if it doesn't exist."""
+    try:
+        with open(path, "rb") as f:
+            return hash_file(f, algorithm, read_size, max_rate)
+    except FileNotFoundError:
+        return None
@@ -1,34 +1,104 @@
+import math
+import time
 from typing import ClassVar
 
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
-from django.http import FileResponse, Http404, JsonResponse
-from django.shortcuts import get_object_or_404, redirect
+from django.core.cache import cache
+from django.db import connection
+from django.http import (
+    Http404,
+    HttpResponse,
+    HttpResponseBadRequest,
+    JsonResponse,
+)
+from django.shortcuts import aget_object_or_404, get_object_or_404, redirect
+from django.template.loader import render_to_string
+from django.template.response import TemplateResponse
 from django.urls import reverse, reverse_lazy
 from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
 from django.views.generic import DetailView, ListView
 from django.views.generic.base import View
-from django.views.generic.edit import DeleteView, FormView
+from django.views.generic.edit import CreateView, DeleteView, FormView
+from prometheus_client import CONTENT_TYPE_LATEST
 
 from shifter_site_settings.models import SiteSetting
 
-from .forms import FileExpiryEditForm, FileSearchForm, FileUploadForm
-from .models import FileUpload, generate_hex_uuid
-
-
+from .downloads import serve_collection, serve_file
+from .downloadstats import download_stats
+from .forms import (
+    BundleForm,
+    ChunkedUploadForm,
+    FileCollectionForm,
+    FileExpiryEditForm,
+    FileSearchForm,
+    FileUploadForm,
+)
+from .metrics import generate_metrics, observe_download, observe_upload
+from .models import (
+    BundleFile,
+    ChunkedUpload,
+    FileCollection,
+    FileUpload,
+    StorageQuotaExceeded,
+    generate_hex_uuid,
+)
+from .search import get_search_backend
+from .uploadhandlers import HashingFileUploadHandler, StoredUploadedFile
+
+
+# CSRF protection is applied inside dispatch, as the upload handlers must be
+# set before the CSRF middleware reads the request body.
+@method_decorator(csrf_exempt, name="dispatch")
 class FileUploadView(LoginRequiredMixin, FormView):
     template_name = "shifter_files/file_upload.html"
     form_class = FileUploadForm
 
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs["user"] = self.request.user
+        return kwargs
+
+    def dispatch(self, request, *args, **kwargs):
+        self.started = time.perf_counter()
+        upload_handler = None
+        if request.method == "POST" and request.user.is_authenticated:
+            upload_handler = HashingFileUploadHandler(request)
+            request.upload_handlers.insert(0, upload_handler)
+        try:
+            return csrf_protect(super().dispatch)(request, *args, **kwargs)
+        finally:
+            # The file is stored while the body is read, which happens
+            # before the CSRF check and form validation can reject it.
+            if upload_handler is not None:
+                upload_handler.discard_unsaved()
+
     def form_valid(self, form):
         owner = self.request.user
         file = form.cleaned_data["file_content"]
         filename = file.name
-        file_hex = generate_hex_uuid()
-        file._name = file.name + "_" + file_hex
-
-        # Calculate MD5 hash
-        file_hash = FileUpload.calculate_file_hash(file)
+        file_size = file.size
+        stored_file = None
+        if isinstance(file, StoredUploadedFile):
+            # Already written to storage and hashed by the upload handler
+            stored_file = file
+            file_hex = file.file_hex
+            file_hash = file.file_hash
+            file.close()
+            file = file.storage_name
+        else:
+            # Stored under a name made from the hex when the upload is saved
+            file_hex = generate_hex_uuid()
+
+            # Calculated by the processfiles worker if processing in
+            # the background
+            file_hash = None
+            if not settings.BACKGROUND_FILE_PROCESSING:
+                file_hash = FileUpload.calculate_file_hash(file)
 
         upload_datetime = timezone.now()
         expiry_datetime = form.cleaned_data["expiry_datetime"]
@@ -40,9 +110,14 @@ class FileUploadView(LoginRequiredMixin, FormView):
             filename=filename,
             file_hex=file_hex,
             file_hash=file_hash,
+            file_size=file_size,
         )
         file_upload.save()
+        if stored_file is not None:
+            stored_file.saved = True
+        file_upload.finish_upload()
         self.file_hex = file_upload.file_hex
+        observe_upload("form", time.perf_counter() - self.started, file_size)
 
         response = {"redirect_url": self.get_success_url()}
         return JsonResponse(response)
@@ -60,9 +135,205 @@ class FileUploadView(LoginRequiredMixin, FormView):
             "max_file_size"
         )
         context["setting_upload_timeout"] = settings.UPLOAD_TIMEOUT
+        context["setting_upload_chunk_size"] = settings.UPLOAD_CHUNK_SIZE
         return context
 
 
+class ChunkedUploadView(LoginRequiredMixin, FormView):
+    """Starts a chunked upload, following FilePond's chunk upload protocol.
+
+    The total size of the file is sent in the Upload-Length header along
+    with the usual form fields. The response contains the upload ID used to
+    send the chunks to ChunkedUploadPatchView.
+    """
+
+    http_method_names: ClassVar[list[str]] = ["post"]
+    form_class = ChunkedUploadForm
+
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        data = kwargs["data"].copy()
+        data["upload_length"] = self.request.headers.get("Upload-Length")
+        kwargs["data"] = data
+        kwargs["user"] = self.request.user
+        return kwargs
+
+    def form_valid(self, form):
+        chunked_upload = ChunkedUpload.objects.create(
+            owner=self.request.user,
+            upload_length=form.cleaned_data["upload_length"],
+            expiry_datetime=form.cleaned_data["expiry_datetime"],
+            bundle_hex=form.cleaned_data["bundle_hex"],
+        )
+        response = {"upload_id": chunked_upload.upload_id}
+        if not chunked_upload.bundle_hex:
+            response["redirect_url"] = reverse(
+                "shifter_files:file-details", args=[chunked_upload.upload_id]
+            )
+        return JsonResponse(response, status=201)
+
+    def form_invalid(self, form):
+        response = {"errors": form.errors}
+        return JsonResponse(response, status=400)
+
+
+class ChunkedUploadPatchView(LoginRequiredMixin, View):
+    """Receives the chunks of an upload started with ChunkedUploadView.
+
+    Each PATCH request appends its body at the offset given in the
+    Upload-Offset header. A HEAD request returns the number of bytes
+    received so far, so an interrupted upload can be resumed. The FileUpload
+    is created when the final chunk arrives.
+    """
+
+    http_method_names: ClassVar[list[str]] = ["head", "patch"]
+
+    def get_object(self):
+        return get_object_or_404(
+            ChunkedUpload,
+            owner=self.request.user,
+            upload_id=self.kwargs["upload_id"],
+        )
+
+    def head(self, request, *args, **kwargs):
+        chunked_upload = self.get_object()
+        return self.offset_response(chunked_upload)
+
+    def patch(self, request, *args, **kwargs):
+        chunked_upload = self.get_object()
+        try:
+            offset = int(request.headers["Upload-Offset"])
+            length = int(request.headers["Content-Length"])
+        except (KeyError, ValueError):
+            return HttpResponseBadRequest(
+                "Upload-Offset and Content-Length headers are required."
+            )
+
+        if offset < chunked_upload.offset <= offset + length:
+            # Some of this chunk has already been received, e.g. because the
+            # response to an earlier attempt was lost. Skip that part.
+            request.read(chunked_upload.offset - offset)
+            length -= chunked_upload.offset - offset
+            offset = chunked_upload.offset
+
+        if offset != chunked_upload.offset:
+            return self.offset_response(chunked_upload, status=409)
+        if offset + length > chunked_upload.upload_length:
+            return HttpResponseBadRequest(
+                "Chunk exceeds the declared Upload-Length."
+            )
+        if chunked_upload.is_complete():
+            return self.offset_response(chunked_upload, status=204)
+
+        if not chunked_upload.filename:
+            chunked_upload.filename = _decode_header(
+                request.headers.get("Upload-Name", "")
+            )
+            chunked_upload.save(update_fields=["filename"])
+
+        if not chunked_upload.write_chunk(request, length):
+            # Another request for this upload got there first
+            chunked_upload.refresh_from_db()
+            return self.offset_response(chunked_upload, status=409)
+
+        if not chunked_upload.is_complete():
+            return self.offset_response(chunked_upload, status=204)
+
+        try:
+            file_upload = chunked_upload.complete()
+        except StorageQuotaExceeded:
+            return HttpResponseBadRequest(
+                "You don't have enough storage left to upload this file."
+            )
+        observe_upload(
+            "chunked",
+            (timezone.now() - chunked_upload.created_datetime).total_seconds(),
+            chunked_upload.upload_length,
+        )
+        if chunked_upload.bundle_hex:
+            return self.offset_response(chunked_upload, status=204)
+        response = {
+            "redirect_url": reverse(
+                "shifter_files:file-details", args=[file_upload.file_hex]
+            )
+        }
+        return JsonResponse(response)
+
+    def offset_response(self, chunked_upload, status=200):
+        response = HttpResponse(status=status)
+        response["Upload-Offset"] = chunked_upload.offset
+        return response
+
+
+def _decode_header(value):
+    # Browsers send non-ASCII header values as UTF-8, which WSGI exposes as
+    # latin-1 decoded strings.
+    try:
+        return value.encode("latin-1").decode("utf-8")
+    except UnicodeError:
+        return value
+
+
+class BundleView(LoginRequiredMixin, View):
+    """Starts a bundle of files, returning the ID to upload each file with.
+
+    The files are uploaded in parallel using ChunkedUploadView, then the
+    bundle is completed with BundleCompleteView. Nothing is stored until the
+    files are uploaded.
+    """
+
+    http_method_names: ClassVar[list[str]] = ["post"]
+
+    def post(self, request, *args, **kwargs):
+        return JsonResponse({"bundle_hex": generate_hex_uuid()}, status=201)
+
+
+class BundleCompleteView(LoginRequiredMixin, FormView):
+    """Completes a bundle once all of its files have been uploaded. The files
+    are combined into a zip as the bundle is downloaded."""
+
+    http_method_names: ClassVar[list[str]] = ["post"]
+    form_class = BundleForm
+
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs["user"] = self.request.user
+        kwargs["bundle_files"] = list(
+            BundleFile.objects.filter(
+                owner=self.request.user,
+                bundle_hex=self.kwargs["bundle_hex"],
+                bundle__isnull=True,
+            )
+        )
+        return kwargs
+
+    def form_valid(self, form):
+        bundle_hex = self.kwargs["bundle_hex"]
+        if ChunkedUpload.objects.filter(
+            owner=self.request.user, bundle_hex=bundle_hex
+        ).exists():
+            form.add_error(None, "Some files have not finished uploading.")
+            return self.form_invalid(form)
+
+        bundle = FileUpload.create_bundle(
+            owner=self.request.user,
+            bundle_hex=bundle_hex,
+            filename=form.cleaned_data["name"] + ".zip",
+            expiry_datetime=form.cleaned_data["expiry_datetime"],
+            bundle_files=form.bundle_files,
+        )
+        response = {
+            "redirect_url": reverse(
+                "shifter_files:file-details", args=[bundle.file_hex]
+            )
+        }
+        return JsonResponse(response, status=201)
+
+    def form_invalid(self, form):
+        response = {"errors": form.errors}
+        return JsonResponse(response, status=400)
+
+
 class FileListView(LoginRequiredMixin, ListView):
     model = FileUpload
     ordering = "upload_datetime"
@@ -77,7 +348,7 @@ class FileListView(LoginRequiredMixin, ListView):
 
         query = self.request.GET.get("search")
         if query:
-            queryset = queryset.filter(filename__icontains=query)
+            queryset = get_search_backend().filter(queryset, query)
 
         return queryset
 
@@ -89,6 +360,9 @@ class FileListView(LoginRequiredMixin, ListView):
             .filter(owner=self.request.user)
             .count()
         )
+        context["collections"] = FileCollection.objects.filter(
+            owner=self.request.user
+        ).order_by("-created_datetime")
         return context
 
 
@@ -120,33 +394,71 @@ class FileDetailView(LoginRequiredMixin, DetailView):
 class FileDownloadView(View):
     http_method_names: ClassVar[list[str]] = ["get", "head", "options"]
 
-    def setup(self, request, *args, **kwargs):
-        self.obj = get_object_or_404(FileUpload, file_hex=kwargs["file_hex"])
-        return super().setup(request, args, kwargs)
+    async def get(self, request, *args, **kwargs):
+        started = time.perf_counter()
+        obj = await aget_object_or_404(FileUpload, file_hex=kwargs["file_hex"])
+        if obj.is_expired():
+            raise Http404
+        # Building the response may touch the database and storage, but the
+        # file itself is streamed without holding up a thread.
+        return await sync_to_async(self.serve)(request, obj, started)
 
-    def get(self, request, *args, **kwargs):
-        return FileResponse(
-            self.obj.file_content,
-            as_attachment=True,
-            filename=self.obj.filename,
-        )
+    def serve(self, request, obj, started):
+        response = serve_file(request, obj)
+        if request.method == "GET":
+            download_stats.record(obj, response)
+            observe_download(response, started)
+        return response
 
 
-class FileDownloadLandingView(DetailView):
-    model = FileUpload
+class FileDownloadLandingView(View):
+    http_method_names: ClassVar[list[str]] = ["get", "head", "options"]
     template_name = "shifter_files/file_download_landing.html"
+    content_template_name = "shifter_files/file_download_landing_content.html"
 
-    def get_object(self):
-        file_hex = self.kwargs["file_hex"]
-        obj = get_object_or_404(FileUpload, file_hex=file_hex)
-
-        # Only check expiry if expiry_datetime is set
+    async def get(self, request, *args, **kwargs):
+        # The file specific part of the page is cached, so popular links
+        # don't need a query or to be rendered again for each visitor.
+        page = await cache.aget(
+            FileUpload.landing_page_cache_key(kwargs["file_hex"])
+        )
+        if page is None:
+            page = await sync_to_async(self.render_page)(kwargs["file_hex"])
         if (
-            obj.expiry_datetime is not None
-            and obj.expiry_datetime <= timezone.now()
+            page["expiry_datetime"] is not None
+            and page["expiry_datetime"] <= timezone.now()
         ):
             raise Http404
-        return obj
+        return TemplateResponse(request, self.template_name, page)
+
+    def render_page(self, file_hex):
+        obj = get_object_or_404(
+            FileUpload.objects.select_related("processing_job"),
+            file_hex=file_hex,
+        )
+        page = {
+            "filename": obj.filename,
+            "expiry_datetime": obj.expiry_datetime,
+            "content": render_to_string(
+                self.content_template_name, {"object": obj}
+            ),
+        }
+
+        timeout = settings.LANDING_PAGE_CACHE_TIMEOUT
+        if obj.expiry_datetime is not None:
+            timeout = min(
+                timeout,
+                math.ceil(
+                    (obj.expiry_datetime - timezone.now()).total_seconds()
+                ),
+            )
+        # A row read inside a transaction may be rolled back, so only cache
+        # pages for rows which have been committed.
+        if timeout > 0 and not connection.in_atomic_block:
+            cache.set(
+                FileUpload.landing_page_cache_key(file_hex), page, timeout
+            )
+        return page
 
 
 class FileDeleteView(DeleteView):
@@ -219,6 +531,94 @@ class FileEditExpiryView(LoginRequiredMixin, FormView):
         )
 
 
+class FileCollectionCreateView(LoginRequiredMixin, CreateView):
+    model = FileCollection
+    form_class = FileCollectionForm
+
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs["user"] = self.request.user
+        return kwargs
+
+    def form_valid(self, form):
+        form.instance.owner = self.request.user
+        return super().form_valid(form)
+
+    def get_success_url(self):
+        return reverse(
+            "shifter_files:collection-details",
+            args=[self.object.collection_hex],
+        )
+
+
+class FileCollectionDetailView(LoginRequiredMixin, DetailView):
+    model = FileCollection
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data()
+        context["files"] = self.object.get_files()
+        context["full_download_url"] = settings.SHIFTER_URL + reverse(
+            "shifter_files:collection-download-landing",
+            args=[self.kwargs["collection_hex"]],
+        )
+        return context
+
+    def get_object(self):
+        obj = get_object_or_404(
+            FileCollection, collection_hex=self.kwargs["collection_hex"]
+        )
+        if obj.owner != self.request.user:
+            raise Http404
+        return obj
+
+
+class FileCollectionDeleteView(LoginRequiredMixin, View):
+    http_method_names: ClassVar[list[str]] = ["post"]
+
+    def post(self, request, *args, **kwargs):
+        obj = get_object_or_404(
+            FileCollection, collection_hex=self.kwargs["collection_hex"]
+        )
+        if obj.owner != request.user:
+            raise Http404
+        # Only the link is deleted, the files themselves are kept
+        obj.delete()
+        return redirect(reverse("shifter_files:myfiles"))
+
+
+class FileCollectionDownloadLandingView(DetailView):
+    model = FileCollection
+    template_name = "shifter_files/collection_download_landing.html"
+
+    def get_object(self):
+        obj = get_object_or_404(
+            FileCollection, collection_hex=self.kwargs["collection_hex"]
+        )
+        self.files = list(obj.get_files())
+        if not self.files:
+            raise Http404
+        return obj
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["files"] = self.files
+        return context
+
+
+class FileCollectionDownloadView(View):
+    http_method_names: ClassVar[list[str]] = ["get", "head", "options"]
+
+    def get(self, request, *args, **kwargs):
+        started = time.perf_counter()
+        collection = get_object_or_404(
+            FileCollection, collection_hex=kwargs["collection_hex"]
+        )
+        response = serve_collection(request, collection)
+        if request.method == "GET":
+            observe_download(response, started)
+        return response
+
+
 class CleanupExpiredFilesView(UserPassesTestMixin, View):
     http_method_names: ClassVar[list[str]] = ["post"]
 
@@ -230,3 +630,23 @@ class CleanupExpiredFilesView(UserPassesTestMixin, View):
         return JsonResponse(
             {"success": True, "num_files_deleted": num_files_deleted}
         )
+
+
+class MetricsView(View):
+    """Prometheus metrics, in the text exposition format."""
+
+    http_method_names: ClassVar[list[str]] = ["get"]
+
+    def get(self, request, *args, **kwargs):
+        if not settings.METRICS_ENABLED:
+            raise Http404
+        if settings.METRICS_TOKEN and not constant_time_compare(
+            request.headers.get("Authorization", ""),
+            f"Bearer {settings.METRICS_TOKEN}",
+        ):
+            response = HttpResponse(status=401)
+            response["WWW-Authenticate"] = "Bearer"
+            return response
+        return HttpResponse(
+            generate_metrics(), content_type=CONTENT_TYPE_LATEST
+        )
@@ -0,0 +1,289 @@
+import os
+import struct
+import zlib
+
+from django.utils import timezone
+
+BLOCK_SIZE = 64 * 1024
+
+# Every entry is written in ZIP64 format, so the layout of the archive only
+# depends on the names and sizes of the files.
+ZIP_VERSION = 45
+# Data descriptor follows the data, and names are UTF-8
+ZIP_FLAGS = 0x0008 | 0x0800
+ZIP_STORED = 0
+ZIP_MADE_BY_UNIX = 3 << 8
+ZIP_FILE_ATTRS = 0o100644 << 16
+
+LOCAL_HEADER_SIGNATURE = 0x04034B50
+DATA_DESCRIPTOR_SIGNATURE = 0x08074B50
+CENTRAL_HEADER_SIGNATURE = 0x02014B50
+ZIP64_END_SIGNATURE = 0x06064B50
+ZIP64_LOCATOR_SIGNATURE = 0x07064B50
+END_SIGNATURE = 0x06054B50
+
+DATA_DESCRIPTOR_SIZE = 24
+
+
+def unique_names(names):
+    """Return the names with a counter added to any repeated ones, so each
+    file keeps its own entry when extracted."""
+    seen = set()
+    unique = []
+    for name in names:
+        candidate = name
+        base, ext = os.path.splitext(name)
+        counter = 1
+        while candidate in seen:
+            candidate = f"{base} ({counter}){ext}"
+            counter += 1
+        seen.add(candidate)
+        unique.append(candidate)
+    return unique
+
+
+def dos_datetime(value):
+    """Return the DOS (time, date) fields for an aware datetime."""
+    value = timezone.localtime(value)
+    if value.year < 1980:
+        return 0, (1 << 5) | 1
+    return (
+        (value.hour << 11) | (value.minute << 5) | (value.second // 2),
+        ((value.year - 1980) << 9) | (value.month << 5) | value.day,
+    )
+
+
+class ZipMember:
+    """A file in storage to be added to a zip.
+
+    The CRC32 of the file is needed for the data descriptor and central
+    directory. If it isn't known it is calculated as the file is streamed,
+    or by reading the file if only part of it is sent, and passed to
+    save_crc32 so it doesn't need to be calculated again.
+    """
+
+    def __init__(
+        self, name, file_field, size, modified, crc32=None, save_crc32=None
+    ):
+        self.name = name
+        self.encoded_name = name.encode("utf-8")
+        self.file_field = file_field
+        self.size = size
+        self.modified = modified
+        self.crc32 = 0 if size == 0 else crc32
+        self.save_crc32 = save_crc32
+
+    def set_crc32(self, crc32):
+        self.crc32 = crc32
+        if self.save_crc32 is not None:
+            self.save_crc32(crc32)
+
+    def get_crc32(self):
+        if self.crc32 is None:
+            crc32 = 0
+            with self.file_field.storage.open(self.file_field.name, "rb") as f:
+                while data := f.read(BLOCK_SIZE):
+                    crc32 = zlib.crc32(data, crc32)
+            self.set_crc32(crc32)
+        return self.crc32
+
+    def read(self, start, end):
+        """Yield the bytes of the file from start up to, but not including,
+        end. The CRC32 is worked out along the way if the whole file is
+        read."""
+        whole_file = start == 0 and end == self.size
+        crc32 = 0
+        with self.file_field.storage.open(self.file_field.name, "rb") as f:
+            f.seek(start)
+            remaining = end - start
+            while remaining > 0:
+                data = f.read(min(BLOCK_SIZE, remaining))
+                if not data:
+                    raise OSError(f"{self.name} is shorter than expected")
+                remaining -= len(data)
+                if whole_file and self.crc32 is None:
+                    crc32 = zlib.crc32(data, crc32)
+                yield data
+        if whole_file and self.crc32 is None:
+            self.set_crc32(crc32)
+
+
+class ZipStream:
+    """A stored (uncompressed) ZIP64 archive of files in storage, generated
+    as it is sent.
+
+    Nothing in the archive depends on the file contents except the CRC32s,
+    which sit after each file's data. So the total size is known before
+    anything is read, and any byte range of the archive can be generated on
+    its own, allowing interrupted downloads to be resumed.
+    """
+
+    def __init__(self, members):
+        self.members = members
+        self.segments = self.layout()
+        self.size = sum(length for length, _ in self.segments)
+
+    def layout(self):
+        """Split the archive into (length, render) segments, where
+        render(start, end) yields that part of the segment."""
+        segments = []
+        offsets = []
+        offset = 0
+        for member in self.members:
+            offsets.append(offset)
+            header = self.local_header(member)
+            segments.append(constant_segment(header))
+            segments.append((member.size, member.read))
+            segments.append(
+                computed_segment(
+                    DATA_DESCRIPTOR_SIZE,
+                    lambda member=member: self.data_descriptor(member),
+                )
+            )
+            offset += len(header) + member.size + DATA_DESCRIPTOR_SIZE
+
+        central_offset = offset
+        for member, member_offset in zip(self.members, offsets, strict=True):
+            length = len(self.central_header(member, member_offset, 0))
+            segments.append(
+                computed_segment(
+                    length,
+                    lambda member=member, member_offset=member_offset: (
+                        self.central_header(
+                            member, member_offset, member.get_crc32()
+                        )
+                    ),
+                )
+            )
+            offset += length
+
+        segments.append(
+            constant_segment(
+                self.end_records(central_offset, offset - central_offset)
+            )
+        )
+        return segments
+
+    def local_header(self, member):
+        time, date = dos_datetime(member.modified)
+        # Sizes are given in the ZIP64 extra field, as the CRC32 and sizes
+        # are in the data descriptor following the data.
+        extra = struct.pack("<HHQQ", 0x0001, 16, 0, 0)
+        return (
+            struct.pack(
+                "<IHHHHHIIIHH",
+                LOCAL_HEADER_SIGNATURE,
+                ZIP_VERSION,
+                ZIP_FLAGS,
+                ZIP_STORED,
+                time,
+                date,
+                0,
+                0xFFFFFFFF,
+                0xFFFFFFFF,
+                len(member.encoded_name),
+                len(extra),
+            )
+            + member.encoded_name
+            + extra
+        )
+
+    def data_descriptor(self, member):
+        return struct.pack(
+            "<IIQQ",
+            DATA_DESCRIPTOR_SIGNATURE,
+            member.get_crc32(),
+            member.size,
+            member.size,
+        )
+
+    def central_header(self, member, member_offset, crc32):
+        time, date = dos_datetime(member.modified)
+        extra = struct.pack(
+            "<HHQQQ", 0x0001, 24, member.size, member.size, member_offset
+        )
+        return (
+            struct.pack(
+                "<IHHHHHHIIIHHHHHII",
+                CENTRAL_HEADER_SIGNATURE,
+                ZIP_MADE_BY_UNIX | ZIP_VERSION,
+                ZIP_VERSION,
+                ZIP_FLAGS,
+                ZIP_STORED,
+                time,
+                date,
+                crc32,
+                0xFFFFFFFF,
+                0xFFFFFFFF,
+                len(member.encoded_name),
+                len(extra),
+                0,
+                0,
+                0,
+                ZIP_FILE_ATTRS,
+                0xFFFFFFFF,
+            )
+            + member.encoded_name
+            + extra
+        )
+
+    def end_records(self, central_offset, central_size):
+        num_members = len(self.members)
+        zip64_end_offset = central_offset + central_size
+        return (
+            struct.pack(
+                "<IQHHIIQQQQ",
+                ZIP64_END_SIGNATURE,
+                44,
+                ZIP_MADE_BY_UNIX | ZIP_VERSION,
+                ZIP_VERSION,
+                0,
+                0,
+                num_members,
+                num_members,
+                central_size,
+                central_offset,
+            )
+            + struct.pack(
+                "<IIQI", ZIP64_LOCATOR_SIGNATURE, 0, zip64_end_offset, 1
+            )
+            + struct.pack(
+                "<IHHHHIIH",
+                END_SIGNATURE,
+                0,
+                0,
+                0xFFFF,
+                0xFFFF,
+                0xFFFFFFFF,
+                0xFFFFFFFF,
+                0,
+            )
+        )
+
+    def stream(self, start=0, end=None):
+        """Yield the bytes of the archive from start to end inclusive."""
+        if end is None:
+            end = self.size - 1
+        offset = 0
+        for length, render in self.segments:
+            segment_start = max(start - offset, 0)
+            segment_end = min(end + 1 - offset, length)
+            if segment_start < segment_end:
+                yield from render(segment_start, segment_end)
+            offset += length
+            if offset > end:
+                break
+
+
+def constant_segment(data):
+    def render(start, end):
+        yield data[start:end]
+
+    return len(data), render
+
+
+def computed_segment(length, build):
+    def render(start, end):
+        yield build()[start:end]
+
+    return length, render
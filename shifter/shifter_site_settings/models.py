@@ -1,5 +1,11 @@
+from django import forms
 from django.conf import settings
-from django.db import models
+from django.core.cache import cache
+from django.db import connection, models, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch.dispatcher import receiver
+
+SITE_SETTINGS_CACHE_KEY = "shifter_site_settings"
 
 
 class SiteSetting(models.Model):
@@ -11,15 +17,41 @@ class SiteSetting(models.Model):
 
     @classmethod
     def get_setting(cls, name: str):
-        try:
-            value = cls.objects.get(name=name).value
-        except cls.DoesNotExist:
-            # If the setting doesn't exist, return the default value
-            value = settings.SITE_SETTINGS[name]["default"]
+        return cls.get_settings()[name]
+
+    @classmethod
+    def get_settings(cls):
+        """Return all settings as a dict of parsed values.
+
+        The settings are loaded with a single query and cached until one of
+        them is changed, or SITE_SETTINGS_CACHE_TIMEOUT passes. The timeout
+        bounds how long other processes can serve stale values when the
+        cache backend is not shared between them.
+        """
+        values = cache.get(SITE_SETTINGS_CACHE_KEY)
+        if values is not None:
+            return values
 
-        # Convert boolean strings to actual booleans if needed
-        from django import forms
+        stored_values = dict(cls.objects.values_list("name", "value"))
+        values = {
+            name: cls.parse_value(
+                name, stored_values.get(name, setting_config["default"])
+            )
+            for name, setting_config in settings.SITE_SETTINGS.items()
+        }
 
+        # Values read inside a transaction may be rolled back, so only cache
+        # values which have been committed.
+        if not connection.in_atomic_block:
+            cache.set(
+                SITE_SETTINGS_CACHE_KEY,
+                values,
+                settings.SITE_SETTINGS_CACHE_TIMEOUT,
+            )
+        return values
+
+    @staticmethod
+    def parse_value(name, value):
         field_type = settings.SITE_SETTINGS[name].get(
             "field_type", forms.CharField
         )
@@ -31,3 +63,16 @@ class SiteSetting(models.Model):
             return str(value).lower() in ["true", "1"]
 
         return value
+
+    @staticmethod
+    def clear_cache():
+        cache.delete(SITE_SETTINGS_CACHE_KEY)
+
+
+@receiver(post_save, sender=SiteSetting)
+@receiver(post_delete, sender=SiteSetting)
+def clear_site_settings_cache(sender, **kwargs):
+    SiteSetting.clear_cache()
+    # Clear again once committed, in case the old values were cached by
+    # another request before then.
+    transaction.on_commit(SiteSetting.clear_cache)
@@ -4,9 +4,13 @@ from django import forms
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.management import call_command
-from django.test import Client, TestCase
+from django.db import connection
+from django.test import Client, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 
+from shifter_files.models import FileUpload
 from shifter_site_settings.forms import SiteSettingsForm
 from shifter_site_settings.models import SiteSetting
 
@@ -96,6 +100,7 @@ class SiteSettingsViewTest(TestCase):
                 "setting_max_file_size": new_max_file_size,
                 "setting_default_expiry_offset": "1",
                 "setting_max_expiry_offset": "2",
+                "setting_default_storage_quota": "0",
             },
         )
         self.assertEqual(response.status_code, 200)
@@ -134,6 +139,7 @@ class SiteSettingsViewTest(TestCase):
                 "setting_max_file_size": "5120MB",
                 "setting_default_expiry_offset": "336",
                 "setting_max_expiry_offset": setting_max_expiry_offset,
+                "setting_default_storage_quota": "0",
             },
         )
         self.assertEqual(response.status_code, 200)
@@ -160,6 +166,25 @@ class SiteSettingsSiteInformationTest(TestCase):
             TEST_USER_EMAIL, TEST_USER_PASSWORD, is_staff=True
         )
 
+    def test_download_totals(self):
+        for download_count, bytes_served in [(2, 1500), (3, 2500)]:
+            FileUpload.objects.create(
+                owner=self.super_user,
+                filename="mytestfile.txt",
+                upload_datetime=timezone.now(),
+                file_size=500,
+                download_count=download_count,
+                bytes_served=bytes_served,
+            )
+        client = Client()
+        client.login(email=TEST_USER_EMAIL, password=TEST_USER_PASSWORD)
+        response = client.get(reverse("shifter_site_settings:site-settings"))
+        self.assertEqual(response.context["num_downloads"], 5)
+        self.assertEqual(response.context["bytes_served"], 4000)
+        site_information = response.context["site_information_clipboard"]
+        self.assertIn("Downloads: 5", site_information)
+        self.assertIn("Data Served: 4KB", site_information)
+
 
 class SiteSettingFieldTypesTestCase(TestCase):
     """Test different field types and conversions for site settings."""
@@ -283,6 +308,7 @@ class SiteSettingFieldTypesTestCase(TestCase):
                 "setting_max_file_size": "5120MB",
                 "setting_default_expiry_offset": str(24 * 14),
                 "setting_max_expiry_offset": str(24 * 365 * 5),
+                "setting_default_storage_quota": "0",
                 "setting_allow_optional_expiry": "on",
             },
         )
@@ -313,6 +339,7 @@ class SiteSettingFieldTypesTestCase(TestCase):
                 "setting_max_file_size": "5120MB",
                 "setting_default_expiry_offset": str(24 * 14),
                 "setting_max_expiry_offset": str(24 * 365 * 5),
+                "setting_default_storage_quota": "0",
                 # setting_allow_optional_expiry omitted = unchecked
             },
         )
@@ -346,6 +373,7 @@ class SiteSettingFieldTypesTestCase(TestCase):
                 "setting_max_file_size": "10240MB",  # CharField
                 "setting_default_expiry_offset": "720",  # IntegerField
                 "setting_max_expiry_offset": "87600",  # IntegerField
+                "setting_default_storage_quota": "0",
                 "setting_allow_optional_expiry": "on",  # BooleanField
             },
         )
@@ -364,3 +392,82 @@ class SiteSettingFieldTypesTestCase(TestCase):
         self.assertEqual(
             SiteSetting.get_setting("allow_optional_expiry"), True
         )
+
+
+class SiteSettingCacheTest(TransactionTestCase):
+    def setUp(self):
+        SiteSetting.clear_cache()
+        call_command("createsettings", stdout=StringIO())
+
+    def tearDown(self):
+        SiteSetting.clear_cache()
+
+    def test_settings_loaded_in_one_query(self):
+        with self.assertNumQueries(1):
+            settings_values = SiteSetting.get_settings()
+        self.assertEqual(set(settings_values), set(settings.SITE_SETTINGS))
+
+    def test_cached_settings_need_no_queries(self):
+        SiteSetting.get_settings()
+        with self.assertNumQueries(0):
+            SiteSetting.get_setting("max_file_size")
+            SiteSetting.get_setting("default_expiry_offset")
+            SiteSetting.get_setting("max_expiry_offset")
+            self.assertIs(
+                SiteSetting.get_setting("allow_optional_expiry"), False
+            )
+
+    def test_cache_cleared_on_save(self):
+        self.assertEqual(SiteSetting.get_setting("max_file_size"), "5120MB")
+        setting = SiteSetting.objects.get(name="max_file_size")
+        setting.value = "10MB"
+        setting.save()
+        self.assertEqual(SiteSetting.get_setting("max_file_size"), "10MB")
+
+    def test_cache_cleared_on_delete(self):
+        setting = SiteSetting.objects.get(name="max_file_size")
+        setting.value = "10MB"
+        setting.save()
+        self.assertEqual(SiteSetting.get_setting("max_file_size"), "10MB")
+        setting.delete()
+        self.assertEqual(
+            SiteSetting.get_setting("max_file_size"),
+            settings.SITE_SETTINGS["max_file_size"]["default"],
+        )
+
+    def test_cache_cleared_by_site_settings_view(self):
+        User = get_user_model()
+        User.objects.create_superuser(TEST_USER_EMAIL, TEST_USER_PASSWORD)
+        client = Client()
+        client.login(email=TEST_USER_EMAIL, password=TEST_USER_PASSWORD)
+        self.assertIs(SiteSetting.get_setting("allow_optional_expiry"), False)
+
+        client.post(
+            reverse("shifter_site_settings:site-settings"),
+            {
+                "setting_max_file_size": "10MB",
+                "setting_default_expiry_offset": "1",
+                "setting_max_expiry_offset": "2",
+                "setting_default_storage_quota": "0",
+                "setting_allow_optional_expiry": "on",
+            },
+        )
+        self.assertEqual(SiteSetting.get_setting("max_file_size"), "10MB")
+        self.assertIs(SiteSetting.get_setting("allow_optional_expiry"), True)
+
+    def test_upload_page_makes_no_settings_queries(self):
+        User = get_user_model()
+        User.objects.create_user(TEST_USER_EMAIL, TEST_USER_PASSWORD)
+        client = Client()
+        client.login(email=TEST_USER_EMAIL, password=TEST_USER_PASSWORD)
+        client.get(reverse("shifter_files:index"))
+
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(reverse("shifter_files:index"))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(
+            any(
+                SiteSetting._meta.db_table in query["sql"]
+                for query in queries.captured_queries
+            )
+        )
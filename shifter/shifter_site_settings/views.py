@@ -1,10 +1,13 @@
 from django.conf import settings
 from django.contrib.auth.mixins import UserPassesTestMixin
+from django.db.models import Sum
+from django.db.models.functions import Coalesce
 from django.urls import reverse_lazy
 from django.utils import timesince
 from django.views.generic import FormView
 
 from shifter_files.models import FileUpload
+from shifter_files.templatetags.pretty_file_size import pretty_file_size
 
 from .forms import SiteSettingsForm
 from .models import SiteSetting
@@ -51,6 +54,11 @@ class SiteSettingsView(UserPassesTestMixin, FormView):
             FileUpload.get_non_expired_files().count()
         )
         context["num_expired_files"] = FileUpload.get_expired_files().count()
+        download_totals = FileUpload.objects.aggregate(
+            num_downloads=Coalesce(Sum("download_count"), 0),
+            bytes_served=Coalesce(Sum("bytes_served"), 0),
+        )
+        context.update(download_totals)
 
         site_information_lines = [
             "## Site Information",
@@ -64,6 +72,8 @@ class SiteSettingsView(UserPassesTestMixin, FormView):
             f"Startup Time: {context['startup_time']}",
             f"Active Files: {context['num_active_files']}",
             f"Expired Files Pending Cleanup: {context['num_expired_files']}",
+            f"Downloads: {context['num_downloads']}",
+            f"Data Served: {pretty_file_size(context['bytes_served'])}",
         ]
 
         context["site_information_clipboard"] = "\n".join(